@@ -0,0 +1,28 @@
+"""Add next_check_at to tasks for adaptive tracking refresh
+
+Revision ID: 5b7d2e41c9a3
+Revises: 026900a1f5aa
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7d2e41c9a3'
+down_revision: Union[str, None] = '026900a1f5aa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('next_check_at', sa.DateTime(), nullable=True))
+    op.create_index('idx_tasks_status_next_check', 'tasks', ['status', 'next_check_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_tasks_status_next_check', table_name='tasks')
+    op.drop_column('tasks', 'next_check_at')
@@ -0,0 +1,46 @@
+"""Add tracking_events for append-only trace storage
+
+Revision ID: 8c4f1a9d2e67
+Revises: 5b7d2e41c9a3
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4f1a9d2e67'
+down_revision: Union[str, None] = '5b7d2e41c9a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tracking_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('tracking_number', sa.String(length=100), nullable=False),
+        sa.Column('company_code', sa.String(length=50), nullable=False),
+        sa.Column('event_time', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('context', sa.Text(), nullable=True),
+        sa.Column('trace', sa.JSON(), nullable=True),
+        sa.Column('event_hash', sa.String(length=32), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('tracking_number', 'company_code', 'event_hash', name='uq_tracking_events_number_hash')
+    )
+    op.create_index(op.f('ix_tracking_events_id'), 'tracking_events', ['id'], unique=False)
+    op.create_index(op.f('ix_tracking_events_event_time'), 'tracking_events', ['event_time'], unique=False)
+    op.create_index('idx_tracking_events_number_time', 'tracking_events', ['tracking_number', 'event_time'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_tracking_events_number_time', table_name='tracking_events')
+    op.drop_index(op.f('ix_tracking_events_event_time'), table_name='tracking_events')
+    op.drop_index(op.f('ix_tracking_events_id'), table_name='tracking_events')
+    op.drop_table('tracking_events')
@@ -310,6 +310,46 @@ async def get_scheduled_tasks(
         raise HTTPException(status_code=500, detail=f"获取定时任务配置失败: {str(e)}")
 
 
+@router.get("/recognition-cache")
+async def get_recognition_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取二维码识别缓存命中率和各解码级别命中统计"""
+    from app.services.recognition_cache import recognition_cache
+    from app.services.qr_decode_pool import qr_decode_pool
+
+    return {
+        "success": True,
+        "message": "获取识别缓存统计成功",
+        "data": {
+            "cache": recognition_cache.get_stats(),
+            "decode_pool": qr_decode_pool.get_stats(),
+            "timestamp": datetime.now().isoformat()
+        }
+    }
+
+
+@router.get("/tracking-cache")
+async def get_tracking_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取物流查询缓存各级命中率、批量查询限速和请求合并状态"""
+    from app.services.tracking_cache import tracking_cache
+    from app.services.tracking_batch import batch_query_engine
+    from app.services.tracking_singleflight import tracking_singleflight
+
+    return {
+        "success": True,
+        "message": "获取物流缓存统计成功",
+        "data": {
+            "cache": tracking_cache.get_stats(),
+            "batch_engine": batch_query_engine.get_stats(),
+            "singleflight": tracking_singleflight.get_stats(),
+            "timestamp": datetime.now().isoformat()
+        }
+    }
+
+
 @router.get("/system-status")
 async def get_system_status(
     current_user: User = Depends(get_current_user)
@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
+import io
+import json
 import os
-import tempfile
+import time
 import uuid
 
-from app.core.database import get_db
+from app.core.database import get_db, SessionLocal
+from app.models.recognition import RecognitionStatusEnum
 from app.services.qr_recognition import QRRecognitionService
 from app.services.file import FileService
 from app.core.config import settings
@@ -43,27 +48,23 @@ async def recognize_qr_code(
     if file_extension not in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
         raise HTTPException(status_code=400, detail="不支持的图片格式")
     
-    temp_file_path = None
     saved_file_path = None
     
     try:
-        # 保存临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        # 上传内容直接在内存中解码，不再写临时文件
+        content = await file.read()
+        if len(content) > settings.MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail="文件大小超过限制")
         
-        # 如果需要保存文件，使用FileService保存
+        # 只有需要保存时才写盘，并放到线程中执行，避免阻塞事件循环
         if save_file:
             file_service = FileService(db)
-            # 重置文件指针
-            file.file.seek(0)
-            file_info = await file_service.save_file(file)
+            file_info = await asyncio.to_thread(file_service.save_bytes, content, file.filename)
             saved_file_path = file_info["file_path"]
         
-        # 进行识别
+        # 进行识别（CPU密集，放到线程中等待解码进程池）
         recognition_service = QRRecognitionService(db)
-        result = recognition_service.recognize_single_image(temp_file_path)
+        result = await asyncio.to_thread(recognition_service.recognize_bytes, content, file.filename)
         
         # 更新结果中的文件路径信息
         if saved_file_path:
@@ -107,16 +108,10 @@ async def recognize_qr_code(
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"识别过程中发生错误: {str(e)}")
-    
-    finally:
-        # 清理临时文件
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
 
 
 @router.post("/recognize-batch")
@@ -228,6 +223,137 @@ async def recognize_batch(
         raise HTTPException(status_code=500, detail=f"创建批量识别任务失败: {str(e)}")
 
 
+@router.post("/recognize-batch/stream")
+async def recognize_batch_stream(
+    files: List[UploadFile] = File(...),
+    response_format: str = Form(default="ndjson"),
+    task_name: Optional[str] = Form(default=None),
+    description: str = Form(default=""),
+    save_files: bool = Form(default=False),
+    db: Session = Depends(get_db)
+):
+    """
+    流式批量识别：并发解码，每完成一个文件立即返回一行结果
+    
+    Args:
+        files: 上传的图片文件列表
+        response_format: ndjson（每行一个JSON）或 sse（text/event-stream）
+        task_name: 提供时创建识别任务并逐条保存结果
+        description: 任务描述
+        save_files: 是否保存上传的文件
+        db: 数据库会话
+    
+    Returns:
+        依次输出 start、每个文件的 result（完成顺序，带 index）和 summary
+    """
+    if response_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="response_format 仅支持 ndjson 或 sse")
+    
+    if not files:
+        raise HTTPException(status_code=400, detail="请至少上传一个文件")
+    
+    if len(files) > 500:
+        raise HTTPException(status_code=400, detail="流式批量处理文件数量不能超过500个")
+    
+    for file in files:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail=f"文件 {file.filename} 不是图片格式")
+        if file.size and file.size > settings.MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail=f"文件 {file.filename} 大小超过限制")
+    
+    task_id = None
+    if task_name:
+        task = await asyncio.to_thread(
+            QRRecognitionService(db).create_recognition_task, task_name=task_name, description=description
+        )
+        task_id = task.id
+    
+    # 请求处理函数返回后表单中的上传文件即被关闭：接管解析表单时已写好的临时文件，
+    # 给 UploadFile 换上空占位对象，不再复制内容
+    uploads = []
+    for file in files:
+        spool = file.file
+        file.file = io.BytesIO()
+        spool.seek(0)
+        uploads.append((file.filename, spool))
+    
+    def encode(event: str, payload: dict) -> str:
+        data = json.dumps({"type": event, **payload}, ensure_ascii=False, default=str)
+        if response_format == "sse":
+            return f"event: {event}\ndata: {data}\n\n"
+        return data + "\n"
+    
+    async def event_stream():
+        # 依赖注入的会话在响应开始前已关闭，流式过程中使用独立会话
+        stream_db = SessionLocal()
+        start_time = time.time()
+        success_count = 0
+        error_count = 0
+        try:
+            recognition_service = QRRecognitionService(stream_db)
+            # 数据库读写在线程中依次执行，不阻塞事件循环（同一会话不会被并发使用）
+            if task_id:
+                await asyncio.to_thread(
+                    recognition_service.update_task_status, task_id, RecognitionStatusEnum.PROCESSING
+                )
+            
+            yield encode("start", {"task_id": task_id, "total": len(uploads)})
+            
+            save_file = FileService(stream_db).save_bytes if save_files else None
+            async for result in recognition_service.stream_recognize(uploads, task_id, save_file=save_file):
+                is_success = result["is_success"] == "true"
+                if is_success:
+                    success_count += 1
+                else:
+                    error_count += 1
+                
+                yield encode("result", {
+                    "index": result["index"],
+                    "filename": result["file_name"],
+                    "file_id": result["file_id"],
+                    "is_success": is_success,
+                    "tracking_numbers": result["tracking_numbers"],
+                    "qr_contents": result["qr_contents"],
+                    "raw_results": result["raw_results"],
+                    "confidence_score": result["confidence_score"],
+                    "processing_time": result["processing_time"],
+                    "metadata": result["extra_metadata"],
+                    "error_message": result.get("error_message"),
+                    "completed": success_count + error_count
+                })
+            
+            if task_id:
+                await asyncio.to_thread(
+                    recognition_service.update_task_status, task_id, RecognitionStatusEnum.COMPLETED
+                )
+            
+            yield encode("summary", {
+                "task_id": task_id,
+                "total": len(uploads),
+                "success_count": success_count,
+                "error_count": error_count,
+                "elapsed": round(time.time() - start_time, 3)
+            })
+        except Exception as e:
+            if task_id:
+                await asyncio.to_thread(
+                    QRRecognitionService(stream_db).update_task_status,
+                    task_id, RecognitionStatusEnum.FAILED, error_message=str(e)
+                )
+            yield encode("error", {"message": f"批量识别过程中发生错误: {str(e)}"})
+        finally:
+            for _, spool in uploads:
+                spool.close()
+            stream_db.close()
+    
+    media_type = "text/event-stream" if response_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/tasks/{task_id}")
 async def get_task_info(
     task_id: int,
@@ -10,6 +10,7 @@ from datetime import datetime
 
 from app.core.database import get_db
 from app.services.task import TaskService
+from app.services.tracking_events import TrackingEventService
 from app.core.config import settings
 from app.models.task import TaskStatusEnum
 from app.api.api_v1.endpoints.auth import get_admin_user
@@ -264,7 +265,7 @@ async def get_task_detail(
             "courier_company": task.courier_company,
             "delivery_status": task.delivery_status,
             "delivery_time": task.delivery_time.isoformat() if task.delivery_time else None,
-            "tracking_data": task.tracking_data,
+            "tracking_data": TrackingEventService(db).expand(task.tracking_data),
             "document_url": task.document_url,
             "screenshot_url": task.screenshot_url,
             "extra_metadata": task.extra_metadata,
@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Form
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
+import asyncio
 import os
 
 from app.core.database import get_db
 from app.services.tracking import TrackingService
 from app.services.express_tracking import ExpressTrackingService
 from app.services.tracking_screenshot import TrackingScreenshotService
+from app.services.tracking_subscription import TrackingSubscriptionService
+from app.services.pipeline_engine import pipeline_engine, PipelineStage
 from app.tasks.tracking_tasks import update_tracking_info
 
 
@@ -54,7 +57,7 @@ async def get_tracking_info(
                     "current_status": tracking_info.current_status,
                     "is_signed": tracking_info.is_signed == "true",
                     "last_update": tracking_info.last_update.isoformat() if tracking_info.last_update else None,
-                    "tracking_data": tracking_info.tracking_data,
+                    "tracking_data": tracking_service.get_tracking_data(tracking_info),
                     "notes": tracking_info.notes,
                     "delivery_receipt_id": tracking_info.delivery_receipt_id
                 }
@@ -70,10 +73,10 @@ async def get_tracking_info(
     try:
         # 推断快递公司编码
         if company_code == "ems":
-            company_code = express_service.get_company_code_by_number(tracking_number)
+            company_code = await express_service.aget_company_code_by_number(tracking_number)
         
         # 调用快递100 API
-        api_result = express_service.query_express(tracking_number, company_code)
+        api_result = await express_service.aquery_express(tracking_number, company_code)
         
         if not api_result["success"]:
             raise HTTPException(
@@ -145,13 +148,14 @@ async def capture_tracking_screenshot(
     tracking_number: str,
     company_code: str = Form(default="ems"),
     force_update: bool = Form(default=False),
+    screenshot_method: Optional[str] = Form(default=None),
     db: Session = Depends(get_db)
 ):
     """
     为任何快递单号生成物流轨迹截图
     - 优先使用数据库中的物流信息
     - 如无记录或需要强制更新，则调用快递100 API
-    - 支持Chrome截图和HTML备用方案
+    - 支持Chrome截图、Pillow绘制（screenshot_method=pillow）和HTML备用方案
     """
     try:
         tracking_service = TrackingService(db)
@@ -168,16 +172,16 @@ async def capture_tracking_screenshot(
             
             if not should_refresh:
                 # 使用数据库缓存数据
-                tracking_data = tracking_info.tracking_data
+                tracking_data = tracking_service.get_tracking_data(tracking_info)
                 if tracking_data:
                     tracking_data["source"] = "database_cache"
         
         # 2. 如果没有可用的缓存数据，调用API
         if not tracking_data:
             if company_code == "ems":
-                company_code = express_service.get_company_code_by_number(tracking_number)
+                company_code = await express_service.aget_company_code_by_number(tracking_number)
             
-            api_result = express_service.query_express(tracking_number, company_code)
+            api_result = await express_service.aquery_express(tracking_number, company_code)
             
             if not api_result["success"]:
                 raise HTTPException(
@@ -199,7 +203,7 @@ async def capture_tracking_screenshot(
                 )
         
         # 3. 生成截图
-        screenshot_result = screenshot_service.generate_screenshot_from_tracking_data(tracking_data)
+        screenshot_result = screenshot_service.generate_screenshot_from_tracking_data(tracking_data, screenshot_method)
         
         # 4. 处理返回结果
         response = {
@@ -231,6 +235,7 @@ async def capture_tracking_screenshot(
 async def smart_screenshot(
     tracking_number: str = Form(...),
     company_code: str = Form(default="ems"),
+    screenshot_method: Optional[str] = Form(default=None),
     db: Session = Depends(get_db)
 ):
     """
@@ -255,7 +260,7 @@ async def smart_screenshot(
             
             if not should_refresh:
                 # 不需要刷新（已签收或30分钟内）
-                tracking_data = tracking_info.tracking_data
+                tracking_data = tracking_service.get_tracking_data(tracking_info)
                 is_signed = tracking_info.is_signed == "true"
                 data_source = "已签收，使用永久缓存" if is_signed else "30分钟内，使用时效缓存"
             else:
@@ -268,9 +273,9 @@ async def smart_screenshot(
         # 3. 如果需要API查询
         if not tracking_data:
             if company_code == "ems":
-                company_code = express_service.get_company_code_by_number(tracking_number)
+                company_code = await express_service.aget_company_code_by_number(tracking_number)
             
-            api_result = express_service.query_express(tracking_number, company_code)
+            api_result = await express_service.aquery_express(tracking_number, company_code)
             
             if not api_result["success"]:
                 raise HTTPException(
@@ -291,7 +296,7 @@ async def smart_screenshot(
                 )
         
         # 4. 生成截图
-        screenshot_result = screenshot_service.generate_screenshot_from_tracking_data(tracking_data)
+        screenshot_result = screenshot_service.generate_screenshot_from_tracking_data(tracking_data, screenshot_method)
         
         # 5. 构造返回结果
         response = {
@@ -354,10 +359,10 @@ async def query_express_directly(
         
         # 推断快递公司编码
         if company_code == "ems":
-            company_code = express_service.get_company_code_by_number(tracking_number)
+            company_code = await express_service.aget_company_code_by_number(tracking_number)
         
         # 调用快递100 API
-        result = express_service.query_express(tracking_number, company_code)
+        result = await express_service.aquery_express(tracking_number, company_code)
         
         if result["success"]:
             return {
@@ -379,11 +384,12 @@ async def query_with_screenshot(
     tracking_number: str = Form(...),
     company_code: str = Form(default="ems"),
     force_screenshot: bool = Form(default=False),
+    screenshot_method: Optional[str] = Form(default=None),
     db: Session = Depends(get_db)
 ):
     """
     查询快递信息并生成轨迹截图（已签收时或强制生成）
-    - 支持Chrome截图和HTML备用方案
+    - 支持Chrome截图、Pillow绘制（screenshot_method=pillow）和HTML备用方案
     - 改进的错误处理和用户友好的返回信息
     """
     try:
@@ -392,10 +398,10 @@ async def query_with_screenshot(
         
         # 推断快递公司编码
         if company_code == "ems":
-            company_code = express_service.get_company_code_by_number(tracking_number)
+            company_code = await express_service.aget_company_code_by_number(tracking_number)
         
         # 查询快递信息
-        tracking_result = express_service.query_express(tracking_number, company_code)
+        tracking_result = await express_service.aquery_express(tracking_number, company_code)
         
         if not tracking_result["success"]:
             raise HTTPException(status_code=404, detail=tracking_result.get("error", "查询失败"))
@@ -423,7 +429,7 @@ async def query_with_screenshot(
         if should_screenshot:
             # 生成截图
             try:
-                screenshot_result = screenshot_service.generate_screenshot_from_tracking_data(tracking_result)
+                screenshot_result = screenshot_service.generate_screenshot_from_tracking_data(tracking_result, screenshot_method)
                 
                 # 处理截图结果
                 if screenshot_result["success"]:
@@ -506,7 +512,7 @@ async def batch_query_express(
         express_service = ExpressTrackingService(db)
         
         # 批量查询
-        results = express_service.batch_query_express(request.tracking_numbers, request.company_code)
+        results = await express_service.abatch_query_express(request.tracking_numbers, request.company_code)
         
         # 统计结果
         success_count = sum(1 for result in results if result["success"])
@@ -553,6 +559,32 @@ async def clear_express_cache(
         raise HTTPException(status_code=500, detail=f"清理缓存失败: {str(e)}")
 
 
+@router.post("/kuaidi100/callback")
+async def kuaidi100_push_callback(
+    param: str = Form(...),
+    sign: str = Form(default=""),
+    db: Session = Depends(get_db)
+):
+    """
+    快递100推送回调
+    校验签名后按推送结果更新任务物流状态，签收的任务进入文档生成阶段
+    """
+    subscription_service = TrackingSubscriptionService(db)
+    # 校验和数据库写入是同步操作，在线程中执行，不阻塞事件循环
+    result = await asyncio.to_thread(subscription_service.handle_callback, param, sign)
+    
+    if not result["success"]:
+        if result["error"] == "签名验证失败":
+            raise HTTPException(status_code=403, detail=result["error"])
+        # 数据错误时返回成功，避免快递100反复重推无法处理的数据
+        return {"result": True, "returnCode": "200", "message": result["error"]}
+    
+    for task_id in result["completed_task_ids"]:
+        await pipeline_engine.dispatch(PipelineStage.RENDER, task_id)
+    
+    return {"result": True, "returnCode": "200", "message": "成功"}
+
+
 @router.get("/{tracking_number}/screenshots")
 async def get_stored_screenshots(
     tracking_number: str,
@@ -689,10 +721,10 @@ async def test_tracking_query(
         
         # 推断快递公司编码
         if company_code == "ems":
-            company_code = express_service.get_company_code_by_number(tracking_number)
+            company_code = await express_service.aget_company_code_by_number(tracking_number)
         
         # 查询快递信息
-        result = express_service.query_express(tracking_number, company_code)
+        result = await express_service.aquery_express(tracking_number, company_code)
         
         return {
             "success": True,
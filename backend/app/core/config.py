@@ -44,9 +44,86 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     
+    # 任务流水线配置（各阶段并发数和阶段间队列容量）
+    PIPELINE_RECOGNITION_WORKERS: int = 4   # 二维码识别（CPU密集）
+    PIPELINE_TRACKING_WORKERS: int = 8      # 物流查询（网络IO）
+    PIPELINE_RENDER_WORKERS: int = 2        # 截图和文档生成（浏览器/子进程）
+    PIPELINE_QUEUE_SIZE: int = 100
+    # local: 进程内流水线；celery: 投递到 recognition/tracking/render 队列，由worker持久处理
+    PIPELINE_BACKEND: str = "local"
+
+    # 二维码解码进程池（0 表示按CPU核心数创建进程）
+    QR_DECODE_WORKERS: int = 0
+    QR_DECODE_CV_THREADS: int = 1           # 每个进程的OpenCV线程数，避免多进程超额占用CPU
+    # 解码级别顺序（按开销从低到高），结果匹配快递单号规则即停止
+    QR_DECODE_STAGES: str = "pyzbar_gray,opencv,pyzbar,warp,clahe,rotate"
+    QR_DECODE_LOCATE: bool = False          # 先定位候选区域再按原始分辨率解码（大尺寸手机照片）
+
+    # 识别结果缓存（按图片内容SHA-256去重，redis 时多worker共享）
+    RECOGNITION_CACHE_BACKEND: str = "memory"
+    RECOGNITION_CACHE_MAX_ITEMS: int = 1024
+    RECOGNITION_CACHE_TTL: int = 7 * 24 * 3600
+
     # 物流查询配置
     KUAIDI_API_KEY: str = ""
     KUAIDI_API_SECRET: str = ""
+    KUAIDI100_QUERY_URL: str = "https://poll.kuaidi100.com/poll/query.do"
+    KUAIDI100_TIMEOUT: float = 10.0
+    KUAIDI100_CONNECT_TIMEOUT: float = 5.0
+    KUAIDI100_MAX_CONNECTIONS: int = 20
+    KUAIDI100_HTTP2: bool = True            # 需安装 h2，未安装时自动使用 HTTP/1.1
+    # 批量查询限速（按快递100账号QPS配额设置）和自适应并发范围
+    KUAIDI100_QPS: float = 10.0
+    KUAIDI100_BURST: int = 10
+    TRACKING_BATCH_CONCURRENCY: int = 4
+    TRACKING_BATCH_MAX_CONCURRENCY: int = 16
+    TRACKING_RATE_LIMIT_COOLDOWN: float = 2.0   # 收到限流回复后暂停的秒数（按重试次数递增）
+    # 令牌桶保存在Redis中，所有API/Celery进程共用上面的QPS配额；
+    # Redis不可用时各进程改用进程内令牌桶，速率为 QPS / TRACKING_RATE_LIMIT_PROCESSES
+    TRACKING_RATE_LIMIT_BACKEND: str = "redis"
+    TRACKING_RATE_LIMIT_PROCESSES: int = 1
+    
+    # 物流查询缓存（进程内LRU -> Redis -> 可选磁盘目录），终态（签收/退签/拒签）与在途状态分别设置有效期
+    TRACKING_CACHE_BACKEND: str = "redis"
+    TRACKING_CACHE_MAX_ITEMS: int = 2048
+    TRACKING_CACHE_DISK_DIR: str = ""           # 为空时不启用磁盘缓存
+    TRACKING_CACHE_FINAL_TTL: int = 7 * 24 * 3600
+    TRACKING_CACHE_TRANSIT_TTL: int = 30 * 60
+    # 同一单号并发查询合并：跨worker的Redis锁租期（秒），到期后等待方自行请求
+    # （不短于 KUAIDI100_CONNECT_TIMEOUT + KUAIDI100_TIMEOUT，设置过小时按该值 + 1 秒）
+    TRACKING_SINGLEFLIGHT_LEASE: float = 16.0
+    
+    # 快递100推送订阅：启用后新单号订阅推送，回调地址需可从公网访问
+    # （对应 /api/v1/tracking/kuaidi100/callback），定时轮询仅作为兜底
+    KUAIDI100_PUSH_ENABLED: bool = False
+    KUAIDI100_SUBSCRIBE_URL: str = "https://poll.kuaidi100.com/poll"
+    KUAIDI100_CALLBACK_URL: str = ""
+    KUAIDI100_PUSH_SALT: str = ""               # 回调签名盐值：sign = MD5(param + salt) 大写
+    KUAIDI100_PUSH_FALLBACK_HOURS: int = 6      # 已订阅单号超过该时长未收到推送时恢复轮询
+    
+    # 快递公司识别：二维码域名、单号前缀/长度规则都无法确定时调用快递100智能单号识别
+    KUAIDI100_AUTONUMBER_URL: str = "https://www.kuaidi100.com/autonumber/auto"
+    CARRIER_AUTODETECT_ENABLED: bool = True
+    CARRIER_CACHE_TTL: int = 7 * 24 * 3600      # 单号识别结果缓存时长（秒）
+    CARRIER_DEFAULT_CODE: str = "ems"           # 无法识别时使用的快递公司编码
+    
+    # 物流刷新调度：按物流阶段计算每个任务的下次查询时间，定时任务每次最多处理的到期任务数
+    TRACKING_MIN_INTERVAL_MINUTES: int = 15
+    TRACKING_MAX_INTERVAL_MINUTES: int = 12 * 60
+    TRACKING_RETRY_INTERVAL_MINUTES: int = 30
+    TRACKING_DUE_BATCH_LIMIT: int = 500
+    TRACKING_SWEEP_CHUNK_SIZE: int = 50         # 定时更新按ID分段扫描，每段批量写入并单独提交
+    
+    # 物流截图方式：chrome 在浏览器中渲染HTML模板；pillow 直接绘制相同版式的图片（不启动浏览器）
+    TRACKING_SCREENSHOT_METHOD: str = "chrome"
+    # 截图结果缓存：轨迹未变化时复用已有截图，清理时按最近使用保留的截图数量（被引用的截图不删除）
+    SCREENSHOT_CACHE_MAX_ITEMS: int = 5000
+    # 物流截图浏览器池：复用已启动的无头Chrome，达到渲染次数或内存上限后重启
+    SCREENSHOT_BROWSER_POOL_SIZE: int = 2
+    SCREENSHOT_BROWSER_MAX_RENDERS: int = 100
+    SCREENSHOT_BROWSER_MAX_MEMORY_MB: int = 800
+    SCREENSHOT_BROWSER_ACQUIRE_TIMEOUT: float = 60.0
+    SCREENSHOT_BATCH_CHUNK_SIZE: int = 50       # 批量截图任务每个子任务处理的单号数
     
     # 微信相关配置
     WECHAT_APP_ID: str = ""
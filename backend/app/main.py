@@ -5,10 +5,15 @@ from contextlib import asynccontextmanager
 import os
 
 from app.core.config import settings
-from app.core.database import engine
+from app.core.database import engine, SessionLocal
 from app.models.base import Base
 from app.api.api_v1.api import api_router
 from app.api.api_v1.websocket import ws_router
+from app.services.pipeline_engine import pipeline_engine
+from app.services.qr_decode_pool import qr_decode_pool
+from app.services.browser_pool import browser_pool
+from app.services.kuaidi100_client import close_kuaidi100_clients
+from app.services.courier_patterns import seed_courier_patterns
 # 导入所有模型以确保表被创建
 from app.models import Task, User, DeliveryReceipt, Courier, TrackingInfo, RecognitionTask, RecognitionResult, CourierPattern
 
@@ -17,10 +22,22 @@ from app.models import Task, User, DeliveryReceipt, Courier, TrackingInfo, Recog
 async def lifespan(app: FastAPI):
     # 启动时创建数据库表
     Base.metadata.create_all(bind=engine)
+    # 初始化默认快递单号识别模式
+    db = SessionLocal()
+    try:
+        seed_courier_patterns(db)
+    finally:
+        db.close()
     # 确保上传目录存在
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    # 启动任务流水线各阶段worker
+    await pipeline_engine.start()
     yield
     # 关闭时清理资源
+    await pipeline_engine.shutdown()
+    qr_decode_pool.shutdown()
+    browser_pool.shutdown()
+    await close_kuaidi100_clients()
 
 
 app = FastAPI(
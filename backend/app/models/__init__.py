@@ -2,7 +2,7 @@ from .base import Base
 from .user import User
 from .delivery_receipt import DeliveryReceipt
 from .courier import Courier
-from .tracking import TrackingInfo
+from .tracking import TrackingInfo, TrackingEvent
 from .recognition import RecognitionTask, RecognitionResult, CourierPattern
 from .task import Task, TaskStatusEnum
 from .activity_log import ActivityLog
@@ -15,6 +15,7 @@ __all__ = [
     "DeliveryReceipt",
     "Courier",
     "TrackingInfo",
+    "TrackingEvent",
     "RecognitionTask",
     "RecognitionResult", 
     "CourierPattern",
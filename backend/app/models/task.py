@@ -44,6 +44,7 @@ class Task(BaseModel):
     tracking_data = Column(JSON)  # 物流跟踪数据
     delivery_status = Column(String(50))  # 配送状态
     delivery_time = Column(DateTime)  # 签收时间
+    next_check_at = Column(DateTime)  # 下一次物流查询时间（为空表示不再查询）
     
     # 生成的文档
     document_url = Column(String(500))    # 回证文档URL
@@ -74,6 +75,7 @@ class Task(BaseModel):
         Index('idx_tasks_created_at', 'created_at'),  # 创建时间索引
         Index('idx_tasks_user_status', 'user_id', 'status'),  # 用户和状态复合索引
         Index('idx_tasks_tracking_number', 'tracking_number'),  # 快递单号索引
+        Index('idx_tasks_status_next_check', 'status', 'next_check_at'),  # 物流刷新调度：按状态取到期任务
     )
     
     def __init__(self, **kwargs):
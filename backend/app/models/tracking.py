@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, DateTime, JSON, Index
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, DateTime, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
@@ -33,4 +33,25 @@ class TrackingInfo(BaseModel):
         Index('idx_tracking_info_updated_at', 'updated_at'),  # 更新时间索引
         Index('idx_tracking_info_created_at', 'created_at'),  # 创建时间索引
         Index('idx_tracking_info_signed_update', 'is_signed', 'last_update'),  # 签收状态和时间复合索引
-    )
\ No newline at end of file
+    )
+
+
+class TrackingEvent(BaseModel):
+    """物流轨迹事件（每条物流记录一行，只追加新事件）"""
+    __tablename__ = "tracking_events"
+    
+    tracking_number = Column(String(100), nullable=False)
+    company_code = Column(String(50), nullable=False, default="ems")
+    
+    # 事件内容
+    event_time = Column(DateTime, index=True)  # 物流记录时间
+    status = Column(String(50))                # 物流阶段（揽收、在途、派件、签收等）
+    context = Column(Text)                     # 物流描述
+    trace = Column(JSON)                       # 快递100返回的原始轨迹条目
+    event_hash = Column(String(32), nullable=False)  # MD5(时间|描述)，用于去重
+    
+    # 表级索引定义
+    __table_args__ = (
+        UniqueConstraint('tracking_number', 'company_code', 'event_hash', name='uq_tracking_events_number_hash'),
+        Index('idx_tracking_events_number_time', 'tracking_number', 'event_time'),  # 按单号读取轨迹
+    )
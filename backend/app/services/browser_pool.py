@@ -0,0 +1,272 @@
+"""
+无头Chrome浏览器池
+- 截图时从池中借出一个已启动的浏览器，用完归还，避免每次截图都启动/关闭Chrome（1~3秒）
+- Chrome和ChromeDriver的检测（版本探测、驱动下载）每个进程只执行一次，检测失败时间隔一段时间后再试
+- 归还时清理浏览器状态（关闭多余窗口、清除Cookie/缓存/本地存储、恢复窗口大小、回到空白页）
+- 浏览器渲染次数达到上限、内存占用超过上限、渲染过程中出错或健康检查失败时关闭并在需要时重新启动
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Chrome检测函数：返回 {"available": bool, "driver_path": str, "error": str}
+ChromeCheck = Callable[[], Dict[str, Any]]
+
+CHROME_ARGUMENTS = (
+    "--headless=new",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-logging",
+    "--disable-crash-reporter",
+)
+
+
+class BrowserUnavailableError(RuntimeError):
+    """Chrome不可用或在等待时间内借不到浏览器"""
+
+
+class _PooledBrowser:
+    """池中的一个浏览器实例及其使用情况"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.renders = 0
+        self.created_at = time.monotonic()
+
+
+class BrowserPool:
+    """无头Chrome浏览器池（进程内共享，线程安全）"""
+
+    def __init__(self, max_size: int = 2, max_renders: int = 100, max_memory_mb: int = 800,
+                 acquire_timeout: float = 60, window_size: str = "1280,1600", check_interval: float = 300):
+        self.max_size = max(1, max_size)
+        self.max_renders = max_renders
+        self.max_memory_mb = max_memory_mb
+        self.acquire_timeout = acquire_timeout
+        self.window_size = tuple(int(value) for value in window_size.split(","))
+        self.check_interval = check_interval
+        self._idle: Deque[_PooledBrowser] = deque()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        self._check_result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._psutil_warned = False
+        self._stats = {
+            "started": 0, "reused": 0, "renders": 0, "recycled_renders": 0,
+            "recycled_memory": 0, "recycled_error": 0, "unhealthy": 0, "start_failures": 0
+        }
+
+    @classmethod
+    def from_settings(cls) -> "BrowserPool":
+        """根据配置创建浏览器池"""
+        return cls(
+            max_size=settings.SCREENSHOT_BROWSER_POOL_SIZE,
+            max_renders=settings.SCREENSHOT_BROWSER_MAX_RENDERS,
+            max_memory_mb=settings.SCREENSHOT_BROWSER_MAX_MEMORY_MB,
+            acquire_timeout=settings.SCREENSHOT_BROWSER_ACQUIRE_TIMEOUT
+        )
+
+    # ------------------------------------------------------------------
+    # Chrome检测
+    # ------------------------------------------------------------------
+    def check_chrome(self, check: ChromeCheck) -> Dict[str, Any]:
+        """
+        返回Chrome检测结果（进程内缓存）
+
+        检测成功后一直复用；检测失败的结果缓存 check_interval 秒，期间不重复探测和下载驱动
+        """
+        with self._lock:
+            result = self._check_result
+            if result and (result.get("available") or time.monotonic() - self._checked_at < self.check_interval):
+                return result
+
+        try:
+            result = check()
+        except Exception as e:
+            result = {"available": False, "driver_path": None, "error": f"Chrome检测过程中发生错误: {e}"}
+
+        with self._lock:
+            self._check_result = result
+            self._checked_at = time.monotonic()
+        if result.get("available"):
+            logger.info(f"截图浏览器池使用ChromeDriver: {result.get('driver_path')}")
+        return result
+
+    # ------------------------------------------------------------------
+    # 借出 / 归还
+    # ------------------------------------------------------------------
+    @contextmanager
+    def browser(self, check: ChromeCheck, renders: int = 1) -> Iterator[Any]:
+        """
+        借出一个浏览器（with 语句结束时归还）
+
+        Args:
+            check: Chrome检测函数，仅在尚未检测或上次检测失败且已过重试间隔时调用
+            renders: 本次借出期间的渲染次数（批量截图在同一会话中连续渲染多张），计入回收阈值
+
+        Raises:
+            BrowserUnavailableError: Chrome不可用或等待超时
+        """
+        chrome_check = self.check_chrome(check)
+        if not chrome_check.get("available"):
+            raise BrowserUnavailableError(chrome_check.get("error") or "Chrome不可用")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise BrowserUnavailableError(f"等待截图浏览器超时（{self.acquire_timeout}秒）")
+
+        entry = None
+        try:
+            entry = self._checkout(chrome_check["driver_path"])
+            yield entry.driver
+        except BaseException:
+            # 渲染过程中出错时浏览器状态未知，直接关闭
+            if entry is not None:
+                self._retire(entry, "recycled_error")
+                entry = None
+            raise
+        finally:
+            if entry is not None:
+                self._checkin(entry, renders)
+            self._slots.release()
+
+    def _checkout(self, driver_path: str) -> _PooledBrowser:
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                return self._start(driver_path)
+            if self._healthy(entry):
+                self._count("reused")
+                return entry
+            self._retire(entry, "unhealthy")
+
+    def _checkin(self, entry: _PooledBrowser, renders: int = 1):
+        entry.renders += renders
+        self._count("renders", renders)
+        if self.max_renders and entry.renders >= self.max_renders:
+            self._retire(entry, "recycled_renders")
+            return
+        if self.max_memory_mb and self._memory_mb(entry) > self.max_memory_mb:
+            self._retire(entry, "recycled_memory")
+            return
+        try:
+            self._reset(entry.driver)
+        except Exception as e:
+            logger.warning(f"清理截图浏览器状态失败，关闭该浏览器: {e}")
+            self._retire(entry, "recycled_error")
+            return
+        with self._lock:
+            self._idle.append(entry)
+
+    # ------------------------------------------------------------------
+    # 浏览器生命周期
+    # ------------------------------------------------------------------
+    def _start(self, driver_path: str) -> _PooledBrowser:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        chrome_options = Options()
+        for argument in CHROME_ARGUMENTS:
+            chrome_options.add_argument(argument)
+        chrome_options.add_argument(f"--window-size={self.window_size[0]},{self.window_size[1]}")
+        try:
+            driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+        except Exception:
+            self._count("start_failures")
+            raise
+        self._count("started")
+        return _PooledBrowser(driver)
+
+    @staticmethod
+    def _healthy(entry: _PooledBrowser) -> bool:
+        """ChromeDriver进程存活且浏览器能执行脚本"""
+        try:
+            process = getattr(entry.driver.service, "process", None)
+            if process is not None and process.poll() is not None:
+                return False
+            return entry.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _reset(self, driver):
+        """清理上一次渲染留下的状态"""
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        try:
+            driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+        except Exception:
+            pass
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        driver.set_window_size(*self.window_size)
+        driver.get("about:blank")
+
+    def _memory_mb(self, entry: _PooledBrowser) -> float:
+        """ChromeDriver及其下所有Chrome进程的常驻内存（MB），无法获取时返回0"""
+        try:
+            import psutil
+        except ImportError:
+            if not self._psutil_warned:
+                self._psutil_warned = True
+                logger.warning("未安装psutil，截图浏览器不会按内存占用回收，仅按渲染次数回收")
+            return 0
+        try:
+            process = psutil.Process(entry.driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            total = 0
+            for item in processes:
+                try:
+                    total += item.memory_info().rss
+                except psutil.Error:
+                    continue
+            return total / (1024 * 1024)
+        except Exception:
+            return 0
+
+    def _retire(self, entry: _PooledBrowser, reason: str):
+        self._count(reason)
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            logger.debug(f"关闭截图浏览器失败: {e}")
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "max_size": self.max_size,
+                "idle": len(self._idle),
+                "chrome_available": bool(self._check_result and self._check_result.get("available"))
+            }
+
+    def shutdown(self):
+        """关闭所有空闲浏览器（借出中的浏览器归还后仍会被复用）"""
+        with self._lock:
+            entries = list(self._idle)
+            self._idle.clear()
+        for entry in entries:
+            try:
+                entry.driver.quit()
+            except Exception:
+                pass
+
+
+# 全局截图浏览器池（首次截图时启动浏览器）
+browser_pool = BrowserPool.from_settings()
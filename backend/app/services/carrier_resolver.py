@@ -0,0 +1,328 @@
+"""
+快递公司识别
+所有物流查询入口统一通过 carrier_resolver 确定快递100公司编码，按可靠程度依次尝试：
+1. 二维码链接的域名（如 mini.ems.com.cn -> ems）
+2. 任务/回证上记录的快递公司名称或编码（如 "中国邮政"、"EMS数字单号"、"sf"）
+3. 单号前缀/长度规则（前缀树，最长前缀优先；同一前缀下长度不符的规则不命中）
+4. 快递100智能单号识别接口
+都无法确定时使用 CARRIER_DEFAULT_CODE
+
+单号的识别结果按单号缓存在进程内（LRU + TTL），智能识别失败时只短时间缓存默认值，稍后重试
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 二维码链接域名 -> 快递100公司编码（按域名后缀匹配）
+HOST_CARRIERS = {
+    "ems.com.cn": "ems",
+    "11183.com.cn": "ems",
+    "chinapost.com.cn": "ems",
+    "sf-express.com": "shunfeng",
+    "zto.com": "zhongtong",
+    "yto.net.cn": "yuantong",
+    "sto.cn": "shentong",
+    "yundaex.com": "yunda",
+    "jdl.com": "jd",
+    "jtexpress.com.cn": "jtexpress",
+}
+
+# 快递公司名称/简写 -> 快递100公司编码；映射为 None 的名称不能说明快递公司（如识别模式中的通用数字单号）
+CARRIER_ALIASES: Dict[str, Optional[str]] = {
+    "ems": "ems",
+    "ems_number": "ems",
+    "ems中国邮政": "ems",
+    "ems数字单号": "ems",
+    "中国邮政": "ems",
+    "邮政": "ems",
+    "邮政ems": "ems",
+    "shunfeng": "shunfeng",
+    "sf": "shunfeng",
+    "顺丰": "shunfeng",
+    "顺丰速运": "shunfeng",
+    "zhongtong": "zhongtong",
+    "zt": "zhongtong",
+    "中通": "zhongtong",
+    "中通快递": "zhongtong",
+    "yuantong": "yuantong",
+    "yt": "yuantong",
+    "圆通": "yuantong",
+    "圆通速递": "yuantong",
+    "shentong": "shentong",
+    "sto": "shentong",
+    "申通": "shentong",
+    "申通快递": "shentong",
+    "yunda": "yunda",
+    "yd": "yunda",
+    "韵达": "yunda",
+    "韵达速递": "yunda",
+    "jd": "jd",
+    "京东": "jd",
+    "京东物流": "jd",
+    "jtexpress": "jtexpress",
+    "极兔": "jtexpress",
+    "极兔速递": "jtexpress",
+    "generic_number": None,
+    "通用数字单号": None,
+}
+
+# 单号前缀/长度规则：(前缀, 长度, 编码)，长度为 None 表示不限长度；前缀为空的规则只用于纯数字单号
+PREFIX_RULES: List[Tuple[str, Optional[int], str]] = [
+    ("SF", 14, "shunfeng"),
+    ("SF", 15, "shunfeng"),
+    ("YT", None, "yuantong"),
+    ("JT", 15, "jtexpress"),
+    ("JD", None, "jd"),
+    ("268", 15, "shentong"),
+    ("1", 13, "ems"),            # EMS国内数字单号（如 1151242358360）
+    ("", 12, "zhongtong"),
+    ("", 10, "yuantong"),
+]
+
+# 万国邮联 S10 格式：2个字母 + 9个数字 + 2个字母（如 EA123456789CN）
+S10_PATTERN = re.compile(r"^[A-Z]{2}\d{9}[A-Z]{2}$")
+
+
+@dataclass
+class _TrieNode:
+    children: Dict[str, "_TrieNode"]
+    rules: Dict[Optional[int], str]
+
+
+class CarrierTrie:
+    """单号前缀树：沿单号逐字符向下，取长度匹配的最深（最长前缀）规则"""
+
+    def __init__(self, rules: List[Tuple[str, Optional[int], str]] = PREFIX_RULES):
+        self.root = _TrieNode({}, {})
+        for prefix, length, code in rules:
+            self.add(prefix, length, code)
+
+    def add(self, prefix: str, length: Optional[int], code: str):
+        node = self.root
+        for char in prefix.upper():
+            node = node.children.setdefault(char, _TrieNode({}, {}))
+        node.rules[length] = code
+
+    def match(self, tracking_number: str) -> Optional[str]:
+        number = tracking_number.upper()
+        best = self._rule_for(self.root, len(number)) if number.isdigit() else None
+        node = self.root
+        for char in number:
+            node = node.children.get(char)
+            if node is None:
+                break
+            best = self._rule_for(node, len(number)) or best
+        return best
+
+    @staticmethod
+    def _rule_for(node: _TrieNode, length: int) -> Optional[str]:
+        return node.rules.get(length) or node.rules.get(None)
+
+
+def carrier_from_url(text: Optional[str]) -> Optional[str]:
+    """根据二维码链接的域名判断快递公司"""
+    if not text or not text.startswith(("http://", "https://")):
+        return None
+    host = (urlparse(text).hostname or "").lower()
+    for domain, code in HOST_CARRIERS.items():
+        if host == domain or host.endswith("." + domain):
+            return code
+    return None
+
+
+def carrier_from_name(name: Optional[str]) -> Optional[str]:
+    """根据快递公司名称或编码判断快递公司"""
+    if not name:
+        return None
+    key = name.strip().lower().replace(" ", "")
+    if key in CARRIER_ALIASES:
+        return CARRIER_ALIASES[key]
+    # 名称中包含已知公司名（如 "中国邮政速递物流"）
+    for alias, code in CARRIER_ALIASES.items():
+        if code and len(alias) >= 2 and not alias.isascii() and alias in key:
+            return code
+    return None
+
+
+class CarrierResolver:
+    """快递公司识别（进程内共享）"""
+
+    def __init__(self, max_items: int = 10000, failure_ttl: float = 600):
+        self.trie = CarrierTrie()
+        self.max_items = max_items
+        self.failure_ttl = failure_ttl
+        self._cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"url": 0, "name": 0, "rule": 0, "autonumber": 0, "default": 0, "cache_hits": 0}
+
+    def resolve(self, tracking_number: str, courier: Optional[str] = None, qr_content: Optional[str] = None,
+                client=None) -> str:
+        """
+        确定快递100公司编码
+
+        Args:
+            tracking_number: 快递单号
+            courier: 已记录的快递公司名称或编码（可为空）
+            qr_content: 二维码内容（可为空）
+            client: 快递100客户端（为空时使用默认授权的共享客户端）
+        """
+        number = (tracking_number or "").strip().upper()
+        code = self._resolve_locally(number, courier, qr_content)
+        if code or not number:
+            return code or settings.CARRIER_DEFAULT_CODE
+
+        cached = self._get_cached(number)
+        if cached:
+            return cached
+
+        candidates = []
+        if settings.CARRIER_AUTODETECT_ENABLED:
+            try:
+                candidates = (client or _default_client()).autonumber(number)
+            except Exception as e:
+                logger.warning(f"快递100智能单号识别失败 {number}: {e}")
+        return self._remember_autonumber(number, candidates)
+
+    async def aresolve(self, tracking_number: str, courier: Optional[str] = None, qr_content: Optional[str] = None,
+                       client=None) -> str:
+        """resolve 的异步版本（FastAPI异步接口使用，智能识别不阻塞事件循环）"""
+        number = (tracking_number or "").strip().upper()
+        code = self._resolve_locally(number, courier, qr_content)
+        if code or not number:
+            return code or settings.CARRIER_DEFAULT_CODE
+
+        cached = self._get_cached(number)
+        if cached:
+            return cached
+
+        candidates = []
+        if settings.CARRIER_AUTODETECT_ENABLED:
+            try:
+                candidates = await (client or _default_client()).aautonumber(number)
+            except Exception as e:
+                logger.warning(f"快递100智能单号识别失败 {number}: {e}")
+        return self._remember_autonumber(number, candidates)
+
+    async def aresolve_many(self, entries: Sequence[Tuple[str, Optional[str], Optional[str]]], client=None,
+                            limiter: Optional[Callable[[], Awaitable[None]]] = None) -> List[str]:
+        """
+        批量确定快递100公司编码（定时物流更新使用）
+
+        本地无法确定且未缓存的单号并发调用智能单号识别，同一单号只识别一次；
+        每次识别前先等待 limiter（通常为批量查询引擎的令牌桶，与物流查询共用快递100的请求配额）
+
+        Args:
+            entries: (单号, 快递公司名称或编码, 二维码内容) 列表
+            client: 快递100客户端
+            limiter: 每次智能识别前等待的异步函数
+
+        Returns:
+            与 entries 顺序一致的公司编码列表
+        """
+        codes: List[str] = []
+        unresolved: Dict[str, List[int]] = {}
+        for index, (tracking_number, courier, qr_content) in enumerate(entries):
+            number = (tracking_number or "").strip().upper()
+            code = self._resolve_locally(number, courier, qr_content)
+            if not code and number:
+                code = self._get_cached(number)
+                if not code:
+                    unresolved.setdefault(number, []).append(index)
+            codes.append(code or settings.CARRIER_DEFAULT_CODE)
+
+        async def detect(number: str) -> str:
+            if limiter is not None and settings.CARRIER_AUTODETECT_ENABLED:
+                await limiter()
+            return await self.aresolve(number, client=client)
+
+        if unresolved:
+            detected = await asyncio.gather(*(detect(number) for number in unresolved))
+            for indexes, code in zip(unresolved.values(), detected):
+                for index in indexes:
+                    codes[index] = code
+        return codes
+
+    def _resolve_locally(self, number: str, courier: Optional[str], qr_content: Optional[str]) -> Optional[str]:
+        """不访问网络的识别：二维码域名 -> 快递公司名称 -> 单号规则"""
+        for source, code in (
+            ("url", carrier_from_url(qr_content)),
+            ("name", carrier_from_name(courier)),
+            ("rule", self.match_number(number)),
+        ):
+            if code:
+                self._count(source)
+                return code
+        return None
+
+    def match_number(self, tracking_number: str) -> Optional[str]:
+        """按单号格式识别快递公司（无法确定时返回 None）"""
+        number = (tracking_number or "").strip().upper()
+        if not number:
+            return None
+        if S10_PATTERN.match(number):
+            return "ems"
+        return self.trie.match(number)
+
+    def _remember_autonumber(self, number: str, candidates: List[str]) -> str:
+        if candidates:
+            self._count("autonumber")
+            code = candidates[0].lower()
+            self._set_cached(number, code, settings.CARRIER_CACHE_TTL)
+            return code
+        # 识别失败时短时间缓存默认值，避免同一单号反复请求
+        self._count("default")
+        self._set_cached(number, settings.CARRIER_DEFAULT_CODE, self.failure_ttl)
+        return settings.CARRIER_DEFAULT_CODE
+
+    def _get_cached(self, number: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(number)
+            if entry is None:
+                return None
+            expires, code = entry
+            if expires <= time.monotonic():
+                del self._cache[number]
+                return None
+            self._cache.move_to_end(number)
+            self._stats["cache_hits"] += 1
+            return code
+
+    def _set_cached(self, number: str, code: str, ttl: float):
+        with self._lock:
+            self._cache[number] = (time.monotonic() + ttl, code)
+            self._cache.move_to_end(number)
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+
+    def _count(self, source: str):
+        with self._lock:
+            self._stats[source] += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "cached_numbers": len(self._cache)}
+
+
+def _default_client():
+    from app.services.express_tracking import ExpressTrackingService
+    from app.services.kuaidi100_client import get_kuaidi100_client
+
+    return get_kuaidi100_client(ExpressTrackingService.KUAIDI_KEY, ExpressTrackingService.KUAIDI_CUSTOMER)
+
+
+carrier_resolver = CarrierResolver()
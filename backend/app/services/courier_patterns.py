@@ -0,0 +1,209 @@
+"""
+快递单号识别模式注册表
+- 启动时写入默认模式（seed_courier_patterns），不再在每次构造识别服务时查询数量
+- 激活的模式按优先级编译为带命名分组的组合正则，一次匹配即可确定命中的模式
+  （含捕获分组/反向引用的模式合并后分组编号会改变，单独编译并保持优先级顺序）
+- 进程内缓存，TTL 到期或调用 invalidate()（版本号递增）后重新从数据库加载
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Pattern, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.recognition import CourierPattern
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_COURIER_PATTERNS = [
+    {
+        "courier_name": "EMS中国邮政",
+        "courier_code": "ems",
+        "pattern_regex": r"^[A-Z]{2}\d{9}[A-Z]{2}$",
+        "pattern_length": 13,
+        "pattern_prefix": "",
+        "description": "EMS单号格式：2个字母+9个数字+2个字母",
+        "examples": ["EA123456789CN", "CP123456789CN"]
+    },
+    {
+        "courier_name": "顺丰速运",
+        "courier_code": "shunfeng",
+        "pattern_regex": r"^SF\d{12}$",
+        "pattern_length": 14,
+        "pattern_prefix": "SF",
+        "description": "顺丰单号格式：SF+12位数字",
+        "examples": ["SF1234567890123"]
+    },
+    {
+        "courier_name": "中通快递",
+        "courier_code": "zhongtong",
+        "pattern_regex": r"^\d{12}$",
+        "pattern_length": 12,
+        "pattern_prefix": "",
+        "description": "中通单号格式：12位数字",
+        "examples": ["123456789012"]
+    },
+    {
+        "courier_name": "EMS数字单号",
+        "courier_code": "ems_number",
+        "pattern_regex": r"^\d{13}$",
+        "pattern_length": 13,
+        "pattern_prefix": "",
+        "description": "EMS数字单号：13位数字",
+        "examples": ["1151242358360"]
+    },
+    {
+        "courier_name": "通用数字单号",
+        "courier_code": "generic_number",
+        "pattern_regex": r"^\d{10,18}$",
+        "pattern_length": 0,
+        "pattern_prefix": "",
+        "description": "通用数字单号：10-18位数字",
+        "examples": ["1234567890", "123456789012345678"]
+    }
+]
+
+
+def seed_courier_patterns(db: Session) -> int:
+    """数据库中没有任何模式时写入默认模式，返回写入数量（应用启动时调用一次）"""
+    if db.query(CourierPattern.id).first() is not None:
+        return 0
+    for pattern_data in DEFAULT_COURIER_PATTERNS:
+        db.add(CourierPattern(**pattern_data))
+    db.commit()
+    courier_pattern_registry.invalidate()
+    logger.info(f"已初始化默认快递单号识别模式: {len(DEFAULT_COURIER_PATTERNS)} 条")
+    return len(DEFAULT_COURIER_PATTERNS)
+
+
+@dataclass(frozen=True)
+class CourierPatternEntry:
+    """已加载的识别模式"""
+    courier_name: str
+    courier_code: str
+    pattern_regex: str
+
+
+def _combine(indexed: Sequence[Tuple[int, CourierPatternEntry]]) -> List[Tuple[Pattern, List[int]]]:
+    """
+    把一段连续的无分组模式编译为组合正则
+
+    各模式作为命名分组按优先级依次排列，re.match 命中的第一个分支即优先级最高的模式；
+    无法合并时（如模式中间的内联标志）退化为逐个编译
+    """
+    try:
+        combined = re.compile("|".join(f"(?P<_p{index}>{entry.pattern_regex})" for index, entry in indexed))
+        return [(combined, [index for index, _ in indexed])]
+    except re.error:
+        return [(re.compile(entry.pattern_regex), [index]) for index, entry in indexed]
+
+
+class CompiledCourierPatterns:
+    """按优先级编译后的模式集合"""
+
+    def __init__(self, entries: Sequence[CourierPatternEntry]):
+        self.entries = list(entries)
+        # 按优先级排列的 (正则, 对应的模式下标)；组合正则对应多个下标
+        self._segments: List[Tuple[Pattern, List[int]]] = []
+
+        run: List[Tuple[int, CourierPatternEntry]] = []
+        for index, entry in enumerate(self.entries):
+            compiled = re.compile(entry.pattern_regex)
+            if compiled.groups == 0:
+                run.append((index, entry))
+                continue
+            # 含分组的模式（可能有编号反向引用）合并后编号会错位，单独匹配
+            if run:
+                self._segments.extend(_combine(run))
+                run = []
+            self._segments.append((compiled, [index]))
+        if run:
+            self._segments.extend(_combine(run))
+
+    @property
+    def regexes(self) -> List[str]:
+        return [entry.pattern_regex for entry in self.entries]
+
+    def match(self, text: str) -> Optional[CourierPatternEntry]:
+        """返回匹配文本的最高优先级模式"""
+        for compiled, indexes in self._segments:
+            m = compiled.match(text)
+            if m is None:
+                continue
+            if len(indexes) == 1:
+                return self.entries[indexes[0]]
+            for index in indexes:
+                if m.group(f"_p{index}") is not None:
+                    return self.entries[index]
+        return None
+
+
+class CourierPatternRegistry:
+    """快递单号识别模式注册表（进程内缓存）"""
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._version = 0
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+        self._patterns = CompiledCourierPatterns([])
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """模式变更后递增版本号，下次访问时重新加载"""
+        with self._lock:
+            self._version += 1
+
+    def get(self, db: Session) -> CompiledCourierPatterns:
+        """获取编译后的模式，过期或版本变化时从数据库重新加载"""
+        with self._lock:
+            fresh = (
+                self._loaded_version == self._version
+                and time.monotonic() - self._loaded_at < self.ttl
+            )
+            if fresh:
+                return self._patterns
+            version = self._version
+
+        rows = db.query(
+            CourierPattern.courier_name,
+            CourierPattern.courier_code,
+            CourierPattern.pattern_regex
+        ).filter(
+            CourierPattern.is_active == "true"
+        ).order_by(CourierPattern.priority.desc(), CourierPattern.id).all()
+
+        entries = []
+        for courier_name, courier_code, pattern_regex in rows:
+            if not pattern_regex:
+                continue
+            try:
+                re.compile(pattern_regex)
+            except re.error as e:
+                logger.warning(f"忽略无效的快递单号模式 {courier_code}: {pattern_regex} ({e})")
+                continue
+            entries.append(CourierPatternEntry(courier_name, courier_code, pattern_regex))
+        patterns = CompiledCourierPatterns(entries)
+
+        with self._lock:
+            self._patterns = patterns
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+        return patterns
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "version": self._version,
+            "loaded_version": self._loaded_version,
+            "pattern_count": len(self._patterns.entries),
+            "ttl": self.ttl
+        }
+
+
+# 全局快递单号模式注册表
+courier_pattern_registry = CourierPatternRegistry()
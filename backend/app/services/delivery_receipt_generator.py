@@ -11,6 +11,7 @@ from app.core.config import settings
 from app.models.delivery_receipt import DeliveryReceipt
 from app.models.tracking import TrackingInfo
 from app.services.delivery_receipt import DeliveryReceiptService
+from app.services.tracking_events import TrackingEventService
 
 
 class DeliveryReceiptGeneratorService:
@@ -257,7 +258,9 @@ class DeliveryReceiptGeneratorService:
                 
                 if tracking_info and tracking_info.tracking_data:
                     # 从物流数据中提取揽收时间（寄出时间）
-                    pickup_time = self._extract_pickup_time(tracking_info.tracking_data)
+                    pickup_time = self._extract_pickup_time(
+                        TrackingEventService(self.db).expand(tracking_info.tracking_data)
+                    )
                     if pickup_time:
                         send_time = self._format_timestamp_to_chinese(pickup_time)
                         receipt.send_time = send_time
@@ -1,14 +1,15 @@
+import asyncio
 import hashlib
-import json
-import os
-import time
-import requests
 from typing import Dict, List, Tuple, Optional
-from pathlib import Path
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.core.config import settings
+from app.services.carrier_resolver import carrier_resolver
+from app.services.kuaidi100_client import get_kuaidi100_client, Kuaidi100Error
+from app.services.tracking_batch import batch_query_engine, run_sync
+from app.services.tracking_cache import tracking_cache
+from app.services.tracking_singleflight import tracking_singleflight
+from app.tasks.retry_handler import retry_handler
 
 
 class ExpressTrackingService:
@@ -18,13 +19,14 @@ class ExpressTrackingService:
     KUAIDI_KEY = "GUpgAlsJ4403"
     KUAIDI_CUSTOMER = "5813A47FED91DD26A0EF340F2A194938"
     
-    # 缓存设置
-    CACHE_TTL = 30 * 60  # 30分钟缓存有效期
-    
     def __init__(self, db: Session):
         self.db = db
-        self.cache_dir = Path(settings.UPLOAD_DIR) / "express_cache"
-        self.cache_dir.mkdir(exist_ok=True)
+        # 分级缓存（进程内LRU -> Redis -> 可选磁盘），有效期按物流状态区分
+        self.cache = tracking_cache
+        # 同一单号的并发查询合并为一次上游请求（进程内 + Redis锁跨worker）
+        self.singleflight = tracking_singleflight
+        # 共享连接池的快递100客户端（同步/异步接口）
+        self.client = get_kuaidi100_client(self.KUAIDI_KEY, self.KUAIDI_CUSTOMER)
     
     def _md5(self, s: str) -> str:
         """生成MD5摘要"""
@@ -34,32 +36,6 @@ class ExpressTrackingService:
         """生成API签名"""
         return self._md5(param_str + self.KUAIDI_KEY + self.KUAIDI_CUSTOMER)
     
-    def _cache_path(self, tracking_number: str, company_code: str) -> Path:
-        """获取缓存文件路径"""
-        filename = f"{company_code}_{tracking_number}.json"
-        return self.cache_dir / filename
-    
-    def _load_cache(self, tracking_number: str, company_code: str) -> Optional[Dict]:
-        """加载缓存数据"""
-        cache_path = self._cache_path(tracking_number, company_code)
-        
-        if cache_path.exists() and time.time() - cache_path.stat().st_mtime < self.CACHE_TTL:
-            try:
-                with cache_path.open("r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                return None
-        return None
-    
-    def _save_cache(self, tracking_number: str, company_code: str, data: Dict) -> None:
-        """保存缓存数据"""
-        cache_path = self._cache_path(tracking_number, company_code)
-        try:
-            with cache_path.open("w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass  # 缓存失败不影响主要功能
-    
     def query_express(self, tracking_number: str, company_code: str = "ems") -> Dict:
         """
         查询快递物流信息
@@ -75,54 +51,147 @@ class ExpressTrackingService:
         
         try:
             # 1. 尝试读取缓存
-            cached_data = self._load_cache(tracking_number, company_code)
+            cached_data = self.cache.get(tracking_number, company_code)
             if cached_data:
                 return self._format_response(cached_data, tracking_number, company_code, from_cache=True)
             
-            # 2. 请求快递100 API
-            param = {
-                "com": company_code,
-                "num": tracking_number,
-                "phone": "",
-                "from": "",
-                "to": "",
-                "resultv2": "1",
-                "show": "0",
-                "order": "desc"
-            }
-            param_str = json.dumps(param, ensure_ascii=False)
-            payload = {
-                "customer": self.KUAIDI_CUSTOMER,
-                "param": param_str,
-                "sign": self._sign(param_str),
-            }
-            
-            url = "https://poll.kuaidi100.com/poll/query.do"
-            response = requests.post(url, data=payload, timeout=10)
-            response.raise_for_status()
+            # 2. 请求快递100 API（复用连接池，同一单号的并发请求合并）
+            return self.singleflight.do(
+                (tracking_number, company_code),
+                lambda: self._fetch_express(tracking_number, company_code),
+                lambda: self._load_cached(tracking_number, company_code)
+            )
             
-            api_result = response.json()
-            
-            # 3. 保存缓存
-            self._save_cache(tracking_number, company_code, api_result)
+        except Exception as e:
+            return self._error_response(e, tracking_number, company_code)
+    
+    async def aquery_express(self, tracking_number: str, company_code: str = "ems") -> Dict:
+        """
+        异步查询快递物流信息（供FastAPI异步接口使用，不阻塞事件循环）
+        
+        参数和返回值与 query_express 相同
+        """
+        company_code = company_code.strip().lower() or "ems"
+        
+        try:
+            # 缓存可能访问Redis，在线程中读取，不阻塞事件循环
+            cached_data = await asyncio.to_thread(self.cache.get, tracking_number, company_code)
+            if cached_data:
+                return self._format_response(cached_data, tracking_number, company_code, from_cache=True)
             
-            # 4. 格式化返回结果
-            return self._format_response(api_result, tracking_number, company_code, from_cache=False)
+            return await self._acoalesced_fetch(tracking_number, company_code)
             
-        except requests.RequestException as e:
-            return {
-                "success": False,
-                "error": f"网络请求失败: {str(e)}",
-                "tracking_number": tracking_number,
-                "company_code": company_code
-            }
         except Exception as e:
-            return {
-                "success": False,
-                "error": f"查询过程中发生错误: {str(e)}",
-                "tracking_number": tracking_number,
-                "company_code": company_code
-            }
+            return self._error_response(e, tracking_number, company_code)
+    
+    def _load_cached(self, tracking_number: str, company_code: str) -> Optional[Dict]:
+        """读取缓存（等待其他请求写入时轮询使用，不计入命中统计）"""
+        cached_data = self.cache.get(tracking_number, company_code, record_stats=False)
+        if cached_data:
+            return self._format_response(cached_data, tracking_number, company_code, from_cache=True)
+        return None
+    
+    def _fetch_express(self, tracking_number: str, company_code: str) -> Dict:
+        """请求快递100，成功结果写入缓存（合并请求的领头方调用）"""
+        try:
+            api_result = self.client.query(tracking_number, company_code)
+            return self._handle_api_result(api_result, tracking_number, company_code)
+        except Exception as e:
+            return self._error_response(e, tracking_number, company_code)
+    
+    async def _afetch_express(self, tracking_number: str, company_code: str) -> Dict:
+        """
+        _fetch_express 的异步版本
+        
+        确实要请求上游时才从批量查询引擎的令牌桶取令牌（缓存命中和合并的请求不占用快递100配额）
+        """
+        try:
+            await batch_query_engine.bucket.acquire()
+            api_result = await self.client.aquery(tracking_number, company_code)
+            return await asyncio.to_thread(self._handle_api_result, api_result, tracking_number, company_code)
+        except Exception as e:
+            return self._error_response(e, tracking_number, company_code)
+    
+    async def _acoalesced_fetch(self, tracking_number: str, company_code: str) -> Dict:
+        """合并同一单号的并发请求后查询快递100"""
+        return await self.singleflight.ado(
+            (tracking_number, company_code),
+            lambda: self._afetch_express(tracking_number, company_code),
+            lambda: self._load_cached(tracking_number, company_code)
+        )
+    
+    async def aquery_many(self, items: List[Tuple[str, str]]) -> List[Dict]:
+        """
+        批量查询 (单号, 快递公司编码) 列表
+        
+        先批量读取缓存，未命中的单号由批量查询引擎并发请求（同样参与请求合并，
+        成功结果由实际发出请求的一方写入缓存，供其他worker中等待的请求读取；
+        只有实际请求上游时才经令牌桶限速）
+        
+        Returns:
+            查询结果列表，顺序与输入一致
+        """
+        items = [(tracking_number, (company_code or "").strip().lower() or "ems")
+                 for tracking_number, company_code in items]
+        cached = await asyncio.to_thread(self.cache.get_many, items)
+        
+        results: List[Optional[Dict]] = [None] * len(items)
+        pending = []
+        for index, key in enumerate(items):
+            if key in cached:
+                results[index] = self._format_response(cached[key], key[0], key[1], from_cache=True)
+            else:
+                pending.append(index)
+        
+        if pending:
+            fetched = await batch_query_engine.run(self._acoalesced_fetch, [items[i] for i in pending])
+            for index, result in zip(pending, fetched):
+                results[index] = result
+        
+        return results
+    
+    def query_many(self, items: List[Tuple[str, str]]) -> List[Dict]:
+        """aquery_many 的同步版本（Celery任务使用）"""
+        return run_sync(self.aquery_many(items))
+    
+    async def aquery_tasks(self, entries: List[Tuple[str, Optional[str], Optional[str]]]) -> Tuple[List[str], List[Dict]]:
+        """
+        按 (单号, 快递公司名称或编码, 二维码内容) 确定快递公司后批量查询（定时物流更新使用）
+        
+        需要智能单号识别的单号与物流查询共用批量查询引擎的令牌桶限速
+        
+        Returns:
+            (公司编码列表, 查询结果列表)，顺序与输入一致
+        """
+        codes = await carrier_resolver.aresolve_many(entries, client=self.client,
+                                                     limiter=batch_query_engine.bucket.acquire)
+        results = await self.aquery_many([(entry[0], code) for entry, code in zip(entries, codes)])
+        return codes, results
+    
+    def query_tasks(self, entries: List[Tuple[str, Optional[str], Optional[str]]]) -> Tuple[List[str], List[Dict]]:
+        """aquery_tasks 的同步版本（Celery任务使用）"""
+        return run_sync(self.aquery_tasks(entries))
+    
+    def _handle_api_result(self, api_result: Dict, tracking_number: str, company_code: str) -> Dict:
+        """保存缓存并格式化API结果"""
+        result = self._format_response(api_result, tracking_number, company_code, from_cache=False)
+        # 查询失败的结果不缓存，下次重新请求
+        if result.get("success"):
+            self.cache.set(tracking_number, company_code, api_result)
+        return result
+    
+    def _error_response(self, error: Exception, tracking_number: str, company_code: str) -> Dict:
+        if isinstance(error, Kuaidi100Error):
+            message = f"网络请求失败: {str(error)}"
+        else:
+            message = f"查询过程中发生错误: {str(error)}"
+        return {
+            "success": False,
+            "error": message,
+            "error_category": retry_handler.classify_error(error).value,
+            "tracking_number": tracking_number,
+            "company_code": company_code
+        }
     
     def _format_response(self, api_result: Dict, tracking_number: str, company_code: str, from_cache: bool = False) -> Dict:
         """格式化API返回结果"""
@@ -168,6 +237,8 @@ class ExpressTrackingService:
                 return {
                     "success": False,
                     "error": message or "快递100查询失败",
+                    # 快递100在响应体中返回的限流提示同样按关键词归类
+                    "error_category": retry_handler.classify_error(Kuaidi100Error(message)).value,
                     "tracking_number": tracking_number,
                     "company_code": company_code,
                     "raw_data": api_result
@@ -184,63 +255,39 @@ class ExpressTrackingService:
     
     def batch_query_express(self, tracking_numbers: List[str], company_code: str = "ems") -> List[Dict]:
         """
-        批量查询快递物流信息
+        批量查询快递物流信息（令牌桶限速，并发查询）
         
         Args:
             tracking_numbers: 快递单号列表
             company_code: 快递公司编码
             
         Returns:
-            查询结果列表
+            查询结果列表，顺序与输入一致
         """
-        results = []
-        for tracking_number in tracking_numbers:
-            result = self.query_express(tracking_number, company_code)
-            results.append(result)
-        
-        return results
+        return self.query_many([(tracking_number, company_code) for tracking_number in tracking_numbers])
     
-    def get_company_code_by_number(self, tracking_number: str) -> str:
+    async def abatch_query_express(self, tracking_numbers: List[str], company_code: str = "ems") -> List[Dict]:
+        """批量查询的异步版本（供FastAPI异步接口使用）"""
+        return await self.aquery_many([(tracking_number, company_code) for tracking_number in tracking_numbers])
+    
+    def get_company_code_by_number(self, tracking_number: str, courier: str = None, qr_content: str = None) -> str:
         """
-        根据快递单号推断快递公司编码
+        推断快递公司编码（二维码域名、快递公司名称、单号规则，必要时调用快递100智能单号识别）
         
         Args:
             tracking_number: 快递单号
+            courier: 已知的快递公司名称或编码
+            qr_content: 二维码内容
             
         Returns:
             快递公司编码
         """
-        tracking_number = tracking_number.strip().upper()
-        
-        # EMS单号格式：2个字母+9个数字+2个字母 或 纯数字
-        if len(tracking_number) == 13 and tracking_number[:2].isalpha() and tracking_number[-2:].isalpha():
-            return "ems"
-        elif tracking_number.isdigit() and len(tracking_number) >= 10:
-            return "ems"
-        
-        # 顺丰速运：SF开头+12位数字
-        elif tracking_number.startswith("SF") and len(tracking_number) == 14:
-            return "shunfeng"
-        
-        # 中通快递：12位纯数字
-        elif tracking_number.isdigit() and len(tracking_number) == 12:
-            return "zhongtong"
-        
-        # 圆通速递：YT开头或10位数字
-        elif tracking_number.startswith("YT") or (tracking_number.isdigit() and len(tracking_number) == 10):
-            return "yuantong"
-        
-        # 申通快递：268开头+12位数字
-        elif tracking_number.startswith("268") and len(tracking_number) == 15:
-            return "shentong"
-        
-        # 韵达速递：13位数字
-        elif tracking_number.isdigit() and len(tracking_number) == 13:
-            return "yunda"
-        
-        # 默认返回EMS
-        else:
-            return "ems"
+        return carrier_resolver.resolve(tracking_number, courier, qr_content, client=self.client)
+    
+    async def aget_company_code_by_number(self, tracking_number: str, courier: str = None,
+                                          qr_content: str = None) -> str:
+        """get_company_code_by_number 的异步版本"""
+        return await carrier_resolver.aresolve(tracking_number, courier, qr_content, client=self.client)
     
     def clear_cache(self, tracking_number: str = None, company_code: str = None) -> Dict:
         """
@@ -254,23 +301,16 @@ class ExpressTrackingService:
             清理结果
         """
         try:
-            cleared_count = 0
-            
-            if tracking_number and company_code:
-                # 清理指定单号的缓存
-                cache_path = self._cache_path(tracking_number, company_code)
-                if cache_path.exists():
-                    cache_path.unlink()
-                    cleared_count = 1
+            if tracking_number:
+                # 清理指定单号的缓存（未指定快递公司时清理该单号所有公司的缓存）
+                cleared_count = self.cache.delete(tracking_number, company_code)
             else:
                 # 清理所有缓存
-                for cache_file in self.cache_dir.glob("*.json"):
-                    cache_file.unlink()
-                    cleared_count += 1
+                cleared_count = self.cache.clear()
             
             return {
                 "success": True,
-                "message": f"成功清理 {cleared_count} 个缓存文件",
+                "message": f"成功清理 {cleared_count} 条缓存",
                 "cleared_count": cleared_count
             }
             
@@ -13,8 +13,13 @@ class FileService:
 
     async def save_file(self, file: UploadFile) -> Dict[str, str]:
         """保存上传的文件"""
+        content = await file.read()
+        return self.save_bytes(content, file.filename)
+
+    def save_bytes(self, content: bytes, original_filename: str) -> Dict[str, str]:
+        """保存已读取到内存中的上传内容（阻塞IO，异步接口中应放到线程中执行）"""
         # 生成唯一文件名
-        file_extension = os.path.splitext(file.filename)[1]
+        file_extension = os.path.splitext(original_filename)[1]
         file_id = str(uuid.uuid4())
         filename = f"{file_id}{file_extension}"
         
@@ -23,8 +28,6 @@ class FileService:
         
         # 保存文件
         file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        content = await file.read()
-        
         with open(file_path, "wb") as f:
             f.write(content)
         
@@ -33,7 +36,7 @@ class FileService:
         
         return {
             "file_id": file_id,
-            "filename": file.filename,
+            "filename": original_filename,
             "file_path": file_path,
             "file_url": file_url,
             "size": len(content)
@@ -0,0 +1,242 @@
+"""
+快递100 实时查询客户端
+- 同步（httpx.Client）和异步（httpx.AsyncClient）两套接口共用请求构造、签名和超时配置
+- 连接池长期复用，避免每次查询重新建立 TCP/TLS 连接
+- 安装了 h2 时启用 HTTP/2
+- subscribe() 订阅快递100推送，回调由 tracking_subscription 处理
+- autonumber() 调用快递100智能单号识别，由 carrier_resolver 在本地规则无法确定快递公司时使用
+Celery 任务使用 query()，FastAPI 异步接口使用 aquery()；
+同步代码中的批量查询通过 tracking_batch.run_sync 在常驻后台事件循环中执行，异步连接池跨调用复用
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Kuaidi100Error(Exception):
+    """快递100请求失败（网络错误、超时或非2xx响应）"""
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class Kuaidi100Client:
+    """快递100查询客户端（进程内共享）"""
+
+    def __init__(self, key: str, customer: str, url: Optional[str] = None, subscribe_url: Optional[str] = None,
+                 timeout: Optional[float] = None, connect_timeout: Optional[float] = None,
+                 max_connections: Optional[int] = None, http2: Optional[bool] = None,
+                 autonumber_url: Optional[str] = None):
+        self.key = key
+        self.customer = customer
+        self.url = url or settings.KUAIDI100_QUERY_URL
+        self.subscribe_url = subscribe_url or settings.KUAIDI100_SUBSCRIBE_URL
+        self.autonumber_url = autonumber_url or settings.KUAIDI100_AUTONUMBER_URL
+        self.timeout = httpx.Timeout(
+            timeout or settings.KUAIDI100_TIMEOUT,
+            connect=connect_timeout or settings.KUAIDI100_CONNECT_TIMEOUT
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_connections or settings.KUAIDI100_MAX_CONNECTIONS,
+            max_keepalive_connections=max_connections or settings.KUAIDI100_MAX_CONNECTIONS,
+            keepalive_expiry=60
+        )
+        use_http2 = settings.KUAIDI100_HTTP2 if http2 is None else http2
+        self.http2 = use_http2 and http2_available()
+
+        self._client: Optional[httpx.Client] = None
+        # AsyncClient 绑定创建它的事件循环（Celery中每次 asyncio.run 都是新循环），按循环分别缓存
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 请求构造
+    # ------------------------------------------------------------------
+    def sign(self, param_str: str) -> str:
+        """生成API签名：MD5(param + key + customer) 大写"""
+        return hashlib.md5((param_str + self.key + self.customer).encode()).hexdigest().upper()
+
+    def build_payload(self, tracking_number: str, company_code: str, phone: str = "") -> Dict[str, str]:
+        param = {
+            "com": company_code,
+            "num": tracking_number,
+            "phone": phone,
+            "from": "",
+            "to": "",
+            "resultv2": "1",
+            "show": "0",
+            "order": "desc"
+        }
+        param_str = json.dumps(param, ensure_ascii=False)
+        return {
+            "customer": self.customer,
+            "param": param_str,
+            "sign": self.sign(param_str),
+        }
+
+    @staticmethod
+    def _parse_autonumber(result: Any) -> List[str]:
+        """智能单号识别返回按可能性排序的 [{"comCode": ..., ...}]，出错时返回带 message 的对象"""
+        if isinstance(result, dict):
+            raise Kuaidi100Error(result.get("message") or "智能单号识别失败")
+        return [item["comCode"] for item in result or [] if isinstance(item, dict) and item.get("comCode")]
+
+    @staticmethod
+    def _parse(response: httpx.Response) -> Dict[str, Any]:
+        try:
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            # 保留状态说明（如 "HTTP 429 Too Many Requests"），便于重试处理器按关键词归类
+            raise Kuaidi100Error(f"HTTP {e.response.status_code} {e.response.reason_phrase}".strip()) from e
+        except ValueError as e:
+            raise Kuaidi100Error(f"响应不是有效的JSON: {e}") from e
+
+    # ------------------------------------------------------------------
+    # 同步接口
+    # ------------------------------------------------------------------
+    def _get_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(timeout=self.timeout, limits=self.limits, http2=self.http2)
+            return self._client
+
+    def query(self, tracking_number: str, company_code: str, phone: str = "") -> Dict[str, Any]:
+        """同步查询，返回快递100原始结果"""
+        payload = self.build_payload(tracking_number, company_code, phone)
+        try:
+            response = self._get_client().post(self.url, data=payload)
+        except httpx.HTTPError as e:
+            raise Kuaidi100Error(str(e) or e.__class__.__name__) from e
+        return self._parse(response)
+
+    def autonumber(self, tracking_number: str) -> List[str]:
+        """智能单号识别，返回可能的快递公司编码（按可能性排序）"""
+        try:
+            response = self._get_client().get(self.autonumber_url, params={"num": tracking_number, "key": self.key})
+        except httpx.HTTPError as e:
+            raise Kuaidi100Error(str(e) or e.__class__.__name__) from e
+        return self._parse_autonumber(self._parse(response))
+
+    def subscribe(self, tracking_number: str, company_code: str, callback_url: str,
+                  salt: str = "", phone: str = "") -> Dict[str, Any]:
+        """
+        订阅快递100推送（poll 接口），物流有更新时快递100回调 callback_url
+
+        Returns:
+            快递100原始响应；returnCode 501 表示重复订阅，同样视为成功
+        """
+        parameters = {"callbackurl": callback_url, "resultv2": "1"}
+        if salt:
+            parameters["salt"] = salt
+        if phone:
+            parameters["phone"] = phone
+        param = {
+            "company": company_code,
+            "number": tracking_number,
+            "key": self.key,
+            "parameters": parameters
+        }
+        payload = {"schema": "json", "param": json.dumps(param, ensure_ascii=False)}
+        try:
+            response = self._get_client().post(self.subscribe_url, data=payload)
+        except httpx.HTTPError as e:
+            raise Kuaidi100Error(str(e) or e.__class__.__name__) from e
+        return self._parse(response)
+
+    # ------------------------------------------------------------------
+    # 异步接口
+    # ------------------------------------------------------------------
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2)
+            self._async_clients[loop] = client
+        return client
+
+    async def aquery(self, tracking_number: str, company_code: str, phone: str = "") -> Dict[str, Any]:
+        """异步查询，返回快递100原始结果"""
+        payload = self.build_payload(tracking_number, company_code, phone)
+        try:
+            response = await self._get_async_client().post(self.url, data=payload)
+        except httpx.HTTPError as e:
+            raise Kuaidi100Error(str(e) or e.__class__.__name__) from e
+        return self._parse(response)
+
+    async def aautonumber(self, tracking_number: str) -> List[str]:
+        """异步智能单号识别"""
+        try:
+            response = await self._get_async_client().get(
+                self.autonumber_url, params={"num": tracking_number, "key": self.key}
+            )
+        except httpx.HTTPError as e:
+            raise Kuaidi100Error(str(e) or e.__class__.__name__) from e
+        return self._parse_autonumber(self._parse(response))
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self):
+        """关闭当前事件循环的异步连接池和同步连接池"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        client = self._async_clients.pop(loop, None) if loop else None
+        if client is not None:
+            await client.aclose()
+        self.close()
+
+
+_clients: Dict[tuple, Kuaidi100Client] = {}
+_clients_lock = threading.Lock()
+
+
+def get_kuaidi100_client(key: str, customer: str) -> Kuaidi100Client:
+    """按授权信息获取共享客户端"""
+    with _clients_lock:
+        client = _clients.get((key, customer))
+        if client is None:
+            client = Kuaidi100Client(key, customer)
+            _clients[(key, customer)] = client
+        return client
+
+
+async def aclose_loop_clients():
+    """关闭所有共享客户端在当前事件循环上的异步连接池（临时事件循环结束前调用，如 asyncio.run）"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = list(_clients.values())
+    for client in clients:
+        async_client = client._async_clients.pop(loop, None)
+        if async_client is not None:
+            await async_client.aclose()
+
+
+async def close_kuaidi100_clients():
+    """应用关闭时释放所有连接池"""
+    with _clients_lock:
+        clients = list(_clients.values())
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,329 @@
+"""
+任务处理流水线引擎
+上传→识别→物流查询→文档生成 按阶段执行：
+- 每个阶段拥有独立的线程池（识别/物流/渲染互不抢占）
+- 阶段之间通过有界队列衔接，队列满时提交方等待（背压）
+- 每个阶段的并发数由 Settings 中的 PIPELINE_*_WORKERS 控制
+
+PIPELINE_BACKEND=celery 时阶段间交接改为投递Celery任务（recognition/tracking/render 队列），
+任务在独立worker中执行，API进程重启不会丢失处理中的任务。
+
+本地模式下其他进程（如Celery定时检查卡住的任务）通过 request_restart() 把任务写入Redis重启队列，
+API进程中的引擎取出后提交到本地队列执行。
+"""
+
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStage(Enum):
+    """流水线阶段"""
+    RECOGNITION = "recognition"   # 二维码识别（CPU密集）
+    TRACKING = "tracking"         # 物流查询（网络IO）
+    RENDER = "render"             # 截图、标签和回证生成（浏览器/子进程）
+
+
+# 各阶段对应的 TaskService 处理方法
+STAGE_HANDLERS = {
+    PipelineStage.RECOGNITION: "_trigger_qr_recognition",
+    PipelineStage.TRACKING: "_trigger_tracking",
+    PipelineStage.RENDER: "_trigger_document_generation",
+}
+
+# Celery模式下各阶段对应的任务名（队列路由见 beat_schedules.TASK_ROUTES）
+CELERY_STAGE_TASKS = {
+    PipelineStage.RECOGNITION: "app.tasks.pipeline_tasks.recognize_task",
+    PipelineStage.TRACKING: "app.tasks.pipeline_tasks.track_task",
+    PipelineStage.RENDER: "app.tasks.pipeline_tasks.render_task",
+}
+
+
+# 本地模式的跨进程重启队列（Redis列表），及API进程阻塞读取的超时秒数
+RESTART_QUEUE_KEY = "pipeline:restart"
+RESTART_POLL_TIMEOUT = 5
+RESTART_RETRY_INTERVAL = 30
+
+
+class PipelineEngine:
+    """分阶段任务流水线引擎"""
+
+    def __init__(self, stage_limits: Dict[PipelineStage, int], queue_size: int = 100,
+                 backend: str = "local"):
+        self.stage_limits = {stage: max(1, int(limit)) for stage, limit in stage_limits.items()}
+        self.queue_size = queue_size
+        self.backend = backend
+        self._handlers: Dict[PipelineStage, Callable[[str], Awaitable[Any]]] = {}
+        self._executors: Dict[PipelineStage, ThreadPoolExecutor] = {}
+        self._queues: Dict[PipelineStage, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._redis = None
+        self._stats = {stage: self._empty_stats() for stage in PipelineStage}
+
+    @classmethod
+    def from_settings(cls) -> "PipelineEngine":
+        """根据配置创建引擎"""
+        return cls(
+            stage_limits={
+                PipelineStage.RECOGNITION: settings.PIPELINE_RECOGNITION_WORKERS,
+                PipelineStage.TRACKING: settings.PIPELINE_TRACKING_WORKERS,
+                PipelineStage.RENDER: settings.PIPELINE_RENDER_WORKERS,
+            },
+            queue_size=settings.PIPELINE_QUEUE_SIZE,
+            backend=settings.PIPELINE_BACKEND
+        )
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "in_progress": 0,
+            "total_time": 0.0
+        }
+
+    def register_handler(self, stage: PipelineStage, handler: Callable[[str], Awaitable[Any]]):
+        """注册自定义阶段处理函数（默认调用 TaskService 对应方法）"""
+        self._handlers[stage] = handler
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+    @property
+    def uses_celery(self) -> bool:
+        return self.backend == "celery"
+
+    async def start(self):
+        """在当前事件循环中启动各阶段的worker（Celery模式下无需本地worker）"""
+        if not self.uses_celery:
+            self._ensure_started()
+            # 接收其他进程请求重新执行的任务
+            self._workers.append(self._loop.create_task(self._restart_listener(), name="pipeline-restart"))
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._workers:
+            return
+
+        # 事件循环变化（如测试中多次 asyncio.run）时重建队列和worker
+        self._cancel_workers()
+        self._loop = loop
+        self._queues = {
+            stage: asyncio.Queue(maxsize=self.queue_size) for stage in PipelineStage
+        }
+        for stage in PipelineStage:
+            for index in range(self.stage_limits[stage]):
+                worker = loop.create_task(
+                    self._worker(stage), name=f"pipeline-{stage.value}-{index}"
+                )
+                self._workers.append(worker)
+
+        logger.info(
+            "流水线引擎已启动 - " + ", ".join(
+                f"{stage.value}: {limit}" for stage, limit in self.stage_limits.items()
+            ) + f", 队列容量: {self.queue_size}"
+        )
+
+    def _cancel_workers(self):
+        for worker in self._workers:
+            if not worker.done():
+                worker.cancel()
+        self._workers = []
+
+    async def shutdown(self, wait: bool = False):
+        """停止worker并关闭线程池"""
+        workers = self._workers
+        self._cancel_workers()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+        self._executors = {}
+        self._loop = None
+        logger.info("流水线引擎已停止")
+
+    # ------------------------------------------------------------------
+    # 提交与执行
+    # ------------------------------------------------------------------
+    async def dispatch(self, stage: PipelineStage, task_id: str):
+        """将任务交给下一阶段：Celery模式投递到队列，本地模式进入有界队列"""
+        if self.uses_celery:
+            await asyncio.to_thread(self._send_celery_task, stage, task_id)
+        else:
+            await self.submit(stage, task_id)
+
+    def dispatch_nowait(self, stage: PipelineStage, task_id: str) -> bool:
+        """同步上下文中交给下一阶段"""
+        if self.uses_celery:
+            try:
+                self._send_celery_task(stage, task_id)
+            except Exception as e:
+                self._stats[stage]["rejected"] += 1
+                logger.error(f"投递Celery阶段任务失败 - 阶段: {stage.value}, 任务: {task_id}, 错误: {e}")
+                return False
+            return True
+        return self.submit_nowait(stage, task_id)
+
+    def _send_celery_task(self, stage: PipelineStage, task_id: str):
+        from app.tasks.celery_app import celery_app
+
+        celery_app.send_task(CELERY_STAGE_TASKS[stage], args=[task_id])
+        self._stats[stage]["submitted"] += 1
+        logger.info(f"已投递Celery阶段任务 - 阶段: {stage.value}, 任务: {task_id}")
+
+    def request_restart(self, stage: PipelineStage, task_id: str) -> bool:
+        """
+        从其他进程（Celery worker）请求重新执行某个阶段
+
+        Celery模式直接投递阶段任务；本地模式写入Redis重启队列，由API进程中的引擎取出执行
+        """
+        if self.uses_celery:
+            return self.dispatch_nowait(stage, task_id)
+        try:
+            self._get_redis().rpush(RESTART_QUEUE_KEY, json.dumps({"stage": stage.value, "task_id": task_id}))
+        except Exception as e:
+            self._stats[stage]["rejected"] += 1
+            logger.error(f"写入流水线重启队列失败 - 阶段: {stage.value}, 任务: {task_id}, 错误: {e}")
+            return False
+        logger.info(f"已请求API进程重新执行 - 阶段: {stage.value}, 任务: {task_id}")
+        return True
+
+    async def _restart_listener(self):
+        """本地模式：从Redis重启队列取出任务，提交到对应阶段"""
+        while True:
+            try:
+                item = await asyncio.to_thread(self._get_redis().blpop, RESTART_QUEUE_KEY, RESTART_POLL_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"读取流水线重启队列失败，{RESTART_RETRY_INTERVAL}秒后重试: {e}")
+                await asyncio.sleep(RESTART_RETRY_INTERVAL)
+                continue
+            if not item:
+                continue
+            try:
+                request = json.loads(item[1])
+                stage, task_id = PipelineStage(request["stage"]), request["task_id"]
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"忽略无效的流水线重启请求 {item[1]!r}: {e}")
+                continue
+            await self.submit(stage, task_id)
+
+    def _get_redis(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(
+                settings.REDIS_URL, socket_timeout=RESTART_POLL_TIMEOUT + 5, socket_connect_timeout=2
+            )
+        return self._redis
+
+    async def submit(self, stage: PipelineStage, task_id: str):
+        """提交任务到指定阶段，队列已满时等待（背压）"""
+        self._ensure_started()
+        await self._queues[stage].put(task_id)
+        self._stats[stage]["submitted"] += 1
+
+    def submit_nowait(self, stage: PipelineStage, task_id: str) -> bool:
+        """同步上下文中提交任务，队列已满时返回False"""
+        try:
+            self._ensure_started()
+            self._queues[stage].put_nowait(task_id)
+        except (RuntimeError, asyncio.QueueFull) as e:
+            self._stats[stage]["rejected"] += 1
+            logger.warning(f"流水线提交失败 - 阶段: {stage.value}, 任务: {task_id}, 原因: {e!r}")
+            return False
+        self._stats[stage]["submitted"] += 1
+        return True
+
+    async def run_blocking(self, stage: PipelineStage, func: Callable, *args, **kwargs):
+        """在阶段线程池中执行阻塞调用，避免占用事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(stage), partial(func, *args, **kwargs))
+
+    def _get_executor(self, stage: PipelineStage) -> ThreadPoolExecutor:
+        executor = self._executors.get(stage)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=self.stage_limits[stage],
+                thread_name_prefix=f"pipeline-{stage.value}"
+            )
+            self._executors[stage] = executor
+        return executor
+
+    async def _worker(self, stage: PipelineStage):
+        queue = self._queues[stage]
+        stats = self._stats[stage]
+        while True:
+            task_id = await queue.get()
+            stats["in_progress"] += 1
+            start_time = time.monotonic()
+            try:
+                await self._dispatch(stage, task_id)
+                stats["completed"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"流水线阶段处理失败 - 阶段: {stage.value}, 任务: {task_id}, 错误: {e}", exc_info=True)
+            finally:
+                stats["in_progress"] -= 1
+                stats["total_time"] += time.monotonic() - start_time
+                queue.task_done()
+
+    async def _dispatch(self, stage: PipelineStage, task_id: str):
+        handler = self._handlers.get(stage)
+        if handler is not None:
+            await handler(task_id)
+            return
+
+        # 每个阶段任务使用独立的数据库会话，避免复用请求会话
+        from app.core.database import get_db_session
+        from app.services.task import TaskService
+
+        db = get_db_session()
+        try:
+            service = TaskService(db)
+            await getattr(service, STAGE_HANDLERS[stage])(task_id)
+        finally:
+            db.close()
+
+    async def join(self, stage: Optional[PipelineStage] = None):
+        """等待指定阶段（默认全部阶段）的队列清空"""
+        stages = [stage] if stage else list(PipelineStage)
+        for item in stages:
+            if item in self._queues:
+                await self._queues[item].join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各阶段运行统计"""
+        result = {}
+        for stage in PipelineStage:
+            stats = self._stats[stage]
+            finished = stats["completed"] + stats["failed"]
+            queue = self._queues.get(stage)
+            result[stage.value] = {
+                "backend": self.backend,
+                "concurrency": self.stage_limits[stage],
+                "queue_size": queue.qsize() if queue else 0,
+                "queue_capacity": self.queue_size,
+                "submitted": stats["submitted"],
+                "completed": stats["completed"],
+                "failed": stats["failed"],
+                "rejected": stats["rejected"],
+                "in_progress": stats["in_progress"],
+                "avg_time": round(stats["total_time"] / finished, 3) if finished else 0.0
+            }
+        return result
+
+
+# 全局流水线引擎实例
+pipeline_engine = PipelineEngine.from_settings()
@@ -0,0 +1,192 @@
+"""
+二维码解码进程池
+- 每个子进程启动时固定OpenCV线程数并预热 QRCodeDetector，之后一直复用
+- decode_many 将一批图片分发到所有进程，结果按输入顺序返回
+- 解码按 QR_DECODE_STAGES 分级执行，结果匹配快递单号规则即提前结束，并统计各级命中次数
+- QR_DECODE_LOCATE 开启时，先在原图上定位候选区域并按原始分辨率解码
+- 在无法创建子进程的环境（如Celery prefork的守护进程）中自动退化为当前进程解码；
+  max_workers=0 时不创建子进程，始终在当前进程解码
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(cv_threads: int):
+    """子进程初始化：固定OpenCV线程数并预热检测器"""
+    import cv2
+    from app.utils.legacy.robust_qr_reader import _get_detector
+
+    cv2.setNumThreads(cv_threads)
+    _get_detector()
+
+
+@lru_cache(maxsize=32)
+def build_accept(patterns: Tuple[str, ...]) -> Optional[Callable[[str], bool]]:
+    """
+    根据快递单号正则构建提前结束判定：文本本身或其中的字母数字片段（如URL中的单号）匹配任一规则即接受
+    每个进程按规则集合缓存一次编译结果
+    """
+    if not patterns:
+        return None
+    compiled = [re.compile(pattern) for pattern in patterns]
+
+    def accept(text: str) -> bool:
+        candidates = [text.strip()] + re.findall(r"[A-Za-z0-9]{8,}", text)
+        return any(regex.match(candidate) for candidate in candidates for regex in compiled)
+
+    return accept
+
+
+def _decode_path(image_path: str, stages: Optional[Tuple[str, ...]] = None,
+                 accept_patterns: Tuple[str, ...] = (), locate: bool = False) -> Dict[str, Any]:
+    """解码单张图片，异常转换为错误信息返回（子进程中执行）"""
+    return _decode(image_path, "decode_qr_detailed", image_path, stages, accept_patterns, locate)
+
+
+def _decode_buffer(buffer: bytes, stages: Optional[Tuple[str, ...]] = None,
+                   accept_patterns: Tuple[str, ...] = (), locate: bool = False) -> Dict[str, Any]:
+    """解码内存中的图片数据（子进程中执行）"""
+    return _decode(None, "decode_qr_bytes_detailed", buffer, stages, accept_patterns, locate)
+
+
+def _decode(image_path: Optional[str], func_name: str, source: Any,
+            stages: Optional[Tuple[str, ...]], accept_patterns: Tuple[str, ...],
+            locate: bool = False) -> Dict[str, Any]:
+    start_time = time.time()
+    stage = None
+    stage_times = {}
+    try:
+        from app.utils.legacy import robust_qr_reader
+
+        decode_func = getattr(robust_qr_reader, func_name)
+        detail = decode_func(source, stages=stages, accept=build_accept(accept_patterns), locate=locate)
+        texts = detail["texts"]
+        stage = detail["stage"]
+        stage_times = detail["stage_times"]
+        error = None
+    except Exception as e:
+        texts = []
+        error = str(e)
+    return {
+        "path": image_path,
+        "texts": texts,
+        "stage": stage,
+        "stage_times": stage_times,
+        "error": error,
+        "decode_time": time.time() - start_time
+    }
+
+
+class QRDecodePool:
+    """二维码解码进程池"""
+
+    def __init__(self, max_workers: Optional[int] = None, cv_threads: int = 1,
+                 stages: Optional[Sequence[str]] = None, locate: bool = False):
+        # None 按CPU核心数创建进程；0 不使用子进程
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max(0, max_workers)
+        self.cv_threads = cv_threads
+        self.stages = tuple(stages) if stages else None
+        self.locate = locate
+        self.stage_hits: Counter = Counter()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "QRDecodePool":
+        """根据配置创建进程池"""
+        return cls(
+            max_workers=settings.QR_DECODE_WORKERS or None,
+            cv_threads=settings.QR_DECODE_CV_THREADS,
+            stages=[name.strip() for name in settings.QR_DECODE_STAGES.split(",") if name.strip()],
+            locate=settings.QR_DECODE_LOCATE
+        )
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._disabled or self.max_workers == 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                try:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        initializer=_init_worker,
+                        initargs=(self.cv_threads,)
+                    )
+                except Exception as e:
+                    logger.warning(f"无法创建二维码解码进程池，改为当前进程解码: {e}")
+                    self._disabled = True
+                    return None
+                logger.info(f"二维码解码进程池已启动 - 进程数: {self.max_workers}, OpenCV线程数: {self.cv_threads}")
+            return self._executor
+
+    def decode(self, image_path: str, accept_patterns: Sequence[str] = ()) -> Dict[str, Any]:
+        """解码单张图片"""
+        return self.decode_many([image_path], accept_patterns)[0]
+
+    def decode_many(self, image_paths: List[str], accept_patterns: Sequence[str] = ()) -> List[Dict[str, Any]]:
+        """批量解码，结果顺序与输入一致；accept_patterns 为提前结束所用的快递单号正则"""
+        if not image_paths:
+            return []
+
+        decode_func = partial(_decode_path, stages=self.stages,
+                              accept_patterns=tuple(accept_patterns), locate=self.locate)
+        return self._run(decode_func, image_paths)
+
+    def decode_bytes(self, buffer: bytes, accept_patterns: Sequence[str] = ()) -> Dict[str, Any]:
+        """解码内存中的图片数据（如上传内容），不写临时文件"""
+        decode_func = partial(_decode_buffer, stages=self.stages,
+                              accept_patterns=tuple(accept_patterns), locate=self.locate)
+        return self._run(decode_func, [bytes(buffer)])[0]
+
+    def _run(self, decode_func: Callable, items: List[Any]) -> List[Dict[str, Any]]:
+        results = None
+        executor = self._get_executor()
+        if executor is not None:
+            try:
+                chunksize = max(1, len(items) // (self.max_workers * 4))
+                results = list(executor.map(decode_func, items, chunksize=chunksize))
+            except Exception as e:
+                # 子进程无法启动或异常退出（BrokenProcessPool）时，丢弃进程池并退化
+                logger.warning(f"二维码解码进程池不可用，改为当前进程解码: {e}")
+                self.shutdown()
+                self._disabled = True
+
+        if results is None:
+            results = [decode_func(item) for item in items]
+
+        for result in results:
+            self.stage_hits[result["stage"] or "miss"] += 1
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各解码级别命中次数，用于根据生产数据调整级别顺序"""
+        return {
+            "workers": self.max_workers,
+            "stages": list(self.stages) if self.stages else None,
+            "locate": self.locate,
+            "stage_hits": dict(self.stage_hits)
+        }
+
+    def shutdown(self, wait: bool = False):
+        """关闭进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+# 全局二维码解码进程池（首次使用时创建子进程）
+qr_decode_pool = QRDecodePool.from_settings()
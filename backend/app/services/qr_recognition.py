@@ -1,17 +1,19 @@
+import asyncio
 import os
 import re
 import time
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, BinaryIO
 from pathlib import Path
 from sqlalchemy.orm import Session
 from datetime import datetime
 
 from app.models.recognition import (
-    RecognitionTask, RecognitionResult, CourierPattern,
+    RecognitionTask, RecognitionResult,
     RecognitionTypeEnum, RecognitionStatusEnum
 )
-from app.utils.legacy.robust_qr_reader import decode_qr
-from app.core.config import settings
+from app.services.qr_decode_pool import qr_decode_pool
+from app.services.recognition_cache import recognition_cache
+from app.services.courier_patterns import courier_pattern_registry
 
 
 class QRRecognitionService:
@@ -19,73 +21,166 @@ class QRRecognitionService:
     
     def __init__(self, db: Session):
         self.db = db
-        self._init_courier_patterns()
     
-    def _init_courier_patterns(self):
-        """初始化快递单号识别模式"""
-        patterns = [
-            {
-                "courier_name": "EMS中国邮政",
-                "courier_code": "ems",
-                "pattern_regex": r"^[A-Z]{2}\d{9}[A-Z]{2}$",
-                "pattern_length": 13,
-                "pattern_prefix": "",
-                "description": "EMS单号格式：2个字母+9个数字+2个字母",
-                "examples": ["EA123456789CN", "CP123456789CN"]
-            },
-            {
-                "courier_name": "顺丰速运",
-                "courier_code": "shunfeng", 
-                "pattern_regex": r"^SF\d{12}$",
-                "pattern_length": 14,
-                "pattern_prefix": "SF",
-                "description": "顺丰单号格式：SF+12位数字",
-                "examples": ["SF1234567890123"]
-            },
-            {
-                "courier_name": "中通快递",
-                "courier_code": "zhongtong",
-                "pattern_regex": r"^\d{12}$",
-                "pattern_length": 12,
-                "pattern_prefix": "",
-                "description": "中通单号格式：12位数字",
-                "examples": ["123456789012"]
-            },
-            {
-                "courier_name": "EMS数字单号",
-                "courier_code": "ems_number",
-                "pattern_regex": r"^\d{13}$",
-                "pattern_length": 13,
-                "pattern_prefix": "",
-                "description": "EMS数字单号：13位数字",
-                "examples": ["1151242358360"]
-            },
-            {
-                "courier_name": "通用数字单号",
-                "courier_code": "generic_number",
-                "pattern_regex": r"^\d{10,18}$",
-                "pattern_length": 0,
-                "pattern_prefix": "",
-                "description": "通用数字单号：10-18位数字",
-                "examples": ["1234567890", "123456789012345678"]
-            }
+    def recognize_single_image(self, image_path: str, task_id: Optional[int] = None,
+                               content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        识别单张图片中的二维码/条形码
+        同一图片内容（SHA-256）已识别过时直接使用缓存结果；已知内容哈希时命中缓存可免读文件
+        """
+        decoded = None
+        accept_patterns = self._get_accept_patterns()
+        if content_hash:
+            decoded = self._get_cached_decode(content_hash, accept_patterns)
+        
+        if decoded is None:
+            try:
+                with open(image_path, "rb") as f:
+                    content = f.read()
+            except OSError:
+                decoded = {"texts": [], "error": f"无法读取图片：{image_path}"}
+            else:
+                decoded = self._decode_bytes_cached(content, not content_hash, accept_patterns)
+        
+        return self._build_recognition_result(image_path, decoded, task_id)
+    
+    def recognize_images(self, image_paths: List[str], task_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """批量识别图片，未命中缓存的图片分发到解码进程池并行执行，结果顺序与输入一致"""
+        decoded_list: List[Optional[Dict[str, Any]]] = [None] * len(image_paths)
+        digests: Dict[int, str] = {}
+        miss_indexes = []
+        accept_patterns = self._get_accept_patterns()
+        
+        for index, image_path in enumerate(image_paths):
+            try:
+                with open(image_path, "rb") as f:
+                    digests[index] = recognition_cache.hash_bytes(f.read())
+            except OSError:
+                miss_indexes.append(index)
+                continue
+            decoded_list[index] = self._get_cached_decode(digests[index], accept_patterns)
+            if decoded_list[index] is None:
+                miss_indexes.append(index)
+        
+        decoded_misses = qr_decode_pool.decode_many(
+            [image_paths[index] for index in miss_indexes], accept_patterns
+        )
+        for index, decoded in zip(miss_indexes, decoded_misses):
+            decoded_list[index] = decoded
+            if index in digests:
+                self._cache_decode(digests[index], decoded, accept_patterns)
+        
+        return [
+            self._build_recognition_result(image_path, decoded, task_id)
+            for image_path, decoded in zip(image_paths, decoded_list)
         ]
+    
+    def recognize_bytes(self, buffer: bytes, file_name: str, task_id: Optional[int] = None) -> Dict[str, Any]:
+        """识别内存中的图片数据（上传内容），无需先写入临时文件"""
+        decoded = self._decode_bytes_cached(buffer)
+        return self._build_recognition_result(file_name, decoded, task_id, file_size=len(buffer))
+    
+    async def stream_recognize(self, uploads: List[Tuple[str, BinaryIO]], task_id: Optional[int] = None,
+                               concurrency: Optional[int] = None,
+                               save_file=None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        并发识别一批上传文件，每完成一个就产出一条结果（完成顺序，带 index 字段）
         
-        # 检查是否已存在模式，不存在则创建
-        existing_count = self.db.query(CourierPattern).count()
-        if existing_count == 0:
-            for pattern_data in patterns:
-                pattern = CourierPattern(**pattern_data)
-                self.db.add(pattern)
-            self.db.commit()
+        Args:
+            uploads: (文件名, 文件对象) 列表，文件内容在轮到该文件时才读入内存
+            task_id: 识别任务ID，提供时逐条保存结果
+            concurrency: 同时解码的文件数，默认等于解码进程数
+            save_file: 可选的保存函数 save_file(content, filename) -> 文件信息，在线程中执行
+        
+        数据库读写（读取识别模式、保存识别结果）在线程中依次执行，不阻塞事件循环
+        """
+        semaphore = asyncio.Semaphore(concurrency or qr_decode_pool.max_workers)
+        # 解码在线程/进程中执行，不访问数据库；模式预先取好
+        accept_patterns = await asyncio.to_thread(self._get_accept_patterns)
+        
+        async def process(index: int, file_name: str, file_obj: BinaryIO):
+            async with semaphore:
+                content = await asyncio.to_thread(file_obj.read)
+                try:
+                    decoded = await asyncio.to_thread(
+                        self._decode_bytes_cached, content, True, accept_patterns
+                    )
+                    saved = await asyncio.to_thread(save_file, content, file_name) if save_file else None
+                finally:
+                    file_obj.close()
+                return index, file_name, len(content), decoded, saved
+        
+        pending = [
+            asyncio.create_task(process(index, file_name, file_obj))
+            for index, (file_name, file_obj) in enumerate(uploads)
+        ]
+        try:
+            for finished in asyncio.as_completed(pending):
+                index, file_name, file_size, decoded, saved = await finished
+                result = await asyncio.to_thread(
+                    self._build_recognition_result,
+                    saved["file_path"] if saved else file_name, decoded, task_id, file_size
+                )
+                result["index"] = index
+                result["file_name"] = file_name
+                result["file_id"] = saved.get("file_id") if saved else None
+                yield result
+        finally:
+            # 客户端断开时取消尚未完成的文件
+            for task in pending:
+                task.cancel()
+    
+    def _decode_bytes_cached(self, content: bytes, lookup: bool = True,
+                             accept_patterns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """按内容哈希查缓存，未命中时解码并写入缓存"""
+        digest = recognition_cache.hash_bytes(content)
+        if accept_patterns is None:
+            accept_patterns = self._get_accept_patterns()
+        if lookup:
+            decoded = self._get_cached_decode(digest, accept_patterns)
+            if decoded is not None:
+                return decoded
+        
+        decoded = qr_decode_pool.decode_bytes(content, accept_patterns)
+        self._cache_decode(digest, decoded, accept_patterns)
+        return decoded
+    
+    def cache_key(self, digest: str, accept_patterns: Optional[List[str]] = None) -> str:
+        """识别缓存键（内容哈希 + 当前解码配置和单号规则的版本）"""
+        if accept_patterns is None:
+            accept_patterns = self._get_accept_patterns()
+        return recognition_cache.make_key(digest, accept_patterns)
+    
+    def _get_cached_decode(self, digest: str, accept_patterns: List[str]) -> Optional[Dict[str, Any]]:
+        cached = recognition_cache.get(self.cache_key(digest, accept_patterns))
+        if cached is None:
+            return None
+        return {**cached, "error": None, "decode_time": 0.0, "cache_hit": True}
+    
+    def _cache_decode(self, digest: str, decoded: Dict[str, Any], accept_patterns: List[str]):
+        # 读取/解码异常和未识别到内容的结果不缓存，重试时重新解码
+        if decoded.get("error") or not decoded.get("texts"):
+            return
+        recognition_cache.set(self.cache_key(digest, accept_patterns), {
+            "texts": decoded["texts"],
+            "stage": decoded.get("stage"),
+            "stage_times": decoded.get("stage_times", {})
+        })
+    
+    def _get_accept_patterns(self) -> List[str]:
+        """解码提前结束所用的快递单号正则（激活的识别模式）"""
+        return courier_pattern_registry.get(self.db).regexes
     
-    def recognize_single_image(self, image_path: str, task_id: Optional[int] = None) -> Dict[str, Any]:
-        """识别单张图片中的二维码/条形码"""
-        start_time = time.time()
+    def _build_recognition_result(self, image_path: str, decoded: Dict[str, Any],
+                                  task_id: Optional[int] = None,
+                                  file_size: Optional[int] = None) -> Dict[str, Any]:
+        """根据解码结果构建识别结果，有任务ID时保存到数据库"""
+        start_time = time.time() - decoded.get("decode_time", 0.0)
         
         try:
-            # 使用robust_qr_reader识别
-            qr_texts = decode_qr(image_path)
+            if decoded.get("error"):
+                raise RuntimeError(decoded["error"])
+            qr_texts = decoded["texts"]
             
             # 解析识别结果
             parsed_results = self._parse_recognition_results(qr_texts)
@@ -95,7 +190,9 @@ class QRRecognitionService:
             result = {
                 "file_path": image_path,
                 "file_name": os.path.basename(image_path),
-                "file_size": os.path.getsize(image_path) if os.path.exists(image_path) else 0,
+                "file_size": file_size if file_size is not None else (
+                    os.path.getsize(image_path) if os.path.exists(image_path) else 0
+                ),
                 "recognition_type": self._determine_recognition_type(parsed_results),
                 "raw_results": qr_texts,
                 "tracking_numbers": parsed_results["tracking_numbers"],
@@ -107,6 +204,9 @@ class QRRecognitionService:
                 "processing_time": processing_time,
                 "extra_metadata": {
                     "recognition_engine": "robust_qr_reader",
+                    "decode_stage": decoded.get("stage"),
+                    "cache_hit": decoded.get("cache_hit", False),
+                    "stage_times": decoded.get("stage_times", {}),
                     "timestamp": datetime.utcnow().isoformat()
                 }
             }
@@ -147,10 +247,8 @@ class QRRecognitionService:
         qr_contents = []
         barcode_contents = []
         
-        # 获取所有激活的识别模式
-        patterns = self.db.query(CourierPattern).filter(
-            CourierPattern.is_active == "true"
-        ).order_by(CourierPattern.priority.desc()).all()
+        # 获取编译好的激活识别模式（进程内缓存）
+        patterns = courier_pattern_registry.get(self.db)
         
         for text in raw_texts:
             text = text.strip()
@@ -165,32 +263,28 @@ class QRRecognitionService:
             
             # 如果从URL提取到了数字，尝试匹配模式
             if extracted_number:
-                for pattern in patterns:
-                    if pattern.pattern_regex:
-                        if re.match(pattern.pattern_regex, extracted_number):
-                            tracking_numbers.append({
-                                "number": extracted_number,
-                                "courier_name": pattern.courier_name,
-                                "courier_code": pattern.courier_code,
-                                "pattern_matched": pattern.pattern_regex,
-                                "source_url": text  # 保存原始URL
-                            })
-                            matched_tracking = True
-                            break
+                pattern = patterns.match(extracted_number)
+                if pattern:
+                    tracking_numbers.append({
+                        "number": extracted_number,
+                        "courier_name": pattern.courier_name,
+                        "courier_code": pattern.courier_code,
+                        "pattern_matched": pattern.pattern_regex,
+                        "source_url": text  # 保存原始URL
+                    })
+                    matched_tracking = True
             
             # 如果没有从URL提取到，直接匹配原文本
             if not matched_tracking:
-                for pattern in patterns:
-                    if pattern.pattern_regex:
-                        if re.match(pattern.pattern_regex, text):
-                            tracking_numbers.append({
-                                "number": text,
-                                "courier_name": pattern.courier_name,
-                                "courier_code": pattern.courier_code,
-                                "pattern_matched": pattern.pattern_regex
-                            })
-                            matched_tracking = True
-                            break
+                pattern = patterns.match(text)
+                if pattern:
+                    tracking_numbers.append({
+                        "number": text,
+                        "courier_name": pattern.courier_name,
+                        "courier_code": pattern.courier_code,
+                        "pattern_matched": pattern.pattern_regex
+                    })
+                    matched_tracking = True
             
             # 如果不是快递单号，按内容特征分类
             if not matched_tracking:
@@ -0,0 +1,189 @@
+"""
+二维码识别结果缓存
+- 以 解码配置版本 + 图片内容 SHA-256 作为键，同一张照片重复上传时直接复用解码结果；
+  解码级别、区域定位开关或快递单号规则变化后版本改变，旧结果不再命中
+- 只缓存解码出内容的结果，未识别到二维码的图片重试时重新解码
+- 进程内 LRU 缓存，RECOGNITION_CACHE_BACKEND=redis 时再以 Redis 作为多worker共享的二级缓存
+- 命中/未命中计数供监控接口查询（Redis模式下计数也保存在Redis中，汇总所有进程）
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "recognition_cache:"
+HITS_KEY = "recognition_cache_stats:hits"
+MISSES_KEY = "recognition_cache_stats:misses"
+# 解码实现版本：修改解码流程后递增，使已缓存的识别结果失效
+DECODER_VERSION = "1"
+
+
+@lru_cache(maxsize=64)
+def _config_version(decoder_version: str, stages: str, locate: bool, patterns: Tuple[str, ...]) -> str:
+    payload = json.dumps([decoder_version, stages, locate, list(patterns)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def decode_config_version(accept_patterns: Sequence[str]) -> str:
+    """解码配置（解码级别、区域定位、提前结束所用的单号规则）的版本号"""
+    return _config_version(
+        DECODER_VERSION, settings.QR_DECODE_STAGES, settings.QR_DECODE_LOCATE, tuple(accept_patterns)
+    )
+
+
+class RecognitionCache:
+    """识别结果缓存"""
+
+    def __init__(self, max_items: int = 1024, ttl: int = 7 * 24 * 3600,
+                 backend: str = "memory", redis_url: Optional[str] = None):
+        self.max_items = max(1, max_items)
+        self.ttl = ttl
+        self.backend = backend
+        self.redis_url = redis_url
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "RecognitionCache":
+        """根据配置创建缓存"""
+        return cls(
+            max_items=settings.RECOGNITION_CACHE_MAX_ITEMS,
+            ttl=settings.RECOGNITION_CACHE_TTL,
+            backend=settings.RECOGNITION_CACHE_BACKEND,
+            redis_url=settings.REDIS_URL
+        )
+
+    @staticmethod
+    def hash_bytes(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def make_key(digest: str, accept_patterns: Sequence[str]) -> str:
+        """缓存键：解码配置版本 + 内容哈希"""
+        return f"{decode_config_version(accept_patterns)}:{digest}"
+
+    def _get_redis(self):
+        if self.backend != "redis":
+            return None
+        if self._redis is None:
+            try:
+                import redis
+
+                self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=1)
+            except Exception as e:
+                logger.warning(f"识别缓存无法连接Redis，仅使用进程内缓存: {e}")
+                self.backend = "memory"
+                return None
+        return self._redis
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希查询解码结果"""
+        with self._lock:
+            value = self._items.get(digest)
+            if value is not None:
+                self._items.move_to_end(digest)
+
+        if value is None:
+            client = self._get_redis()
+            if client is not None:
+                try:
+                    raw = client.get(KEY_PREFIX + digest)
+                    if raw is not None:
+                        value = json.loads(raw)
+                        self._remember(digest, value)
+                except Exception as e:
+                    logger.warning(f"读取Redis识别缓存失败: {e}")
+
+        self._count(value is not None)
+        return value
+
+    def contains(self, digest: str) -> bool:
+        """是否已缓存（不计入命中统计）"""
+        with self._lock:
+            if digest in self._items:
+                return True
+        client = self._get_redis()
+        if client is not None:
+            try:
+                return bool(client.exists(KEY_PREFIX + digest))
+            except Exception as e:
+                logger.warning(f"查询Redis识别缓存失败: {e}")
+        return False
+
+    def set(self, digest: str, value: Dict[str, Any]):
+        """写入解码结果"""
+        self._remember(digest, value)
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.set(KEY_PREFIX + digest, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"写入Redis识别缓存失败: {e}")
+
+    def _remember(self, digest: str, value: Dict[str, Any]):
+        with self._lock:
+            self._items[digest] = value
+            self._items.move_to_end(digest)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.incr(HITS_KEY if hit else MISSES_KEY)
+            except Exception:
+                pass
+
+    def clear(self):
+        """清空进程内缓存和计数"""
+        with self._lock:
+            self._items.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            hits, misses, size = self._hits, self._misses, len(self._items)
+
+        scope = "process"
+        client = self._get_redis()
+        if client is not None:
+            try:
+                hits = int(client.get(HITS_KEY) or 0)
+                misses = int(client.get(MISSES_KEY) or 0)
+                scope = "cluster"
+            except Exception as e:
+                logger.warning(f"读取Redis识别缓存统计失败: {e}")
+
+        total = hits + misses
+        return {
+            "backend": self.backend,
+            "scope": scope,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "local_items": size,
+            "max_items": self.max_items
+        }
+
+
+# 全局识别结果缓存实例
+recognition_cache = RecognitionCache.from_settings()
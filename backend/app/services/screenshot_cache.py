@@ -0,0 +1,130 @@
+"""
+物流轨迹截图结果缓存
+- 按 (单号, 当前状态, 签收时间, 轨迹列表, 模板版本) 的哈希命名截图文件：tracking_{单号}_{哈希前16位}.png
+- 轨迹未变化时直接复用已有的PNG，不再重新查询渲染（回证重新生成、失败任务重试等场景）
+- 命中时更新文件修改时间作为最近使用时间，清理时按最近使用时间保留 max_items 个，
+  数据库中仍被任务/物流记录/回证引用的截图不删除
+- 新截图先写入临时文件再原子替换，多个worker同时渲染同一单号时不会读到半个文件
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def render_key(tracking_number: str, status: str, sign_time: Optional[str],
+               traces: Optional[List[Dict[str, Any]]], version: str) -> str:
+    """截图内容的缓存键（任何一项变化都会生成新截图）"""
+    payload = json.dumps(
+        [tracking_number, status or "", sign_time or "", traces or [], version],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScreenshotCache:
+    """截图目录上的渲染结果缓存"""
+
+    def __init__(self, directory: Path, max_items: int = 5000):
+        self.directory = Path(directory)
+        self.max_items = max_items
+
+    @staticmethod
+    def filename(tracking_number: str, key: str) -> str:
+        return f"tracking_{tracking_number}_{key[:16]}.png"
+
+    def lookup(self, filename: str) -> Optional[Path]:
+        """返回已渲染的截图路径（并记为最近使用），不存在时返回 None"""
+        path = self.directory / filename
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def temp_path(self, filename: str) -> Path:
+        """渲染用的临时文件路径（与最终文件在同一目录，保证可以原子替换）"""
+        return self.directory / f".{filename}.{uuid.uuid4().hex}.tmp"
+
+    def commit(self, temp_path: Path, filename: str) -> Path:
+        """把渲染好的临时文件替换为缓存文件"""
+        path = self.directory / filename
+        os.replace(temp_path, path)
+        return path
+
+    def store(self, filename: str, data: bytes) -> Path:
+        """写入渲染好的PNG数据（先写临时文件再替换）"""
+        temp_path = self.temp_path(filename)
+        try:
+            temp_path.write_bytes(data)
+            return self.commit(temp_path, filename)
+        except BaseException:
+            self.discard(temp_path)
+            raise
+
+    def discard(self, temp_path: Path):
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+    def cleanup(self, referenced: Iterable[str] = (), max_items: Optional[int] = None,
+                temp_max_age: float = 3600) -> Dict[str, Any]:
+        """
+        按最近使用时间清理截图
+
+        Args:
+            referenced: 仍被数据库引用的截图文件名（不删除）
+            max_items: 保留的最近使用截图数量，默认使用初始化时的配置
+            temp_max_age: 渲染中断留下的临时文件超过该秒数后删除
+
+        Returns:
+            清理统计
+        """
+        max_items = self.max_items if max_items is None else max_items
+        keep: Set[str] = {os.path.basename(name) for name in referenced if name}
+        entries = []
+        removed, freed, temp_removed = 0, 0, 0
+        now = time.time()
+
+        for path in self.directory.glob(".tracking_*.tmp"):
+            try:
+                if now - path.stat().st_mtime > temp_max_age:
+                    path.unlink()
+                    temp_removed += 1
+            except OSError:
+                continue
+
+        for path in self.directory.glob("tracking_*.png"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        for _, size, path in entries[max_items:]:
+            if path.name in keep:
+                continue
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"删除截图缓存文件失败 {path}: {e}")
+                continue
+            removed += 1
+            freed += size
+
+        return {
+            "total": len(entries),
+            "removed": removed,
+            "kept_referenced": sum(1 for _, _, path in entries[max_items:] if path.name in keep),
+            "freed_mb": round(freed / (1024 * 1024), 2),
+            "temp_removed": temp_removed
+        }
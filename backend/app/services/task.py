@@ -19,6 +19,9 @@ from app.services.express_tracking import ExpressTrackingService
 from app.services.tracking_screenshot import TrackingScreenshotService
 from app.services.qr_generation import QRGenerationService
 from app.services.delivery_receipt_generator import DeliveryReceiptGeneratorService
+from app.services.pipeline_engine import pipeline_engine, PipelineStage
+from app.services.tracking_scheduler import schedule_task
+from app.services.tracking_events import TrackingEventService
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -214,6 +217,13 @@ class TaskService:
             # 生成文件访问URL
             file_url = f"/static/uploads/{unique_filename}"
             
+            # 按内容哈希检查识别缓存，重复上传的照片在识别阶段直接复用结果
+            from app.services.recognition_cache import recognition_cache
+            content_hash = recognition_cache.hash_bytes(content)
+            recognition_cached = recognition_cache.contains(self.qr_service.cache_key(content_hash))
+            if recognition_cached:
+                logger.info(f"批量上传文件命中识别缓存: {filename}")
+            
             file_info_result = {
                 "file_id": file_id,
                 "filename": filename,
@@ -232,7 +242,11 @@ class TaskService:
                 file_size=file_info_result.get("size"),
                 user_id=user_id,
                 started_at=datetime.now(),
-                extra_metadata={"batch_id": batch_id}
+                extra_metadata={
+                    "batch_id": batch_id,
+                    "content_sha256": content_hash,
+                    "recognition_cached": recognition_cached
+                }
             )
             
             db.add(task)
@@ -271,12 +285,10 @@ class TaskService:
         try:
             logger.info(f"启动批量处理 - 批次ID: {batch_id}, 任务数量: {len(task_ids)}")
             
-            # 为每个任务启动异步处理
-            processing_tasks = []
+            # 提交到流水线识别阶段，队列已满时等待（背压），处理在后台进行
             for task_id in task_ids:
-                processing_tasks.append(asyncio.create_task(self._trigger_qr_recognition(task_id)))
+                await pipeline_engine.dispatch(PipelineStage.RECOGNITION, task_id)
             
-            # 不等待所有任务完成，让它们在后台运行
             logger.info(f"批量处理已启动 - 批次ID: {batch_id}")
             
         except Exception as e:
@@ -382,8 +394,8 @@ class TaskService:
                 "created_at": task.created_at.isoformat() if task.created_at else None
             })
             
-            # 4. 启动异步二维码识别（不等待完成）
-            asyncio.create_task(self._trigger_qr_recognition(task.task_id))
+            # 4. 提交到流水线识别阶段（不等待完成）
+            await pipeline_engine.dispatch(PipelineStage.RECOGNITION, task.task_id)
             
             return {
                 "success": True,
@@ -594,13 +606,13 @@ class TaskService:
                     self.db.commit()
                     
                     print(f"更新任务状态为已签收 - 任务: {task.task_id}")
-                    asyncio.create_task(self._trigger_document_generation(task.task_id))
+                    await pipeline_engine.dispatch(PipelineStage.RENDER, task.task_id)
                     return True
             
             # 如果任务处于DELIVERED状态但没有文档，触发文档生成
             elif task.status == TaskStatusEnum.DELIVERED and not task.document_url:
                 print(f"重新触发文档生成 - 任务: {task.task_id}")
-                asyncio.create_task(self._trigger_document_generation(task.task_id))
+                await pipeline_engine.dispatch(PipelineStage.RENDER, task.task_id)
                 return True
             
             return False
@@ -631,15 +643,15 @@ class TaskService:
             if task.qr_code and task.tracking_number and not task.tracking_data:
                 # 有二维码和快递单号但没有物流数据，从物流查询开始
                 print(f"从物流查询步骤开始重试 - 任务: {task.task_id}")
-                asyncio.create_task(self._trigger_tracking(task.task_id))
+                pipeline_engine.dispatch_nowait(PipelineStage.TRACKING, task.task_id)
             elif task.tracking_data and task.tracking_data.get("is_signed") and not task.document_url:
                 # 有物流数据且已签收但没有文档，从文档生成开始
                 print(f"从文档生成步骤开始重试 - 任务: {task.task_id}")
-                asyncio.create_task(self._trigger_document_generation(task.task_id))
+                pipeline_engine.dispatch_nowait(PipelineStage.RENDER, task.task_id)
             else:
                 # 从二维码识别开始重试
                 print(f"从二维码识别步骤开始重试 - 任务: {task.task_id}")
-                asyncio.create_task(self._trigger_qr_recognition(task.task_id))
+                pipeline_engine.dispatch_nowait(PipelineStage.RECOGNITION, task.task_id)
         except Exception as e:
             print(f"重试任务时启动后续流程失败: {str(e)}")
             # 如果启动后续流程失败，任务状态已经设为PENDING，用户可以手动重试
@@ -693,12 +705,9 @@ class TaskService:
         if task.tracking_number:
             tracking_number = task.tracking_number
             
-            # 快递缓存文件
-            express_cache_patterns = [
-                f"uploads/express_cache/ems_{tracking_number}.json",
-                f"uploads/express_cache/sf_{tracking_number}.json",
-                f"uploads/express_cache/sto_{tracking_number}.json"
-            ]
+            # 物流查询缓存（所有快递公司）
+            from app.services.tracking_cache import tracking_cache
+            tracking_cache.delete(tracking_number)
             
             # 送达回证文档
             delivery_receipt_pattern = f"uploads/delivery_receipts/delivery_receipt_{tracking_number}_*.docx"
@@ -717,9 +726,6 @@ class TaskService:
             for pattern in [delivery_receipt_pattern, tracking_screenshot_pattern, 
                           qr_label_pattern, tracking_html_pattern]:
                 files_to_remove.extend(glob.glob(pattern))
-            
-            # 添加确定路径的文件
-            files_to_remove.extend(express_cache_patterns)
         
         # 删除文件
         for file_path in files_to_remove:
@@ -825,8 +831,12 @@ class TaskService:
             # 发送WebSocket推送
             await self._send_websocket_update(task, "recognition_started")
             
-            # 进行二维码识别
-            recognition_result = self.qr_service.recognize_single_image(task.image_path)
+            # 进行二维码识别（在识别阶段线程池中执行，不阻塞事件循环）
+            content_hash = (task.extra_metadata or {}).get("content_sha256")
+            recognition_result = await pipeline_engine.run_blocking(
+                PipelineStage.RECOGNITION, self.qr_service.recognize_single_image, task.image_path,
+                content_hash=content_hash
+            )
             print(f"二维码识别结果: {recognition_result}")
             
             if recognition_result["is_success"] == "true":
@@ -855,8 +865,8 @@ class TaskService:
                         "courier_company": task.courier_company
                     })
                     
-                    # 触发物流跟踪 - 异步执行
-                    asyncio.create_task(self._trigger_tracking(task.task_id))
+                    # 提交到物流查询阶段
+                    await pipeline_engine.dispatch(PipelineStage.TRACKING, task.task_id)
                 else:
                     # 识别到二维码但未提取到快递单号
                     task.status = TaskStatusEnum.FAILED
@@ -901,6 +911,19 @@ class TaskService:
             except Exception as commit_error:
                 print(f"更新任务状态失败: {str(commit_error)}")
     
+    async def _subscribe_tracking(self, task: Task, company_code: str):
+        """为未签收任务订阅快递100推送（未启用时跳过）"""
+        from app.services.tracking_subscription import TrackingSubscriptionService
+        
+        if not TrackingSubscriptionService.is_enabled():
+            return
+        subscription_service = TrackingSubscriptionService(self.db)
+        result = await pipeline_engine.run_blocking(
+            PipelineStage.TRACKING, subscription_service.subscribe_task, task, company_code
+        )
+        if not result.get("success"):
+            print(f"订阅快递100推送失败 - 任务: {task.task_id}, 原因: {result.get('error')}")
+    
     async def _trigger_tracking(self, task_id: str):
         """触发物流跟踪处理"""
         try:
@@ -922,14 +945,22 @@ class TaskService:
             # 发送WebSocket推送
             await self._send_websocket_update(task, "tracking_started")
             
-            # 查询物流信息
-            company_code = "ems"  # 根据实际情况确定快递公司代码
-            tracking_result = self.tracking_service.query_express(task.tracking_number, company_code)
+            # 查询物流信息（快递公司按二维码域名、识别到的快递公司、单号规则确定，必要时调用智能单号识别）
+            company_code = await self.tracking_service.aget_company_code_by_number(
+                task.tracking_number, task.courier_company, task.qr_code
+            )
+            tracking_result = await pipeline_engine.run_blocking(
+                PipelineStage.TRACKING, self.tracking_service.query_express, task.tracking_number, company_code
+            )
             print(f"物流查询结果: {tracking_result}")
             
             if tracking_result.get("success"):
-                # 更新物流数据 - 保存完整的tracking_result作为tracking_data
-                task.tracking_data = tracking_result
+                # 更新物流数据 - tracking_data 保存摘要，完整轨迹追加到 tracking_events
+                summary = TrackingEventService(self.db).record(
+                    tracking_result, task.tracking_data, task.tracking_number, company_code
+                )
+                if summary is not None:
+                    task.tracking_data = summary
                 task.delivery_status = tracking_result.get("current_status", "")
                 
                 # 检查物流状态
@@ -980,19 +1011,25 @@ class TaskService:
                         "tracking_data": task.tracking_data
                     })
                     
-                    # 触发后续处理（生成截图、回证等）- 异步执行
-                    asyncio.create_task(self._trigger_document_generation(task.task_id))
+                    # 提交到文档生成阶段（生成截图、回证等）
+                    await pipeline_engine.dispatch(PipelineStage.RENDER, task.task_id)
                 else:
                     # 保持TRACKING状态，等待后续检查
                     print(f"快递尚未签收 - 任务: {task.task_id}, 当前状态: {task.delivery_status}")
                     # 确保状态保持在TRACKING
                     task.status = TaskStatusEnum.TRACKING
+                    # 订阅快递100推送，后续状态由回调更新（定时轮询兜底）
+                    await self._subscribe_tracking(task, company_code)
+                
+                # 按物流阶段安排下一次定时查询（签收/退签后不再安排）
+                schedule_task(self.db, task, tracking_result, company_code)
                 
             else:
                 # 查询失败，但不标记任务失败，保持TRACKING状态等待重试
                 task.error_message = f"物流查询暂时失败: {tracking_result.get('message', '未知错误')}"
                 print(f"物流查询失败: {task.error_message}")
-                # 保持TRACKING状态，不设为FAILED
+                # 保持TRACKING状态，不设为FAILED，稍后由定时任务重试
+                schedule_task(self.db, task, tracking_result, company_code)
             
             self.db.commit()
             
@@ -1160,8 +1197,9 @@ class TaskService:
         """生成物流轨迹截图"""
         try:
             print(f"生成物流轨迹截图 - 任务: {task.task_id}")
-            screenshot_result = self.screenshot_service.generate_screenshot_from_tracking_data(
-                task.tracking_data
+            screenshot_result = await pipeline_engine.run_blocking(
+                PipelineStage.RENDER, self.screenshot_service.generate_screenshot_from_tracking_data,
+                TrackingEventService(self.db).expand(task.tracking_data)
             )
             
             if screenshot_result.get("success"):
@@ -1204,7 +1242,9 @@ class TaskService:
                 print(f"任务没有二维码内容，跳过标签生成 - 任务: {task.task_id}")
                 return False
                 
-            qr_result = self.qr_generation_service.generate_qr_barcode_label(task.qr_code)
+            qr_result = await pipeline_engine.run_blocking(
+                PipelineStage.RENDER, self.qr_generation_service.generate_qr_barcode_label, task.qr_code
+            )
             
             if qr_result.get("success"):
                 # 将二维码文件信息保存到任务的额外数据中
@@ -1278,7 +1318,9 @@ class TaskService:
             print(f"使用回证信息 - 文档标题: {doc_title}, 送达人: {sender}, 送达地点: {send_location}, 受送达人: {receiver}, 送达时间: {send_time_str}")
             
             # 4. 调用生成服务
-            receipt_result = self.receipt_generator_service.generate_delivery_receipt(
+            receipt_result = await pipeline_engine.run_blocking(
+                PipelineStage.RENDER,
+                self.receipt_generator_service.generate_delivery_receipt,
                 tracking_number=task.tracking_number,
                 doc_title=doc_title,
                 sender=sender,
@@ -0,0 +1,203 @@
+"""
+物流轨迹图片绘制（Pillow）
+按 TrackingScreenshotService.HTML_TEMPLATE 的固定版式直接绘制轨迹图片，不需要启动浏览器：
+- 宽1000像素的白色圆角卡片：邮件号行、当前状态/签收时间行、圆点+竖线时间线
+- 尺寸、内边距、字号、颜色与模板CSS一致，文字使用项目自带的仿宋_GB2312字体
+- 与Chrome截图的差异：模板字体为 "Helvetica Neue",Arial,sans-serif（中文由系统字体回退），
+  字形和字宽与仿宋_GB2312不同，长描述的换行位置及图片高度可能不同；卡片、分隔线、圆点和竖线的几何位置一致
+- 轨迹描述超出宽度时自动换行（中文按字、英文数字按词断行）
+"""
+
+import io
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = Path(__file__).resolve().parent.parent / "utils" / "legacy" / "仿宋_GB2312.ttf"
+# 绘制版式版本，修改版式后递增，截图缓存据此失效
+RENDER_VERSION = "1"
+
+# 与 HTML_TEMPLATE 中CSS一致的版式参数（像素）
+WIDTH = 1000
+RADIUS = 8
+ROW_PADDING = (16, 24)          # .tracking-no/.status/.timeline 的上下、左右内边距
+ITEM_INDENT = 40                # .timeline-item padding-left
+ITEM_GAP = 24                   # .timeline-item margin-bottom
+DOT_LEFT, DOT_SIZE = 16, 8
+LINE_LEFT, LINE_WIDTH, LINE_TOP, LINE_OVERHANG = 19, 2, 8, 16
+NORMAL_LINE_HEIGHT = 1.15       # line-height: normal
+DESC_LINE_HEIGHT = 1.4
+
+PAGE_BACKGROUND = "#f5f5f5"
+CARD_BACKGROUND = "#ffffff"
+TEXT_COLOR = "#333333"
+TIME_COLOR = "#666666"
+SIGN_TIME_COLOR = "#999999"
+BORDER_COLOR = "#eeeeee"
+DOT_COLOR = "#0074c8"
+LINE_COLOR = "#dddddd"
+
+# 断行单位：连续的英文/数字/符号作为一个词，其余（中文等）每个字符单独断行
+_TOKEN_PATTERN = re.compile(r"[\x21-\x7e]+|\s|.", re.S)
+# 不放在行首的标点（与浏览器的中文断行规则一致，放不下时跟随上一行）
+_CLOSING_PUNCTUATION = set("，。、；：！？）》」』】”’")
+
+
+@lru_cache(maxsize=16)
+def _font(size: int, font_path: str = str(FONT_PATH)) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(font_path, size)
+
+
+def _line_height(size: int, ratio: float = NORMAL_LINE_HEIGHT) -> int:
+    return round(size * ratio)
+
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: float) -> List[str]:
+    """按像素宽度断行（逐个断行单位累加宽度，每个单位只测量一次）"""
+    widths: Dict[str, float] = {}
+
+    def measure(token: str) -> float:
+        if token not in widths:
+            widths[token] = font.getlength(token)
+        return widths[token]
+
+    lines: List[str] = []
+    current, current_width = "", 0.0
+    for token in _TOKEN_PATTERN.findall(text or ""):
+        if token == "\n":
+            lines.append(current)
+            current, current_width = "", 0.0
+            continue
+        token_width = measure(token)
+        if current_width + token_width <= max_width or (current and token in _CLOSING_PUNCTUATION):
+            current += token
+            current_width += token_width
+            continue
+        # 放不下：当前行结束，行尾空白丢弃
+        if current.strip():
+            lines.append(current.rstrip())
+        current, current_width = "", 0.0
+        if token.isspace():
+            continue
+        if token_width <= max_width:
+            current, current_width = token, token_width
+            continue
+        # 单个词超过整行宽度时按字符拆开
+        for char in token:
+            char_width = measure(char)
+            if current and current_width + char_width > max_width:
+                lines.append(current)
+                current, current_width = "", 0.0
+            current += char
+            current_width += char_width
+    if current.strip() or not lines:
+        lines.append(current.rstrip())
+    return lines
+
+
+class TimelineRenderer:
+    """物流轨迹图片绘制器"""
+
+    def __init__(self, font_path: Optional[str] = None):
+        self.font_path = str(font_path or FONT_PATH)
+
+    def render(self, tracking_number: str, status: str, sign_time: Optional[str],
+               traces: List[Dict]) -> Image.Image:
+        """
+        绘制轨迹图片
+
+        Args:
+            tracking_number: 快递单号
+            status: 当前状态
+            sign_time: 签收时间
+            traces: 轨迹列表（time/context）
+
+        Returns:
+            RGB图片（宽1000像素，高度随轨迹条数和换行变化）
+        """
+        title_font, time_font, desc_font = self._fonts(16), self._fonts(14), self._fonts(15)
+        padding_y, padding_x = ROW_PADDING
+        row_height = padding_y * 2 + _line_height(16) + 1
+        desc_width = WIDTH - padding_x * 2 - ITEM_INDENT
+        items = [
+            (str(trace.get("time") or "—"), wrap_text(str(trace.get("context") or "—"), desc_font, desc_width))
+            for trace in traces
+        ]
+        item_heights = [
+            _line_height(14) + 4 + len(lines) * _line_height(15, DESC_LINE_HEIGHT) for _, lines in items
+        ]
+        height = row_height * 2 + padding_y * 2 + sum(item_heights) + ITEM_GAP * max(len(items) - 1, 0)
+
+        image = Image.new("RGB", (WIDTH, height), PAGE_BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        draw.rounded_rectangle((0, 0, WIDTH - 1, height - 1), radius=RADIUS, fill=CARD_BACKGROUND)
+
+        # 邮件号行
+        y = padding_y
+        x = padding_x + self._text(draw, (padding_x, y), "邮件号：", title_font, TEXT_COLOR) + 4
+        self._text(draw, (x, y), tracking_number, title_font, TEXT_COLOR, bold=True)
+        draw.line((0, row_height - 1, WIDTH - 1, row_height - 1), fill=BORDER_COLOR)
+
+        # 当前状态行（签收时间右对齐）
+        y = row_height + padding_y
+        x = padding_x + self._text(draw, (padding_x, y), "当前状态：", title_font, TEXT_COLOR, bold=True) + 8
+        self._text(draw, (x, y), status or "", title_font, TEXT_COLOR)
+        sign_text = f"签收时间：{sign_time or '—'}"
+        sign_x = WIDTH - padding_x - time_font.getlength(sign_text)
+        self._text(draw, (sign_x, y), sign_text, time_font, SIGN_TIME_COLOR, line_size=16)
+        draw.line((0, row_height * 2 - 1, WIDTH - 1, row_height * 2 - 1), fill=BORDER_COLOR)
+
+        # 时间线
+        y = row_height * 2 + padding_y
+        left = padding_x
+        for index, ((time_text, lines), item_height) in enumerate(zip(items, item_heights)):
+            if index < len(items) - 1:
+                draw.rectangle((left + LINE_LEFT, y + LINE_TOP,
+                                left + LINE_LEFT + LINE_WIDTH - 1, y + item_height + LINE_OVERHANG - 1),
+                               fill=LINE_COLOR)
+            draw.ellipse((left + DOT_LEFT, y, left + DOT_LEFT + DOT_SIZE - 1, y + DOT_SIZE - 1), fill=DOT_COLOR)
+            text_x = left + ITEM_INDENT
+            self._text(draw, (text_x, y), time_text, time_font, TIME_COLOR)
+            line_y = y + _line_height(14) + 4
+            for line in lines:
+                self._text(draw, (text_x, line_y), line, desc_font, TEXT_COLOR, line_ratio=DESC_LINE_HEIGHT)
+                line_y += _line_height(15, DESC_LINE_HEIGHT)
+            y += item_height + ITEM_GAP
+        return image
+
+    def render_png(self, tracking_number: str, status: str, sign_time: Optional[str],
+                   traces: List[Dict]) -> bytes:
+        """绘制轨迹图片并编码为PNG"""
+        buffer = io.BytesIO()
+        self.render(tracking_number, status, sign_time, traces).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _fonts(self, size: int) -> ImageFont.FreeTypeFont:
+        return _font(size, self.font_path)
+
+    @staticmethod
+    def _text(draw: ImageDraw.ImageDraw, position: Tuple[float, float], text: str,
+              font: ImageFont.FreeTypeFont, fill: str, bold: bool = False,
+              line_size: Optional[int] = None, line_ratio: float = NORMAL_LINE_HEIGHT) -> float:
+        """
+        在行框内按基线绘制一行文字（行高多出的部分上下平分，与浏览器一致），返回文字宽度
+
+        bold 时横向错开1像素重复绘制（仿宋_GB2312没有粗体字形，合成粗体）
+        """
+        x, y = position
+        ascent, descent = font.getmetrics()
+        box = _line_height(line_size or font.size, line_ratio)
+        baseline = y + (box - ascent - descent) / 2 + ascent
+        draw.text((x, baseline), text, font=font, fill=fill, anchor="ls")
+        width = font.getlength(text)
+        if bold:
+            draw.text((x + 1, baseline), text, font=font, fill=fill, anchor="ls")
+            width += 1
+        return width
+
+
+# 全局绘制器（字体对象按字号缓存）
+timeline_renderer = TimelineRenderer()
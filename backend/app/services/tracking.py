@@ -4,11 +4,13 @@ from datetime import datetime, timedelta
 
 from app.models.tracking import TrackingInfo
 from app.models.delivery_receipt import DeliveryReceipt
+from app.services.tracking_events import TrackingEventService
 
 
 class TrackingService:
     def __init__(self, db: Session):
         self.db = db
+        self.event_service = TrackingEventService(db)
 
     def get_tracking_by_receipt_id(self, receipt_id: int) -> Optional[TrackingInfo]:
         """根据送达回证ID获取物流信息"""
@@ -40,7 +42,11 @@ class TrackingService:
         tracking_data: dict,
         notes: str = None
     ) -> TrackingInfo:
-        """创建或更新物流跟踪信息"""
+        """
+        创建或更新物流跟踪信息
+        
+        tracking_data 只保存摘要，轨迹追加到 tracking_events；轨迹和状态未变化时只更新查询时间
+        """
         tracking = self.get_tracking_by_receipt_id(receipt_id)
         
         # 从tracking_data中提取签收状态
@@ -49,10 +55,22 @@ class TrackingService:
         
         current_time = datetime.utcnow()
         
+        summary = tracking_data
+        if "traces" in tracking_data:
+            receipt = self.db.get(DeliveryReceipt, receipt_id)
+            summary = self.event_service.record(
+                tracking_data,
+                tracking.tracking_data if tracking else None,
+                tracking_number=receipt.tracking_number if receipt else None
+            )
+        elif tracking and tracking.tracking_data == tracking_data:
+            summary = None
+        
         if tracking:
-            # 更新现有记录
+            # 更新现有记录（查询时间每次更新，用于判断缓存是否新鲜）
             tracking.current_status = current_status
-            tracking.tracking_data = tracking_data
+            if summary is not None:
+                tracking.tracking_data = summary
             tracking.last_update = current_time
             tracking.is_signed = is_signed
             if notes:
@@ -62,7 +80,7 @@ class TrackingService:
             tracking = TrackingInfo(
                 delivery_receipt_id=receipt_id,
                 current_status=current_status,
-                tracking_data=tracking_data,
+                tracking_data=summary,
                 last_update=current_time,
                 is_signed=is_signed,
                 notes=notes
@@ -73,6 +91,12 @@ class TrackingService:
         self.db.refresh(tracking)
         return tracking
     
+    def get_tracking_data(self, tracking_info: TrackingInfo) -> Optional[dict]:
+        """读取物流数据（摘要补充 tracking_events 中的完整轨迹）"""
+        if not tracking_info or not tracking_info.tracking_data:
+            return None
+        return self.event_service.expand(tracking_info.tracking_data)
+    
     def update_screenshot_info(
         self,
         tracking_number: str,
@@ -0,0 +1,348 @@
+"""
+物流批量查询引擎
+- 令牌桶限制每秒请求数，与快递100的QPS配额一致：桶状态保存在Redis中，所有API进程和Celery worker
+  共用同一个配额；Redis不可用时退化为进程内令牌桶，速率按配置的进程数均分。
+  令牌在实际请求上游时获取（ExpressTrackingService._afetch_express），缓存命中和合并的请求不消耗配额
+- 并发数按 AIMD 自适应：查询成功时缓慢增加，收到限流回复（IntelligentRetryHandler 归类为
+  API_RATE_LIMIT 的错误）时减半，并暂停令牌桶一段时间
+- 被限流的单号在冷却后重新排队查询，结果按输入顺序返回
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.tasks.retry_handler import ErrorCategory
+
+logger = logging.getLogger(__name__)
+
+QueryFunc = Callable[[str, str], Awaitable[Dict[str, Any]]]
+
+BUCKET_PREFIX = "rate_limit:"
+# Redis 不可用时暂停访问的秒数
+REDIS_RETRY_INTERVAL = 30
+# 令牌桶状态：tokens 可为负数（已预留、尚在等待的请求），返回调用方需要等待的秒数
+RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'paused_until')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+local paused_until = tonumber(state[3]) or 0
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate) - 1
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+wait = math.max(wait, paused_until - now)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate + wait) + 60)
+return tostring(wait)
+"""
+PAUSE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local until_at = now + tonumber(ARGV[1])
+local paused_until = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+redis.call('HSET', KEYS[1], 'paused_until', tostring(math.max(paused_until, until_at)))
+if tokens and tokens > 0 then
+    redis.call('HSET', KEYS[1], 'tokens', '0')
+end
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+return 1
+"""
+
+
+class TokenBucket:
+    """令牌桶限速器（基于单调时钟，可跨事件循环和线程共享）"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = max(0.1, float(rate))
+        self.capacity = float(max(1, burst or int(rate) or 1))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预留一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._paused_until - now)
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """收到限流回复后暂停发放令牌，并清空桶内积累的令牌"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+class RedisTokenBucket(TokenBucket):
+    """
+    Redis共享令牌桶（Lua脚本原子地补充和预留令牌，使用Redis服务器时钟）
+
+    限流暂停同样写入Redis，一个进程收到限流回复后所有进程一起暂停
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None, redis_url: Optional[str] = None,
+                 name: str = "kuaidi100", processes: int = 1):
+        super().__init__(rate, burst)
+        self.redis_url = redis_url
+        self.key = f"{BUCKET_PREFIX}{name}"
+        processes = max(1, processes)
+        self._local = TokenBucket(self.rate / processes, max(1, int(self.capacity / processes)))
+        self._redis = None
+        self._redis_down_until = 0.0
+
+    def _get_redis(self):
+        if not self.redis_url or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            try:
+                import redis
+
+                self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+            except Exception as e:
+                logger.warning(f"限速器无法连接Redis，使用进程内令牌桶: {e}")
+                self.redis_url = None
+                return None
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+        logger.warning(f"限速器访问Redis失败，{REDIS_RETRY_INTERVAL}秒内使用进程内令牌桶: {error}")
+
+    def _reserve(self) -> float:
+        client = self._get_redis()
+        if client is not None:
+            try:
+                return float(client.eval(RESERVE_SCRIPT, 1, self.key, self.rate, self.capacity))
+            except Exception as e:
+                self._redis_failed(e)
+        return self._local._reserve()
+
+    async def acquire(self):
+        # Redis 调用放到线程中执行，不阻塞事件循环
+        wait = await asyncio.to_thread(self._reserve)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        self._local.pause(seconds)
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            client.eval(PAUSE_SCRIPT, 1, self.key, seconds)
+        except Exception as e:
+            self._redis_failed(e)
+
+
+class AdaptiveConcurrency:
+    """AIMD 并发上限控制"""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: Optional[int] = None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or initial)
+        self._limit = float(min(max(initial, self.minimum), self.maximum))
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def on_success(self):
+        # 每完成约 limit 个请求并发数加1
+        with self._lock:
+            self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+
+    def on_rate_limited(self):
+        with self._lock:
+            self._limit = max(self.minimum, self._limit / 2)
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """进程内常驻的后台事件循环（fork 后的子进程重新创建）"""
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid() or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="tracking-async-loop", daemon=True).start()
+            _loop, _loop_pid = loop, os.getpid()
+        return _loop
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """
+    在同步代码中运行协程（Celery任务等）
+
+    协程提交到进程内常驻的后台事件循环执行，绑定在该循环上的 httpx.AsyncClient 连接池
+    在多次调用之间复用（keep-alive/HTTP2），不会像每次 asyncio.run 那样新建后泄漏
+    """
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("不能在后台事件循环中同步等待协程，请直接 await")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def is_rate_limited(result: Dict[str, Any]) -> bool:
+    """查询结果是否为限流回复"""
+    return not result.get("success") and result.get("error_category") == ErrorCategory.API_RATE_LIMIT.value
+
+
+class BatchQueryEngine:
+    """并发批量查询引擎"""
+
+    def __init__(self, bucket: TokenBucket, concurrency: AdaptiveConcurrency,
+                 rate_limit_cooldown: float = 2.0, max_rate_limit_retries: int = 3):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self._stats_lock = threading.Lock()
+        self._stats = {"queries": 0, "rate_limited": 0, "batches": 0}
+
+    @classmethod
+    def from_settings(cls) -> "BatchQueryEngine":
+        if settings.TRACKING_RATE_LIMIT_BACKEND == "redis":
+            bucket = RedisTokenBucket(
+                settings.KUAIDI100_QPS, settings.KUAIDI100_BURST,
+                redis_url=settings.REDIS_URL, processes=settings.TRACKING_RATE_LIMIT_PROCESSES
+            )
+        else:
+            bucket = TokenBucket(settings.KUAIDI100_QPS, settings.KUAIDI100_BURST)
+        return cls(
+            bucket,
+            AdaptiveConcurrency(
+                settings.TRACKING_BATCH_CONCURRENCY,
+                minimum=1,
+                maximum=settings.TRACKING_BATCH_MAX_CONCURRENCY
+            ),
+            rate_limit_cooldown=settings.TRACKING_RATE_LIMIT_COOLDOWN
+        )
+
+    async def run(self, query: QueryFunc, items: Sequence[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        并发查询 (单号, 快递公司编码) 列表
+
+        Args:
+            query: 异步查询函数，通常为 ExpressTrackingService._acoalesced_fetch（请求上游前自行获取令牌）
+            items: 待查询的 (tracking_number, company_code) 列表
+
+        Returns:
+            与 items 顺序一致的查询结果列表
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        if not items:
+            return []
+
+        queue: "asyncio.Queue[Tuple[int, int]]" = asyncio.Queue()
+        for index in range(len(items)):
+            queue.put_nowait((index, 0))
+
+        condition = asyncio.Condition()
+        active = 0
+        remaining = len(items)
+
+        async def worker():
+            nonlocal active, remaining
+            while True:
+                async with condition:
+                    await condition.wait_for(
+                        lambda: remaining == 0 or (not queue.empty() and active < self.concurrency.limit)
+                    )
+                    if remaining == 0:
+                        return
+                    index, attempt = queue.get_nowait()
+                    active += 1
+
+                tracking_number, company_code = items[index]
+                try:
+                    result = await query(tracking_number, company_code)
+                except Exception as e:
+                    result = {
+                        "success": False,
+                        "error": f"查询过程中发生错误: {str(e)}",
+                        "tracking_number": tracking_number,
+                        "company_code": company_code
+                    }
+
+                retry = False
+                if is_rate_limited(result):
+                    self.concurrency.on_rate_limited()
+                    await asyncio.to_thread(self.bucket.pause, self.rate_limit_cooldown * (attempt + 1))
+                    self._count("rate_limited")
+                    retry = attempt < self.max_rate_limit_retries
+                    logger.warning(
+                        f"快递100限流: {tracking_number}，并发降至 {self.concurrency.limit}"
+                        + ("，稍后重试" if retry else "")
+                    )
+                elif result.get("success"):
+                    self.concurrency.on_success()
+                self._count("queries")
+
+                async with condition:
+                    active -= 1
+                    if retry:
+                        queue.put_nowait((index, attempt + 1))
+                    else:
+                        results[index] = result
+                        remaining -= 1
+                    condition.notify_all()
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency.maximum, len(items)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        self._count("batches")
+        return results
+
+    def run_sync(self, query: QueryFunc, items: Sequence[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """同步入口（Celery任务等非异步代码使用）"""
+        return run_sync(self.run(query, items))
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            "qps": self.bucket.rate,
+            "burst": self.bucket.capacity,
+            "concurrency_limit": self.concurrency.limit,
+            "max_concurrency": self.concurrency.maximum
+        })
+        return stats
+
+
+# 全局批量查询引擎（限速器通过Redis在进程间共享）
+batch_query_engine = BatchQueryEngine.from_settings()
@@ -0,0 +1,334 @@
+"""
+物流查询结果分级缓存
+- 一级：进程内 LRU；二级：Redis（多容器/多worker共享）；三级：可选的磁盘目录
+- 有效期按物流状态区分：已签收、退签等终态长期缓存，在途状态短期缓存
+- 支持批量读写（Redis 使用 MGET/pipeline），按级别统计命中率
+- 低级别命中时按剩余有效期回填到高级别缓存（Redis命中回填进程内，磁盘命中回填进程内和Redis）
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "tracking_cache:"
+# 快递100状态码：3 已签收，4 退签，14 拒签
+FINAL_STATES = {"3", "4", "14"}
+# Redis 不可用时暂停访问的秒数，避免每次查询都等待连接超时
+REDIS_RETRY_INTERVAL = 30
+
+CacheKey = Tuple[str, str]
+
+
+class TrackingCache:
+    """物流查询结果缓存"""
+
+    def __init__(self, max_items: int = 2048, backend: str = "memory", redis_url: Optional[str] = None,
+                 disk_dir: Optional[str] = None, final_ttl: int = 7 * 24 * 3600, transit_ttl: int = 30 * 60):
+        self.max_items = max(1, max_items)
+        self.backend = backend
+        self.redis_url = redis_url
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.final_ttl = final_ttl
+        self.transit_ttl = transit_ttl
+
+        # key -> (过期时间戳, 快递100原始结果)
+        self._items: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._stats = {"memory_hits": 0, "redis_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0}
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls) -> "TrackingCache":
+        """根据配置创建缓存"""
+        return cls(
+            max_items=settings.TRACKING_CACHE_MAX_ITEMS,
+            backend=settings.TRACKING_CACHE_BACKEND,
+            redis_url=settings.REDIS_URL,
+            disk_dir=settings.TRACKING_CACHE_DISK_DIR or None,
+            final_ttl=settings.TRACKING_CACHE_FINAL_TTL,
+            transit_ttl=settings.TRACKING_CACHE_TRANSIT_TTL
+        )
+
+    @staticmethod
+    def make_key(tracking_number: str, company_code: str) -> str:
+        return f"{company_code}:{tracking_number}"
+
+    def ttl_for(self, data: Dict[str, Any]) -> int:
+        """按物流状态确定缓存有效期"""
+        return self.final_ttl if str(data.get("state")) in FINAL_STATES else self.transit_ttl
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def get(self, tracking_number: str, company_code: str, record_stats: bool = True) -> Optional[Dict[str, Any]]:
+        """查询单个单号的缓存"""
+        return self.get_many([(tracking_number, company_code)], record_stats).get((tracking_number, company_code))
+
+    def get_many(self, items: Iterable[CacheKey], record_stats: bool = True) -> Dict[CacheKey, Dict[str, Any]]:
+        """
+        批量查询缓存
+
+        Args:
+            items: (tracking_number, company_code) 列表
+            record_stats: 是否计入命中统计（轮询等待时不计入）
+
+        Returns:
+            命中的 {(tracking_number, company_code): 原始结果}
+        """
+        keys = {self.make_key(number, company): (number, company) for number, company in items}
+        found: Dict[str, Dict[str, Any]] = {}
+
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._items.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._items[key]
+                    continue
+                self._items.move_to_end(key)
+                found[key] = entry[1]
+        if record_stats:
+            self._count("memory_hits", len(found))
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            from_redis = self._redis_get_many(missing)
+            if record_stats:
+                self._count("redis_hits", len(from_redis))
+            found.update(from_redis)
+            missing = [key for key in missing if key not in from_redis]
+
+        if missing and self.disk_dir:
+            from_disk = {}
+            backfill = []
+            for key in missing:
+                record = self._disk_get(key)
+                if record is not None:
+                    from_disk[key] = record[0]
+                    backfill.append((key, record[0], record[1]))
+            self._redis_set_many(backfill)
+            if record_stats:
+                self._count("disk_hits", len(from_disk))
+            found.update(from_disk)
+            missing = [key for key in missing if key not in from_disk]
+
+        if record_stats:
+            self._count("misses", len(missing))
+        return {keys[key]: value for key, value in found.items()}
+
+    def _redis_get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        client = self._get_redis()
+        if client is None:
+            return {}
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.mget([KEY_PREFIX + key for key in keys])
+            for key in keys:
+                pipe.ttl(KEY_PREFIX + key)
+            raw_values, *ttls = pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+            return {}
+
+        found = {}
+        for key, raw, ttl in zip(keys, raw_values, ttls):
+            if raw is None:
+                continue
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                continue
+            found[key] = value
+            # 按Redis剩余有效期回填进程内缓存
+            self._remember(key, value, ttl if ttl and ttl > 0 else self.transit_ttl)
+        return found
+
+    def _disk_get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """读取磁盘缓存，返回 (结果, 剩余有效期秒数)"""
+        try:
+            with self._disk_path(key).open("r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        remaining = record.get("expires_at", 0) - time.time()
+        if remaining <= 0:
+            return None
+        value = record.get("data")
+        self._remember(key, value, remaining)
+        return value, remaining
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def set(self, tracking_number: str, company_code: str, data: Dict[str, Any]):
+        """写入单个单号的查询结果"""
+        self.set_many({(tracking_number, company_code): data})
+
+    def set_many(self, entries: Dict[CacheKey, Dict[str, Any]]):
+        """批量写入查询结果，各条按自身物流状态设置有效期"""
+        if not entries:
+            return
+        records = []
+        for (number, company), data in entries.items():
+            key = self.make_key(number, company)
+            ttl = self.ttl_for(data)
+            self._remember(key, data, ttl)
+            records.append((key, data, ttl))
+        self._count("sets", len(records))
+
+        self._redis_set_many(records)
+
+        if self.disk_dir:
+            for key, data, ttl in records:
+                self._disk_set(key, data, ttl)
+
+    def _redis_set_many(self, records: List[Tuple[str, Dict[str, Any], float]]):
+        if not records:
+            return
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, data, ttl in records:
+                pipe.set(KEY_PREFIX + key, json.dumps(data, ensure_ascii=False), ex=max(1, int(ttl)))
+            pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+
+    def _disk_set(self, key: str, data: Dict[str, Any], ttl: int):
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump({"expires_at": time.time() + ttl, "data": data}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入物流磁盘缓存失败: {e}")
+
+    def _remember(self, key: str, value: Dict[str, Any], ttl: float):
+        with self._lock:
+            self._items[key] = (time.time() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # 清理
+    # ------------------------------------------------------------------
+    def delete(self, tracking_number: str, company_code: Optional[str] = None) -> int:
+        """删除单号的缓存，company_code 为空时删除该单号所有快递公司的缓存，返回删除条数"""
+        suffix = f":{tracking_number}"
+        pattern = self.make_key(tracking_number, company_code) if company_code else f"*{suffix}"
+        with self._lock:
+            keys = [key for key in self._items
+                    if (key == pattern if company_code else key.endswith(suffix))]
+            for key in keys:
+                del self._items[key]
+        return max(len(keys), self._delete_external(pattern))
+
+    def clear(self) -> int:
+        """清空所有级别的缓存，返回删除条数"""
+        with self._lock:
+            count = len(self._items)
+            self._items.clear()
+        return max(count, self._delete_external("*"))
+
+    def _delete_external(self, pattern: str) -> int:
+        deleted = 0
+        client = self._get_redis()
+        if client is not None:
+            try:
+                keys = list(client.scan_iter(match=KEY_PREFIX + pattern, count=500))
+                if keys:
+                    deleted = client.delete(*keys)
+            except Exception as e:
+                self._redis_failed(e)
+
+        if self.disk_dir:
+            disk_deleted = 0
+            for path in self.disk_dir.glob(self._disk_name(pattern)):
+                try:
+                    path.unlink()
+                    disk_deleted += 1
+                except OSError:
+                    pass
+            deleted = max(deleted, disk_deleted)
+        return deleted
+
+    # ------------------------------------------------------------------
+    # 内部工具
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _disk_name(key: str) -> str:
+        return key.replace(":", "_") + ".json"
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / self._disk_name(key)
+
+    def _get_redis(self):
+        if self.backend != "redis" or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            try:
+                import redis
+
+                self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+            except Exception as e:
+                logger.warning(f"物流缓存无法连接Redis，仅使用进程内缓存: {e}")
+                self.backend = "memory"
+                return None
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+        logger.warning(f"物流缓存访问Redis失败，{REDIS_RETRY_INTERVAL}秒内仅使用本地缓存: {error}")
+
+    def _count(self, key: str, amount: int = 1):
+        if amount:
+            with self._lock:
+                self._stats[key] += amount
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各级缓存命中统计（当前进程）"""
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._items)
+
+        hits = stats["memory_hits"] + stats["redis_hits"] + stats["disk_hits"]
+        total = hits + stats["misses"]
+        stats.update({
+            "backend": self.backend,
+            "disk_enabled": self.disk_dir is not None,
+            "hits": hits,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "local_items": size,
+            "max_items": self.max_items,
+            "final_ttl": self.final_ttl,
+            "transit_ttl": self.transit_ttl
+        })
+        return stats
+
+
+# 全局物流查询缓存实例
+tracking_cache = TrackingCache.from_settings()
@@ -0,0 +1,214 @@
+"""
+物流轨迹增量存储
+- Task.tracking_data / TrackingInfo.tracking_data 只保存精简摘要（状态、签收信息、最新一条轨迹、轨迹指纹），
+  不再保存完整的快递100响应（raw_data）和轨迹列表
+- 每条物流轨迹保存为 tracking_events 表的一行，按 MD5(时间|描述) 去重，只追加新事件
+  （INSERT ... ON CONFLICT DO NOTHING，多个任务共用一个单号或推送与轮询同时写入时不会因唯一约束失败）
+- 轨迹指纹和状态都未变化时跳过写入，避免每次刷新都重写整个JSON字段
+- 读取方通过 expand() 还原带 traces 的完整数据；旧数据（已包含 traces）原样返回
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.tracking import TrackingEvent
+
+logger = logging.getLogger(__name__)
+
+# 不写入摘要的字段（完整轨迹存入 tracking_events，原始响应不再保存）
+OMITTED_FIELDS = ("traces", "raw_data")
+# 判断“是否变化”时比较的字段（last_update 每次查询都会变化，不参与比较）
+COMPARED_FIELDS = ("trace_fingerprint", "current_status", "is_signed", "sign_time", "state")
+# Session.info 中记录本事务已写入的事件（同一会话内多个服务实例共享，事务结束时清除）
+SESSION_SEEN_KEY = "tracking_event_hashes"
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _clear_seen_events(session: Session, transaction):
+    if transaction.parent is None:
+        session.info.pop(SESSION_SEEN_KEY, None)
+
+
+def _trace_time(trace: Dict[str, Any]) -> str:
+    # 快递100为 time/ftime，快递鸟为 AcceptTime
+    return str(trace.get("time") or trace.get("ftime") or trace.get("AcceptTime") or "")
+
+
+def _trace_context(trace: Dict[str, Any]) -> str:
+    return str(trace.get("context") or trace.get("AcceptStation") or "")
+
+
+def event_hash(trace: Dict[str, Any]) -> str:
+    """单条轨迹的去重键"""
+    key = f"{_trace_time(trace)}|{_trace_context(trace)}"
+    if key == "|":
+        key = json.dumps(trace, ensure_ascii=False, sort_keys=True)
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def trace_fingerprint(traces: Optional[List[Dict[str, Any]]]) -> str:
+    """整个轨迹列表的指纹（任意一条轨迹增删改都会改变指纹）"""
+    digest = hashlib.md5()
+    for trace in traces or []:
+        digest.update(event_hash(trace).encode())
+    return digest.hexdigest()
+
+
+def summarize(tracking_result: Dict[str, Any]) -> Dict[str, Any]:
+    """把查询结果压缩为摘要（去掉轨迹列表和原始响应，其余字段保留）"""
+    traces = tracking_result.get("traces") or []
+    raw = tracking_result.get("raw_data") or {}
+    summary = {key: value for key, value in tracking_result.items() if key not in OMITTED_FIELDS}
+    summary.update({
+        "state": str(raw.get("state", tracking_result.get("state", ""))),
+        "traces_count": len(traces),
+        "latest_trace": traces[0] if traces else None,
+        "trace_fingerprint": trace_fingerprint(traces)
+    })
+    return summary
+
+
+def _parse_trace_time(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+class TrackingEventService:
+    """物流轨迹增量存储服务"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record(self, tracking_result: Dict[str, Any], previous: Optional[Dict[str, Any]] = None,
+               tracking_number: Optional[str] = None, company_code: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        记录一次物流查询结果
+
+        Args:
+            tracking_result: 查询结果（含 traces）
+            previous: 当前保存的 tracking_data（摘要或旧版完整数据）
+            tracking_number: 快递单号（查询结果中没有时使用）
+            company_code: 快递公司编码（查询结果中没有时使用）
+
+        Returns:
+            需要写入 tracking_data 的新摘要；轨迹和状态都未变化时返回 None（调用方跳过写入）
+        """
+        previous = previous if isinstance(previous, dict) else None
+        summary = summarize(tracking_result)
+        summary["tracking_number"] = summary.get("tracking_number") or tracking_number or ""
+        summary["company_code"] = (
+            summary.get("company_code") or summary.get("courier_code") or company_code or "ems"
+        )
+        if previous and "traces" not in previous and all(
+            previous.get(field) == summary[field] for field in COMPARED_FIELDS
+        ):
+            return None
+
+        if previous is None or previous.get("trace_fingerprint") != summary["trace_fingerprint"]:
+            self.append_events(summary["tracking_number"], summary["company_code"], tracking_result.get("traces") or [])
+        return summary
+
+    def append_events(self, tracking_number: str, company_code: str, traces: List[Dict[str, Any]]) -> int:
+        """追加尚未保存的轨迹事件，返回新增条数（不提交事务）"""
+        if not tracking_number or not traces:
+            return 0
+
+        seen = self.db.info.setdefault(SESSION_SEEN_KEY, {}).get((tracking_number, company_code))
+        if seen is None:
+            seen = {
+                row[0] for row in self.db.query(TrackingEvent.event_hash).filter(
+                    TrackingEvent.tracking_number == tracking_number,
+                    TrackingEvent.company_code == company_code
+                )
+            }
+            self.db.info[SESSION_SEEN_KEY][(tracking_number, company_code)] = seen
+
+        rows = []
+        now = datetime.utcnow()
+        # 快递100按时间倒序返回，按时间正序插入使同一时间的事件按ID保持原顺序
+        for trace in reversed(traces):
+            digest = event_hash(trace)
+            if digest in seen:
+                continue
+            seen.add(digest)
+            rows.append({
+                "tracking_number": tracking_number,
+                "company_code": company_code,
+                "event_time": _parse_trace_time(_trace_time(trace)),
+                "status": str(trace.get("status") or "")[:50],
+                "context": _trace_context(trace),
+                "trace": trace,
+                "event_hash": digest,
+                "created_at": now,
+                "updated_at": now
+            })
+
+        added = self._insert_ignoring_duplicates(rows) if rows else 0
+        if added:
+            logger.debug(f"快递单号 {tracking_number} 新增 {added} 条物流轨迹")
+        return added
+
+    def _insert_ignoring_duplicates(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        立即插入事件行，已存在（其他任务或其他进程先写入）的跳过，返回实际插入条数
+
+        PostgreSQL/SQLite 使用 ON CONFLICT DO NOTHING；其他数据库逐行使用保存点
+        """
+        dialect = self.db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            statement = insert(TrackingEvent).values(rows).on_conflict_do_nothing(
+                index_elements=["tracking_number", "company_code", "event_hash"]
+            )
+            return max(self.db.execute(statement).rowcount or 0, 0)
+
+        added = 0
+        for row in rows:
+            try:
+                with self.db.begin_nested():
+                    self.db.add(TrackingEvent(**row))
+                added += 1
+            except IntegrityError:
+                continue
+        return added
+
+    def get_traces(self, tracking_number: str, company_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间倒序读取轨迹（与快递100返回顺序一致）"""
+        query = self.db.query(TrackingEvent).filter(TrackingEvent.tracking_number == tracking_number)
+        if company_code:
+            query = query.filter(TrackingEvent.company_code == company_code)
+        events = query.order_by(TrackingEvent.event_time.desc().nullslast(), TrackingEvent.id.desc()).all()
+        return [event.trace for event in events]
+
+    def expand(self, tracking_data: Any) -> Any:
+        """
+        还原带 traces 的物流数据（供前端展示、截图和回证生成使用）
+
+        旧数据已包含 traces 时原样返回；摘要数据返回补充了 traces 的副本
+        """
+        if isinstance(tracking_data, str):
+            try:
+                tracking_data = json.loads(tracking_data)
+            except ValueError:
+                return tracking_data
+        if not isinstance(tracking_data, dict) or "traces" in tracking_data:
+            return tracking_data
+
+        expanded = dict(tracking_data)
+        tracking_number = expanded.get("tracking_number")
+        expanded["traces"] = self.get_traces(tracking_number, expanded.get("company_code")) if tracking_number else []
+        return expanded
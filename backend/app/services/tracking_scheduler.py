@@ -0,0 +1,198 @@
+"""
+物流刷新调度
+- 每个跟踪中的任务保存下一次查询时间 Task.next_check_at，定时任务只取已到期的行
+  （索引 idx_tasks_status_next_check）
+- 查询间隔根据物流阶段（揽收、在途、派件）、最近一条物流记录距今的时间，
+  以及该快递公司的典型签收耗时计算：
+    * 派件中很快会签收，短间隔查询
+    * 在途且接近典型签收耗时的包裹加密查询，远未到期的降低频率
+    * 长时间没有新物流记录的包裹逐步退避
+- 已签收/退签的任务不再安排查询
+"""
+
+import hashlib
+import logging
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.task import Task, TaskStatusEnum
+
+logger = logging.getLogger(__name__)
+
+# 快递100状态码
+STATE_IN_TRANSIT = "0"
+STATE_COLLECTED = "1"
+STATE_PROBLEM = "2"
+STATE_DELIVERING = "5"
+FINAL_STATES = {"3", "4", "14"}
+
+# 各阶段的基础查询间隔（分钟）
+PHASE_INTERVALS = {
+    "pending": 120,        # 尚无物流记录
+    "collected": 180,      # 已揽收
+    "in_transit": 240,     # 在途，距典型签收时间尚远
+    "due_soon": 60,        # 在途，已接近典型签收时间
+    "delivering": 30,      # 派件中
+    "problem": 360,        # 疑难件
+}
+
+# 未统计到历史数据时各快递公司的典型签收耗时（小时）
+DEFAULT_SIGN_LATENCY_HOURS = {
+    "ems": 72,
+    "shunfeng": 36,
+    "sf": 36,
+    "zhongtong": 60,
+    "zt": 60,
+    "yuantong": 60,
+    "yt": 60,
+    "shentong": 60,
+    "sto": 60,
+    "yunda": 60,
+    "yd": 60,
+}
+FALLBACK_SIGN_LATENCY_HOURS = 72
+# 最近一条物流记录超过该时长视为停滞，开始退避
+STALE_AFTER_HOURS = 24
+
+
+class CarrierLatencyStats:
+    """按快递公司统计的典型签收耗时（近期已签收任务的中位数，定期刷新）"""
+
+    def __init__(self, ttl: float = 6 * 3600, window_days: int = 30, min_samples: int = 20):
+        self.ttl = ttl
+        self.window_days = window_days
+        self.min_samples = min_samples
+        self._latency: Dict[str, float] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, company_code: str) -> float:
+        """返回典型签收耗时（小时）"""
+        with self._lock:
+            stale = time.monotonic() - self._loaded_at >= self.ttl
+        if stale:
+            self.refresh(db)
+        code = (company_code or "ems").lower()
+        return self._latency.get(code) or DEFAULT_SIGN_LATENCY_HOURS.get(code, FALLBACK_SIGN_LATENCY_HOURS)
+
+    def refresh(self, db: Session):
+        since = datetime.now() - timedelta(days=self.window_days)
+        try:
+            rows = db.query(Task.courier_company, Task.created_at, Task.delivery_time).filter(
+                Task.status.in_([TaskStatusEnum.DELIVERED, TaskStatusEnum.GENERATING, TaskStatusEnum.COMPLETED]),
+                Task.delivery_time.isnot(None),
+                Task.created_at >= since
+            ).limit(5000).all()
+        except Exception as e:
+            logger.warning(f"统计快递签收耗时失败，使用默认值: {e}")
+            rows = []
+
+        samples: Dict[str, List[float]] = {}
+        for courier_company, created_at, delivery_time in rows:
+            if not created_at or not delivery_time or delivery_time <= created_at:
+                continue
+            code = (courier_company or "ems").lower()
+            samples.setdefault(code, []).append((delivery_time - created_at).total_seconds() / 3600)
+
+        latency = {
+            code: statistics.median(values)
+            for code, values in samples.items() if len(values) >= self.min_samples
+        }
+        with self._lock:
+            self._latency = latency
+            self._loaded_at = time.monotonic()
+
+
+carrier_latency_stats = CarrierLatencyStats()
+
+
+def _parse_trace_time(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def classify_phase(tracking_result: Dict[str, Any], age_hours: float, latency_hours: float) -> str:
+    """根据快递100状态判断物流阶段"""
+    raw = tracking_result.get("raw_data") or {}
+    state = str(raw.get("state", ""))
+    if not tracking_result.get("traces"):
+        return "pending"
+    if state == STATE_DELIVERING:
+        return "delivering"
+    if state == STATE_COLLECTED:
+        return "collected"
+    if state == STATE_PROBLEM:
+        return "problem"
+    # 在途：已接近典型签收耗时则加密查询
+    return "due_soon" if age_hours >= latency_hours * 0.7 else "in_transit"
+
+
+def compute_next_check(task: Task, tracking_result: Dict[str, Any], latency_hours: float,
+                       now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    计算下一次查询时间
+
+    Args:
+        task: 任务
+        tracking_result: ExpressTrackingService 格式化后的查询结果
+        latency_hours: 该快递公司的典型签收耗时
+        now: 当前时间
+
+    Returns:
+        下一次查询时间；已签收/退签返回 None
+    """
+    now = now or datetime.now()
+    raw = tracking_result.get("raw_data") or {}
+    if tracking_result.get("is_signed") or str(raw.get("state", "")) in FINAL_STATES:
+        return None
+
+    age_hours = (now - task.created_at).total_seconds() / 3600 if task.created_at else 0.0
+    phase = classify_phase(tracking_result, age_hours, latency_hours)
+    interval = float(PHASE_INTERVALS[phase])
+
+    # 最近一条物流记录长时间没有变化时逐步退避（每多停滞一天间隔翻倍）
+    traces = tracking_result.get("traces") or []
+    last_event_at = _parse_trace_time(traces[0].get("time")) if traces else None
+    if last_event_at and phase != "delivering":
+        stale_hours = (now - last_event_at).total_seconds() / 3600
+        if stale_hours > STALE_AFTER_HOURS:
+            interval *= 2 ** min(3, int(stale_hours // STALE_AFTER_HOURS))
+
+    interval = min(max(interval, settings.TRACKING_MIN_INTERVAL_MINUTES), settings.TRACKING_MAX_INTERVAL_MINUTES)
+    return now + timedelta(minutes=interval * _jitter(task.task_id))
+
+
+def schedule_retry(now: Optional[datetime] = None) -> datetime:
+    """查询失败后的下一次查询时间"""
+    return (now or datetime.now()) + timedelta(minutes=settings.TRACKING_RETRY_INTERVAL_MINUTES)
+
+
+def next_check_for(db: Session, task: Task, tracking_result: Dict[str, Any], company_code: str,
+                   now: Optional[datetime] = None) -> Optional[datetime]:
+    """根据查询结果计算任务的 next_check_at（task 也可以是只包含 task_id、created_at 的查询行）"""
+    if not tracking_result.get("success"):
+        return schedule_retry(now)
+    latency_hours = carrier_latency_stats.get(db, company_code)
+    return compute_next_check(task, tracking_result, latency_hours, now)
+
+
+def schedule_task(db: Session, task: Task, tracking_result: Dict[str, Any], company_code: str,
+                  now: Optional[datetime] = None):
+    """根据查询结果更新任务的 next_check_at"""
+    task.next_check_at = next_check_for(db, task, tracking_result, company_code, now)
+
+
+def _jitter(task_id: Optional[str]) -> float:
+    """按任务ID确定的 ±10% 抖动，避免同一批任务总在同一时刻到期"""
+    digest = hashlib.md5((task_id or "").encode()).digest()
+    return 0.9 + (digest[0] / 255) * 0.2
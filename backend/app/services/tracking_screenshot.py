@@ -1,21 +1,25 @@
 import os
+import base64
+import hashlib
 import shutil
 import subprocess
-import tempfile
 import datetime
+import time
 import platform
 import requests
 import zipfile
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm import Session
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
 from app.core.config import settings
+from app.services.browser_pool import browser_pool
+from app.services.carrier_resolver import carrier_resolver
+from app.services.screenshot_cache import ScreenshotCache, render_key
+from app.services.timeline_renderer import RENDER_VERSION, timeline_renderer
 from app.services.express_tracking import ExpressTrackingService
 from app.services.tracking import TrackingService
 
@@ -59,6 +63,7 @@ class TrackingScreenshotService:
         self.tracking_service = TrackingService(db)
         self.screenshot_dir = Path(settings.UPLOAD_DIR) / "tracking_screenshots"
         self.screenshot_dir.mkdir(exist_ok=True)
+        self.render_cache = ScreenshotCache(self.screenshot_dir, settings.SCREENSHOT_CACHE_MAX_ITEMS)
         self.html_dir = Path(settings.UPLOAD_DIR) / "tracking_html"
         self.html_dir.mkdir(exist_ok=True)
     
@@ -306,12 +311,12 @@ class TrackingScreenshotService:
         
         return result
     
-    def _generate_html_fallback(self, html_path: str, tracking_number: str) -> str:
+    def _generate_html_fallback(self, html_content: str, tracking_number: str) -> str:
         """
         当Chrome不可用时，生成HTML文件作为备用方案
         
         Args:
-            html_path: 临时HTML文件路径
+            html_content: 渲染好的HTML内容
             tracking_number: 快递单号
             
         Returns:
@@ -321,18 +326,20 @@ class TrackingScreenshotService:
         html_filename = f"tracking_{tracking_number}_{datetime.datetime.now():%Y%m%d_%H%M%S}.html"
         permanent_html_path = self.html_dir / html_filename
         
-        # 复制临时HTML文件到永久位置
-        shutil.copy2(html_path, permanent_html_path)
+        # 直接写入最终的HTML文件
+        permanent_html_path.write_text(html_content, encoding='utf-8')
         
         return str(permanent_html_path)
     
-    def generate_screenshot(self, tracking_number: str, company_code: str = "ems") -> Dict:
+    def generate_screenshot(self, tracking_number: str, company_code: str = "ems",
+                            screenshot_method: Optional[str] = None) -> Dict:
         """
         生成物流轨迹截图
         
         Args:
             tracking_number: 快递单号
             company_code: 快递公司编码
+            screenshot_method: 截图方式 chrome/pillow，为空时使用 TRACKING_SCREENSHOT_METHOD
             
         Returns:
             截图生成结果
@@ -348,75 +355,17 @@ class TrackingScreenshotService:
                     "tracking_number": tracking_number
                 }
             
-            # 2. 生成HTML
-            html_path = self._render_html(
+            # 3. 生成截图（轨迹未变化时复用已有截图）
+            screenshot_result = self._render_cached(
                 tracking_number=tracking_number,
                 status=tracking_result["current_status"],
                 sign_time=tracking_result.get("sign_time", ""),
-                traces=tracking_result.get("traces", [])
+                traces=tracking_result.get("traces", []),
+                screenshot_method=screenshot_method
             )
             
-            # 3. 生成截图
-            screenshot_filename = f"tracking_{tracking_number}_{datetime.datetime.now():%Y%m%d_%H%M%S}.png"
-            screenshot_path = self.screenshot_dir / screenshot_filename
-            
-            # 调用改进的截图方法
-            screenshot_result = self._html_to_png(html_path, str(screenshot_path), tracking_number)
-            
-            # 4. 清理临时HTML文件
-            try:
-                os.unlink(html_path)
-            except:
-                pass
-            
-            # 5. 处理截图结果
-            response = {
-                "tracking_number": tracking_number,
-                "company_code": company_code,
-                "is_signed": tracking_result.get("is_signed", False),
-                "current_status": tracking_result["current_status"],
-                "traces_count": len(tracking_result.get("traces", [])),
-                "screenshot_method": screenshot_result.get("method", "unknown")
-            }
-            
-            if screenshot_result["success"]:
-                if screenshot_result.get("screenshot_path"):
-                    # 成功生成PNG截图
-                    file_size = Path(screenshot_result["screenshot_path"]).stat().st_size if Path(screenshot_result["screenshot_path"]).exists() else 0
-                    
-                    # 更新数据库中的截图信息
-                    db_updated = self.tracking_service.update_screenshot_info(
-                        tracking_number=tracking_number,
-                        screenshot_path=screenshot_result["screenshot_path"],
-                        screenshot_filename=screenshot_filename
-                    )
-                    
-                    response.update({
-                        "success": True,
-                        "message": "物流轨迹截图生成成功",
-                        "screenshot_path": screenshot_result["screenshot_path"],
-                        "screenshot_filename": screenshot_filename,
-                        "file_size": file_size,
-                        "db_updated": db_updated
-                    })
-                elif screenshot_result.get("html_fallback_path"):
-                    # 生成HTML备用文件
-                    file_size = Path(screenshot_result["html_fallback_path"]).stat().st_size if Path(screenshot_result["html_fallback_path"]).exists() else 0
-                    response.update({
-                        "success": True,
-                        "message": "截图功能不可用，已生成HTML轨迹文件",
-                        "html_fallback_path": screenshot_result["html_fallback_path"],
-                        "file_size": file_size,
-                        "note": "Chrome浏览器不可用，已提供HTML格式的轨迹文件"
-                    })
-            else:
-                response.update({
-                    "success": False,
-                    "message": "截图生成失败",
-                    "error": screenshot_result.get("error", "未知错误")
-                })
-            
-            return response
+            # 3. 处理截图结果
+            return self._build_response(tracking_number, company_code, tracking_result, screenshot_result)
             
         except Exception as e:
             return {
@@ -425,6 +374,163 @@ class TrackingScreenshotService:
                 "tracking_number": tracking_number
             }
     
+    def _build_response(self, tracking_number: str, company_code: str, tracking_result: Dict,
+                        screenshot_result: Dict) -> Dict:
+        """
+        根据截图结果构造返回数据，生成PNG截图时更新物流记录中的截图信息
+        
+        Args:
+            tracking_number: 快递单号
+            company_code: 快递公司编码
+            tracking_result: 物流查询结果
+            screenshot_result: 截图结果（_render_cached 的返回值）
+        
+        Returns:
+            截图生成结果
+        """
+        screenshot_filename = screenshot_result.get("screenshot_filename")
+        response = {
+            "tracking_number": tracking_number,
+            "company_code": company_code,
+            "is_signed": tracking_result.get("is_signed", False),
+            "current_status": tracking_result["current_status"],
+            "traces_count": len(tracking_result.get("traces", [])),
+            "screenshot_method": screenshot_result.get("method", "unknown")
+        }
+        
+        if screenshot_result["success"]:
+            if screenshot_result.get("screenshot_path"):
+                # 成功生成PNG截图
+                file_size = Path(screenshot_result["screenshot_path"]).stat().st_size if Path(screenshot_result["screenshot_path"]).exists() else 0
+                
+                # 更新数据库中的截图信息
+                db_updated = self.tracking_service.update_screenshot_info(
+                    tracking_number=tracking_number,
+                    screenshot_path=screenshot_result["screenshot_path"],
+                    screenshot_filename=screenshot_filename
+                )
+                
+                response.update({
+                    "success": True,
+                    "message": "物流轨迹截图生成成功",
+                    "screenshot_path": screenshot_result["screenshot_path"],
+                    "screenshot_filename": screenshot_filename,
+                    "file_size": file_size,
+                    "db_updated": db_updated
+                })
+            elif screenshot_result.get("html_fallback_path"):
+                # 生成HTML备用文件
+                file_size = Path(screenshot_result["html_fallback_path"]).stat().st_size if Path(screenshot_result["html_fallback_path"]).exists() else 0
+                response.update({
+                    "success": True,
+                    "message": "截图功能不可用，已生成HTML轨迹文件",
+                    "html_fallback_path": screenshot_result["html_fallback_path"],
+                    "file_size": file_size,
+                    "note": "Chrome浏览器不可用，已提供HTML格式的轨迹文件"
+                })
+        else:
+            response.update({
+                "success": False,
+                "message": "截图生成失败",
+                "error": screenshot_result.get("error", "未知错误")
+            })
+        
+        return response
+    
+    def _screenshot_method(self, screenshot_method: Optional[str] = None) -> str:
+        """实际使用的截图方式：指定 pillow 或Chrome不可用时为 pillow，否则为 chrome"""
+        method = (screenshot_method or settings.TRACKING_SCREENSHOT_METHOD).lower()
+        if method == "pillow" or not browser_pool.check_chrome(self._check_chrome_available)["available"]:
+            return "pillow"
+        return "chrome"
+    
+    def _render_version(self, method: str) -> str:
+        """截图版式版本：修改HTML模板或绘制代码后生成新截图，不复用旧图片"""
+        if method == "pillow":
+            return f"pillow:{RENDER_VERSION}"
+        template = (self.HTML_TEMPLATE + self.ITEM_TEMPLATE).encode("utf-8")
+        return f"chrome:{hashlib.md5(template).hexdigest()[:8]}"
+    
+    def _render_cached(self, tracking_number: str, status: str, sign_time: str, traces: List[Dict],
+                       screenshot_method: Optional[str] = None) -> Dict:
+        """
+        生成轨迹截图，单号、状态、签收时间、轨迹和版式都未变化时复用已有截图
+        
+        Returns:
+            转换结果字典（同 _html_to_png），另含 screenshot_filename；复用时 method 为 cache
+        """
+        method = self._screenshot_method(screenshot_method)
+        key = render_key(tracking_number, status, sign_time, traces, self._render_version(method))
+        filename = self.render_cache.filename(tracking_number, key)
+        
+        cached_path = self.render_cache.lookup(filename)
+        if cached_path is not None:
+            return {
+                "success": True,
+                "screenshot_path": str(cached_path),
+                "screenshot_filename": filename,
+                "html_fallback_path": None,
+                "method": "cache",
+                "error": None
+            }
+        
+        temp_path = self.render_cache.temp_path(filename)
+        result = self._render_screenshot(tracking_number, status, sign_time, traces, str(temp_path), method)
+        if result.get("success") and result.get("screenshot_path"):
+            result["screenshot_path"] = str(self.render_cache.commit(temp_path, filename))
+            result["screenshot_filename"] = filename
+        else:
+            self.render_cache.discard(temp_path)
+        return result
+    
+    def cleanup_render_cache(self, max_items: Optional[int] = None) -> Dict:
+        """
+        按最近使用时间清理截图缓存，仍被任务、物流记录或回证引用的截图保留
+        
+        Args:
+            max_items: 保留的最近使用截图数量，默认使用 SCREENSHOT_CACHE_MAX_ITEMS
+        """
+        from app.models import DeliveryReceipt, Task, TrackingInfo
+        
+        referenced = set()
+        for column in (Task.screenshot_path, TrackingInfo.screenshot_path, DeliveryReceipt.tracking_screenshot_path):
+            rows = self.db.query(column).filter(column.isnot(None), column.like("%tracking_%.png"))
+            referenced.update(os.path.basename(row[0]) for row in rows)
+        
+        stats = self.render_cache.cleanup(referenced, max_items)
+        return {
+            "success": True,
+            "message": f"成功清理 {stats['removed']} 个截图缓存文件",
+            **stats
+        }
+    
+    def _render_screenshot(self, tracking_number: str, status: str, sign_time: str, traces: List[Dict],
+                           output_path: str, screenshot_method: Optional[str] = None) -> Dict:
+        """
+        按截图方式生成轨迹图片
+        
+        - pillow：直接绘制与HTML模板相同版式的图片，不启动浏览器，失败时改用Chrome
+        - chrome：在浏览器池中渲染HTML模板；Chrome不可用时改用pillow绘制，仍失败才生成HTML备用文件
+        
+        Returns:
+            转换结果字典（同 _html_to_png）
+        """
+        if self._screenshot_method(screenshot_method) == "pillow":
+            try:
+                Path(output_path).write_bytes(timeline_renderer.render_png(tracking_number, status, sign_time, traces))
+                return {
+                    "success": True,
+                    "screenshot_path": output_path,
+                    "html_fallback_path": None,
+                    "method": "pillow",
+                    "error": None
+                }
+            except Exception as e:
+                print(f"Pillow绘制轨迹图片失败: {e}")
+        
+        html_content = self._render_html(tracking_number, status, sign_time, traces)
+        return self._html_to_png(html_content, output_path, tracking_number)
+    
     def _render_html(self, tracking_number: str, status: str, sign_time: str, traces: List[Dict]) -> str:
         """
         渲染HTML模板
@@ -436,7 +542,7 @@ class TrackingScreenshotService:
             traces: 轨迹列表
             
         Returns:
-            临时HTML文件路径
+            HTML内容（不写入文件）
         """
         # 生成时间线项目
         timeline_items = []
@@ -449,26 +555,56 @@ class TrackingScreenshotService:
         timeline_html = '\n'.join(timeline_items)
         
         # 填充模板
-        html_content = self.HTML_TEMPLATE.format(
+        return self.HTML_TEMPLATE.format(
             tracking_no=tracking_number,
             status=status,
             sign_time=sign_time or '—',
             timeline_items=timeline_html
         )
+    
+    def _render_png(self, html_content: str) -> bytes:
+        """
+        在浏览器池的页面中直接渲染HTML并截取 #capture-container 区域
         
-        # 创建临时HTML文件
-        fd, html_path = tempfile.mkstemp(suffix='.html', text=True)
-        with os.fdopen(fd, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        通过CDP写入页面内容并按容器位置裁剪截图，不经过临时文件
         
-        return html_path
+        Args:
+            html_content: HTML内容
+            
+        Returns:
+            PNG图片数据
+        """
+        with browser_pool.browser(self._check_chrome_available) as driver:
+            return self._capture_png(driver, html_content)
+    
+    @staticmethod
+    def _capture_png(driver, html_content: str) -> bytes:
+        """在已借出的浏览器页面中写入HTML并截取 #capture-container 区域"""
+        frame_tree = driver.execute_cdp_cmd("Page.getFrameTree", {})
+        driver.execute_cdp_cmd("Page.setDocumentContent", {
+            "frameId": frame_tree["frameTree"]["frame"]["id"],
+            "html": html_content
+        })
+        clip = driver.execute_script(
+            "const rect = document.getElementById('capture-container').getBoundingClientRect();"
+            "return {x: rect.left + window.scrollX, y: rect.top + window.scrollY,"
+            " width: rect.width, height: rect.height};"
+        )
+        screenshot = driver.execute_cdp_cmd("Page.captureScreenshot", {
+            "format": "png",
+            "clip": {**clip, "scale": 1},
+            "captureBeyondViewport": True
+        })
+        return base64.b64decode(screenshot["data"])
     
-    def _html_to_png(self, html_path: str, output_path: str, tracking_number: str = "") -> Dict:
+    def _html_to_png(self, html_content: str, output_path: str, tracking_number: str = "") -> Dict:
         """
         将HTML转换为PNG截图，支持Chrome检测和备用方案
         
+        截图使用浏览器池中已启动的Chrome，Chrome检测结果在进程内缓存；只写入最终的PNG（或备用HTML）文件
+        
         Args:
-            html_path: HTML文件路径
+            html_content: HTML内容
             output_path: 输出PNG文件路径
             tracking_number: 快递单号（用于备用方案）
             
@@ -483,53 +619,27 @@ class TrackingScreenshotService:
             "error": None
         }
         
-        # 1. 检查Chrome是否可用
-        chrome_check = self._check_chrome_available()
+        # 1. 检查Chrome是否可用（进程内只完整检测一次）
+        chrome_check = browser_pool.check_chrome(self._check_chrome_available)
         
         if chrome_check["available"]:
-            # Chrome可用，尝试生成截图
+            # Chrome可用，在浏览器池的页面中渲染并截图
             try:
-                # 配置Chrome选项
-                chrome_options = Options()
-                chrome_options.add_argument('--headless=new')
-                chrome_options.add_argument('--no-sandbox')
-                chrome_options.add_argument('--disable-dev-shm-usage')
-                chrome_options.add_argument('--window-size=1280,1600')
-                chrome_options.add_argument('--disable-gpu')
-                chrome_options.add_argument('--disable-extensions')
-                chrome_options.add_argument('--disable-logging')
-                chrome_options.add_argument('--disable-crash-reporter')
+                screenshot_data = self._render_png(html_content)
                 
-                # 创建WebDriver
-                service = Service(chrome_check["driver_path"])
-                driver = webdriver.Chrome(service=service, options=chrome_options)
+                # 保存截图
+                with open(output_path, 'wb') as f:
+                    f.write(screenshot_data)
                 
-                try:
-                    # 加载HTML文件
-                    file_url = 'file:///' + os.path.abspath(html_path)
-                    driver.get(file_url)
-                    driver.implicitly_wait(5)
-                    
-                    # 找到容器元素并截图
-                    container = driver.find_element('id', 'capture-container')
-                    screenshot_data = container.screenshot_as_png
-                    
-                    # 保存截图
-                    with open(output_path, 'wb') as f:
-                        f.write(screenshot_data)
-                    
-                    result["success"] = True
-                    result["screenshot_path"] = output_path
-                    result["method"] = "chrome_screenshot"
-                    
-                finally:
-                    driver.quit()
+                result["success"] = True
+                result["screenshot_path"] = output_path
+                result["method"] = "chrome_screenshot"
                     
             except Exception as e:
                 result["error"] = f"Chrome截图失败: {str(e)}"
                 # Chrome失败，尝试备用方案
                 try:
-                    html_fallback_path = self._generate_html_fallback(html_path, tracking_number)
+                    html_fallback_path = self._generate_html_fallback(html_content, tracking_number)
                     result["html_fallback_path"] = html_fallback_path
                     result["method"] = "html_fallback"
                     result["error"] += f"，已生成HTML备用文件: {html_fallback_path}"
@@ -538,7 +648,7 @@ class TrackingScreenshotService:
         else:
             # Chrome不可用，直接使用HTML备用方案
             try:
-                html_fallback_path = self._generate_html_fallback(html_path, tracking_number)
+                html_fallback_path = self._generate_html_fallback(html_content, tracking_number)
                 result["success"] = True
                 result["html_fallback_path"] = html_fallback_path
                 result["method"] = "html_fallback"
@@ -548,30 +658,150 @@ class TrackingScreenshotService:
         
         return result
     
-    def batch_generate_screenshots(self, tracking_numbers: List[str], company_code: str = "ems") -> List[Dict]:
+    def batch_generate_screenshots(self, tracking_numbers: List[str], company_code: Optional[str] = "ems",
+                                   screenshot_method: Optional[str] = None) -> List[Dict]:
         """
         批量生成物流轨迹截图
         
+        物流信息通过批量查询接口获取（限速并发、走查询缓存），截图由 batch_render 批量生成
+        
         Args:
             tracking_numbers: 快递单号列表
-            company_code: 快递公司编码
+            company_code: 快递公司编码，为空时按单号分别识别
+            screenshot_method: 截图方式 chrome/pillow，为空时使用 TRACKING_SCREENSHOT_METHOD
             
         Returns:
-            截图生成结果列表
+            截图生成结果列表（顺序与输入一致），每项另含 render_seconds
         """
+        company_codes = [company_code or carrier_resolver.resolve(number) for number in tracking_numbers]
+        tracking_results = self.express_service.query_many(list(zip(tracking_numbers, company_codes)))
+        
+        valid = [index for index, result in enumerate(tracking_results) if result.get("success")]
+        rendered = dict(zip(valid, self.batch_render([tracking_results[index] for index in valid], screenshot_method)))
+        
         results = []
-        for tracking_number in tracking_numbers:
-            result = self.generate_screenshot(tracking_number, company_code)
-            results.append(result)
+        for index, (tracking_number, code, tracking_result) in enumerate(zip(tracking_numbers, company_codes, tracking_results)):
+            if index not in rendered:
+                results.append({
+                    "success": False,
+                    "error": f"查询物流信息失败: {tracking_result.get('error')}",
+                    "tracking_number": tracking_number
+                })
+                continue
+            try:
+                response = self._build_response(tracking_number, code, tracking_result, rendered[index])
+            except Exception as e:
+                response = {
+                    "success": False,
+                    "error": f"生成截图过程中发生错误: {str(e)}",
+                    "tracking_number": tracking_number
+                }
+            response["render_seconds"] = rendered[index].get("render_seconds", 0)
+            results.append(response)
+        
+        return results
+    
+    def batch_render(self, items: List[Dict], screenshot_method: Optional[str] = None) -> List[Dict]:
+        """
+        批量生成轨迹截图（不更新数据库）
+        
+        - 轨迹未变化的单号直接复用已有截图
+        - pillow 方式逐张绘制（每张毫秒级）
+        - chrome 方式把待渲染的单号按浏览器池大小分组并行，每组借出一个浏览器，
+          在同一会话中连续渲染整组，不再逐张借出和清理浏览器；
+          会话中途出错时该组剩余单号改走单张截图流程（含pillow/HTML备用方案）
+        
+        Args:
+            items: 物流查询结果列表（tracking_number/current_status/sign_time/traces）
+            screenshot_method: 截图方式 chrome/pillow，为空时使用 TRACKING_SCREENSHOT_METHOD
+            
+        Returns:
+            截图结果列表（顺序与输入一致，格式同 _render_cached），每项另含 render_seconds
+        """
+        method = self._screenshot_method(screenshot_method)
+        version = self._render_version(method)
+        results: List[Optional[Dict]] = [None] * len(items)
+        pending: List[Tuple[int, Dict, str]] = []
         
+        for index, item in enumerate(items):
+            if method == "pillow":
+                results[index] = self._render_item(item, method)
+                continue
+            key = render_key(item["tracking_number"], item.get("current_status", ""), item.get("sign_time", ""),
+                             item.get("traces", []), version)
+            filename = self.render_cache.filename(item["tracking_number"], key)
+            cached_path = self.render_cache.lookup(filename)
+            if cached_path is not None:
+                results[index] = self._render_result(cached_path, filename, "cache", 0)
+            else:
+                pending.append((index, item, filename))
+        
+        if pending:
+            workers = min(browser_pool.max_size, len(pending))
+            groups = [pending[offset::workers] for offset in range(workers)]
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screenshot-batch") as executor:
+                for rendered in executor.map(self._render_group, groups):
+                    for index, result in rendered:
+                        results[index] = result
+        
+        # 浏览器会话中断未完成的单号逐张生成
+        for index, item, _ in pending:
+            if results[index] is None:
+                results[index] = self._render_item(item, method)
         return results
     
-    def generate_screenshot_from_tracking_data(self, tracking_data: Dict) -> Dict:
+    def _render_group(self, group: List[Tuple[int, Dict, str]]) -> List[Tuple[int, Dict]]:
+        """在一个借出的浏览器中连续渲染一组单号（在线程池中执行，不访问数据库）"""
+        rendered = []
+        try:
+            with browser_pool.browser(self._check_chrome_available, renders=len(group)) as driver:
+                for index, item, filename in group:
+                    start = time.perf_counter()
+                    html_content = self._render_html(
+                        item["tracking_number"], item.get("current_status", ""),
+                        item.get("sign_time", ""), item.get("traces", [])
+                    )
+                    path = self.render_cache.store(filename, self._capture_png(driver, html_content))
+                    rendered.append((index, self._render_result(
+                        path, filename, "chrome_screenshot", time.perf_counter() - start
+                    )))
+        except Exception as e:
+            print(f"批量截图浏览器会话中断，剩余 {len(group) - len(rendered)} 个单号改为逐张生成: {e}")
+        return rendered
+    
+    def _render_item(self, item: Dict, method: str) -> Dict:
+        """单张生成截图并记录耗时"""
+        start = time.perf_counter()
+        result = self._render_cached(
+            tracking_number=item["tracking_number"],
+            status=item.get("current_status", ""),
+            sign_time=item.get("sign_time", ""),
+            traces=item.get("traces", []),
+            screenshot_method=method
+        )
+        result["render_seconds"] = time.perf_counter() - start
+        return result
+    
+    @staticmethod
+    def _render_result(path: Path, filename: str, method: str, seconds: float) -> Dict:
+        return {
+            "success": True,
+            "screenshot_path": str(path),
+            "screenshot_filename": filename,
+            "html_fallback_path": None,
+            "method": method,
+            "error": None,
+            "render_seconds": seconds
+        }
+    
+    def generate_screenshot_from_tracking_data(self, tracking_data: Dict,
+                                               screenshot_method: Optional[str] = None) -> Dict:
         """
         基于已有的物流查询数据生成截图
         
         Args:
             tracking_data: 物流查询结果数据
+            screenshot_method: 截图方式 chrome/pillow，为空时使用 TRACKING_SCREENSHOT_METHOD
             
         Returns:
             截图生成结果
@@ -586,75 +816,17 @@ class TrackingScreenshotService:
             
             tracking_number = tracking_data["tracking_number"]
             
-            # 生成HTML
-            html_path = self._render_html(
+            # 生成截图（轨迹未变化时复用已有截图）
+            screenshot_result = self._render_cached(
                 tracking_number=tracking_number,
                 status=tracking_data["current_status"],
                 sign_time=tracking_data.get("sign_time", ""),
-                traces=tracking_data.get("traces", [])
+                traces=tracking_data.get("traces", []),
+                screenshot_method=screenshot_method
             )
             
-            # 生成截图
-            screenshot_filename = f"tracking_{tracking_number}_{datetime.datetime.now():%Y%m%d_%H%M%S}.png"
-            screenshot_path = self.screenshot_dir / screenshot_filename
-            
-            # 调用改进的截图方法
-            screenshot_result = self._html_to_png(html_path, str(screenshot_path), tracking_number)
-            
-            # 清理临时HTML文件
-            try:
-                os.unlink(html_path)
-            except:
-                pass
-            
             # 处理截图结果
-            response = {
-                "tracking_number": tracking_number,
-                "company_code": tracking_data.get("company_code", ""),
-                "is_signed": tracking_data.get("is_signed", False), 
-                "current_status": tracking_data["current_status"],
-                "traces_count": len(tracking_data.get("traces", [])),
-                "screenshot_method": screenshot_result.get("method", "unknown")
-            }
-            
-            if screenshot_result["success"]:
-                if screenshot_result.get("screenshot_path"):
-                    # 成功生成PNG截图
-                    file_size = Path(screenshot_result["screenshot_path"]).stat().st_size if Path(screenshot_result["screenshot_path"]).exists() else 0
-                    
-                    # 更新数据库中的截图信息
-                    db_updated = self.tracking_service.update_screenshot_info(
-                        tracking_number=tracking_number,
-                        screenshot_path=screenshot_result["screenshot_path"],
-                        screenshot_filename=screenshot_filename
-                    )
-                    
-                    response.update({
-                        "success": True,
-                        "message": "物流轨迹截图生成成功",
-                        "screenshot_path": screenshot_result["screenshot_path"],
-                        "screenshot_filename": screenshot_filename,
-                        "file_size": file_size,
-                        "db_updated": db_updated
-                    })
-                elif screenshot_result.get("html_fallback_path"):
-                    # 生成HTML备用文件
-                    file_size = Path(screenshot_result["html_fallback_path"]).stat().st_size if Path(screenshot_result["html_fallback_path"]).exists() else 0
-                    response.update({
-                        "success": True,
-                        "message": "截图功能不可用，已生成HTML轨迹文件",
-                        "html_fallback_path": screenshot_result["html_fallback_path"],
-                        "file_size": file_size,
-                        "note": "Chrome浏览器不可用，已提供HTML格式的轨迹文件"
-                    })
-            else:
-                response.update({
-                    "success": False,
-                    "message": "截图生成失败",
-                    "error": screenshot_result.get("error", "未知错误")
-                })
-            
-            return response
+            return self._build_response(tracking_number, tracking_data.get("company_code", ""), tracking_data, screenshot_result)
             
         except Exception as e:
             return {
@@ -0,0 +1,254 @@
+"""
+物流查询请求合并（single-flight）
+- 进程内：同一 (快递公司, 单号) 同时只有一个上游请求，其余调用方等待并共享结果
+  （线程和事件循环分别合并）
+- 跨进程/worker：领头请求先以 SET NX PX 获取短租期的 Redis 锁，
+  未抢到锁的调用方轮询物流缓存，等待领头请求写入结果
+- 锁租期到期或领头请求失败（失败结果不写缓存）时，等待方自行请求上游，不会无限阻塞；
+  租期不短于一次上游请求的最长耗时（连接超时 + 读取超时），避免领头请求仍在等待时被其他调用方重复请求
+- 异步接口中的 Redis 访问和缓存读取在线程中执行，不阻塞事件循环
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.tracking_cache import TrackingCache, tracking_cache
+
+logger = logging.getLogger(__name__)
+
+LOCK_PREFIX = "tracking_flight:"
+# 仅删除自己持有的锁，避免误删租期到期后被其他worker重新获取的锁
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+FlightKey = Tuple[str, str]
+Loader = Callable[[], Optional[Dict[str, Any]]]
+
+
+class _Flight:
+    """进程内（线程间）正在进行的请求"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """物流查询请求合并器"""
+
+    def __init__(self, cache: TrackingCache, lease: float = 5.0, poll_interval: float = 0.1):
+        self.cache = cache
+        self.lease = lease
+        self.poll_interval = poll_interval
+
+        self._flights: Dict[FlightKey, _Flight] = {}
+        self._async_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[FlightKey, asyncio.Future]]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {"upstream": 0, "coalesced_local": 0, "coalesced_remote": 0, "lease_expired": 0}
+
+    @classmethod
+    def from_settings(cls) -> "SingleFlight":
+        upstream_timeout = settings.KUAIDI100_CONNECT_TIMEOUT + settings.KUAIDI100_TIMEOUT
+        return cls(tracking_cache, lease=max(settings.TRACKING_SINGLEFLIGHT_LEASE, upstream_timeout + 1))
+
+    # ------------------------------------------------------------------
+    # 同步接口
+    # ------------------------------------------------------------------
+    def do(self, key: FlightKey, fetch: Callable[[], Dict[str, Any]], load: Loader) -> Dict[str, Any]:
+        """
+        合并执行查询
+
+        Args:
+            key: (tracking_number, company_code)
+            fetch: 请求上游并在成功时写入缓存，返回格式化结果
+            load: 读取缓存并返回格式化结果，未命中返回 None
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            self._count("coalesced_local")
+            if flight.event.wait(self.lease * 2):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            # 领头请求超时未返回，自行请求
+            return self._lead(key, fetch, load)
+
+        try:
+            flight.result = self._lead(key, fetch, load)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def _lead(self, key: FlightKey, fetch: Callable[[], Dict[str, Any]], load: Loader) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.lease
+        while True:
+            token = self._acquire(key)
+            if token is not None:
+                try:
+                    # 成为领头请求后再检查一次缓存：其他worker或本进程之前的请求可能刚刚写入
+                    # （Redis不可用时同样检查，批量查询在令牌桶中等待期间结果可能已写入缓存）
+                    result = load()
+                    if result is not None:
+                        self._count("coalesced_remote" if token else "coalesced_local")
+                        return result
+                    self._count("upstream")
+                    return fetch()
+                finally:
+                    self._release(key, token)
+
+            # 其他worker正在请求，等待其写入缓存
+            while time.monotonic() < deadline and self._locked(key):
+                time.sleep(self.poll_interval)
+                result = load()
+                if result is not None:
+                    self._count("coalesced_remote")
+                    return result
+            result = load()
+            if result is not None:
+                self._count("coalesced_remote")
+                return result
+            if time.monotonic() >= deadline:
+                self._count("lease_expired")
+                self._count("upstream")
+                return fetch()
+            # 锁已释放但没有缓存（领头请求失败），重新竞争
+
+    # ------------------------------------------------------------------
+    # 异步接口
+    # ------------------------------------------------------------------
+    async def ado(self, key: FlightKey, fetch: Callable[[], Awaitable[Dict[str, Any]]], load: Loader) -> Dict[str, Any]:
+        """合并执行查询（异步），参数同 do()，fetch 为协程函数"""
+        loop = asyncio.get_running_loop()
+        flights = self._async_flights.setdefault(loop, {})
+        future = flights.get(key)
+        if future is not None:
+            self._count("coalesced_local")
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        flights[key] = future
+        try:
+            result = await self._alead(key, fetch, load)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待方时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            flights.pop(key, None)
+
+    async def _alead(self, key: FlightKey, fetch: Callable[[], Awaitable[Dict[str, Any]]], load: Loader) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.lease
+        while True:
+            token = await asyncio.to_thread(self._acquire, key)
+            if token is not None:
+                try:
+                    result = await asyncio.to_thread(load)
+                    if result is not None:
+                        self._count("coalesced_remote" if token else "coalesced_local")
+                        return result
+                    self._count("upstream")
+                    return await fetch()
+                finally:
+                    await asyncio.to_thread(self._release, key, token)
+
+            while time.monotonic() < deadline and await asyncio.to_thread(self._locked, key):
+                await asyncio.sleep(self.poll_interval)
+                result = await asyncio.to_thread(load)
+                if result is not None:
+                    self._count("coalesced_remote")
+                    return result
+            result = await asyncio.to_thread(load)
+            if result is not None:
+                self._count("coalesced_remote")
+                return result
+            if time.monotonic() >= deadline:
+                self._count("lease_expired")
+                self._count("upstream")
+                return await fetch()
+
+    # ------------------------------------------------------------------
+    # Redis 锁
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _lock_key(key: FlightKey) -> str:
+        tracking_number, company_code = key
+        return f"{LOCK_PREFIX}{company_code}:{tracking_number}"
+
+    def _acquire(self, key: FlightKey) -> Optional[str]:
+        """
+        获取跨进程锁，返回锁令牌；锁被占用返回 None
+        Redis 不可用时返回空字符串（仅进程内合并）
+        """
+        client = self.cache._get_redis()
+        if client is None:
+            return ""
+        token = uuid.uuid4().hex
+        try:
+            if client.set(self._lock_key(key), token, nx=True, px=int(self.lease * 1000)):
+                return token
+            return None
+        except Exception as e:
+            self.cache._redis_failed(e)
+            return ""
+
+    def _release(self, key: FlightKey, token: str):
+        if not token:
+            return
+        client = self.cache._get_redis()
+        if client is None:
+            return
+        try:
+            client.eval(RELEASE_SCRIPT, 1, self._lock_key(key), token)
+        except Exception as e:
+            logger.warning(f"释放物流查询锁失败: {e}")
+
+    def _locked(self, key: FlightKey) -> bool:
+        client = self.cache._get_redis()
+        if client is None:
+            return False
+        try:
+            return bool(client.exists(self._lock_key(key)))
+        except Exception as e:
+            self.cache._redis_failed(e)
+            return False
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        stats["lease"] = self.lease
+        return stats
+
+
+# 全局物流查询合并器
+tracking_singleflight = SingleFlight.from_settings()
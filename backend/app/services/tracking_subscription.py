@@ -0,0 +1,205 @@
+"""
+快递100推送订阅
+- 新单号开始跟踪时向快递100订阅推送，订阅状态记录在 Task.extra_metadata["kuaidi100_subscription"]
+- 回调校验签名（MD5(param + salt) 大写）后，推送的 lastResult 与实时查询结果格式相同，
+  格式化后交给 update_single_task_tracking，与定时轮询走同一套状态更新逻辑
+- 已订阅且近期收到过推送的任务不再轮询；推送中断（abort）或长时间未收到推送时由定时轮询兜底
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.task import Task, TaskStatusEnum
+from app.services.express_tracking import ExpressTrackingService
+from app.services.kuaidi100_client import Kuaidi100Error
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEY = "kuaidi100_subscription"
+# 快递100订阅接口：200 提交成功，501 重复订阅
+SUBSCRIBE_OK_CODES = {"200", "501"}
+# 推送状态：polling 监控中，shutdown 结束（已签收等），abort 中止（如长时间无物流信息），updateall 重新推送
+PUSH_ABORT = "abort"
+PUSH_SHUTDOWN = "shutdown"
+# 推送只更新与轮询相同状态范围内的任务，避免已进入文档生成的任务回退
+PUSH_UPDATABLE_STATUSES = [TaskStatusEnum.TRACKING, TaskStatusEnum.DELIVERED]
+
+
+def sign_callback(param: str, salt: str) -> str:
+    """计算回调签名"""
+    return hashlib.md5((param + salt).encode()).hexdigest().upper()
+
+
+def verify_callback(param: str, sign: str, salt: str) -> bool:
+    """校验回调签名（未配置盐值时拒绝所有回调）"""
+    if not salt or not sign:
+        return False
+    return hmac.compare_digest(sign_callback(param, salt), sign.upper())
+
+
+def needs_polling(task: Task, now: Optional[datetime] = None) -> bool:
+    """
+    任务是否仍需定时轮询
+
+    已订阅且在兜底时长内收到过推送（或刚订阅）的任务跳过轮询
+    """
+    subscription = (task.extra_metadata or {}).get(METADATA_KEY)
+    if not settings.KUAIDI100_PUSH_ENABLED or not subscription:
+        return True
+    if subscription.get("status") not in ("subscribed", "polling"):
+        return True
+
+    last_seen = subscription.get("last_push_at") or subscription.get("subscribed_at")
+    try:
+        last_seen_at = datetime.fromisoformat(last_seen)
+    except (TypeError, ValueError):
+        return True
+    now = now or datetime.now()
+    return now - last_seen_at > timedelta(hours=settings.KUAIDI100_PUSH_FALLBACK_HOURS)
+
+
+class TrackingSubscriptionService:
+    """快递100推送订阅服务"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.express_service = ExpressTrackingService(db)
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return settings.KUAIDI100_PUSH_ENABLED and bool(settings.KUAIDI100_CALLBACK_URL)
+
+    def subscribe_task(self, task: Task, company_code: str = "ems") -> Dict[str, Any]:
+        """
+        为任务的快递单号订阅推送
+
+        Returns:
+            {"success": bool, "message"/"error": str}
+        """
+        if not self.is_enabled():
+            return {"success": False, "error": "未启用快递100推送订阅"}
+        if not task.tracking_number:
+            return {"success": False, "error": "任务没有快递单号"}
+
+        subscription = (task.extra_metadata or {}).get(METADATA_KEY) or {}
+        if subscription.get("status") in ("subscribed", "polling"):
+            return {"success": True, "message": "已订阅"}
+
+        try:
+            response = self.express_service.client.subscribe(
+                task.tracking_number,
+                company_code,
+                settings.KUAIDI100_CALLBACK_URL,
+                salt=settings.KUAIDI100_PUSH_SALT
+            )
+        except Kuaidi100Error as e:
+            logger.warning(f"订阅快递100推送失败 {task.tracking_number}: {e}")
+            return {"success": False, "error": f"网络请求失败: {str(e)}"}
+
+        return_code = str(response.get("returnCode", ""))
+        if response.get("result") is not True and return_code not in SUBSCRIBE_OK_CODES:
+            message = response.get("message") or "订阅失败"
+            self._update_subscription(task, {"status": "failed", "error": message})
+            self.db.commit()
+            return {"success": False, "error": message}
+
+        self._update_subscription(task, {
+            "status": "subscribed",
+            "company_code": company_code,
+            "subscribed_at": datetime.now().isoformat()
+        })
+        self.db.commit()
+        logger.info(f"已订阅快递100推送: {task.tracking_number}")
+        return {"success": True, "message": response.get("message") or "订阅成功"}
+
+    def handle_callback(self, param: str, sign: str) -> Dict[str, Any]:
+        """
+        处理快递100推送回调
+
+        Args:
+            param: 回调表单中的 param（JSON字符串，签名按原文计算）
+            sign: 回调签名
+
+        Returns:
+            {"success": bool, "error": str, "updated": int, "completed_task_ids": [...]}
+        """
+        if not verify_callback(param, sign, settings.KUAIDI100_PUSH_SALT):
+            return {"success": False, "error": "签名验证失败"}
+
+        try:
+            payload = json.loads(param)
+        except ValueError:
+            return {"success": False, "error": "回调数据不是有效的JSON"}
+
+        push_status = payload.get("status", "")
+        last_result = payload.get("lastResult") or {}
+        tracking_number = last_result.get("nu")
+        if not tracking_number:
+            return {"success": False, "error": "回调数据缺少快递单号"}
+
+        tasks = self.db.query(Task).filter(
+            Task.tracking_number == tracking_number,
+            Task.status.in_(PUSH_UPDATABLE_STATUSES)
+        ).all()
+
+        company_code = (last_result.get("com") or "").lower()
+        if not company_code and tasks:
+            company_code = ((tasks[0].extra_metadata or {}).get(METADATA_KEY) or {}).get("company_code")
+        company_code = company_code or self.express_service.get_company_code_by_number(tracking_number)
+
+        tracking_result = None
+        if last_result.get("data") is not None:
+            tracking_result = self.express_service._format_response(
+                last_result, tracking_number, company_code, from_cache=False
+            )
+            if tracking_result.get("success"):
+                # 推送结果同时刷新查询缓存，前端和截图直接使用最新物流
+                self.express_service.cache.set(tracking_number, company_code, last_result)
+
+        from app.tasks.tracking_tasks import update_single_task_tracking
+
+        updated = 0
+        completed_task_ids: List[str] = []
+        now = datetime.now().isoformat()
+        for task in tasks:
+            self._update_subscription(task, {
+                "status": PUSH_ABORT if push_status == PUSH_ABORT else "polling",
+                "last_push_at": now,
+                "last_push_status": push_status,
+                "message": payload.get("message", "")
+            })
+            if tracking_result is None or not tracking_result.get("success"):
+                continue
+            result = update_single_task_tracking(self.db, self.express_service, task, tracking_result)
+            if result.get("success"):
+                updated += 1
+                if result.get("completed"):
+                    completed_task_ids.append(task.task_id)
+
+        self.db.commit()
+        if push_status == PUSH_ABORT:
+            logger.warning(f"快递100推送中止 {tracking_number}: {payload.get('message', '')}，恢复定时轮询")
+
+        return {
+            "success": True,
+            "tracking_number": tracking_number,
+            "push_status": push_status,
+            "updated": updated,
+            "completed_task_ids": completed_task_ids
+        }
+
+    @staticmethod
+    def _update_subscription(task: Task, values: Dict[str, Any]):
+        # JSON 字段需重新赋值才会被SQLAlchemy检测到变更
+        metadata = dict(task.extra_metadata or {})
+        subscription = dict(metadata.get(METADATA_KEY) or {})
+        subscription.update(values)
+        metadata[METADATA_KEY] = subscription
+        task.extra_metadata = metadata
@@ -16,10 +16,10 @@ BEAT_SCHEDULE = {
         'options': {'queue': 'high_priority'}
     },
     
-    # 每小时更新所有未完成的物流状态
+    # 每5分钟更新已到查询时间的物流状态（各任务的查询间隔由 tracking_scheduler 计算）
     'update-all-pending-tracking': {
         'task': 'app.tasks.tracking_tasks.update_all_pending_tracking',
-        'schedule': crontab(minute=0),  # 每小时整点执行
+        'schedule': crontab(minute='*/5'),
         'options': {'queue': 'tracking'}
     },
     
@@ -40,6 +40,13 @@ BEAT_SCHEDULE = {
         'options': {'queue': 'file'}
     },
     
+    # 每小时按最近使用时间清理物流截图缓存
+    'cleanup-screenshot-cache': {
+        'task': 'app.tasks.screenshot_tasks.cleanup_screenshot_cache',
+        'schedule': crontab(minute=40),
+        'options': {'queue': 'screenshot'}
+    },
+    
     # ============ 每日任务 ============
     
     # 每天凌晨2点生成统计报告
@@ -179,6 +186,11 @@ TASK_ROUTES = {
     'app.tasks.receipt_tasks.*': {'queue': 'receipt'},
     'app.tasks.screenshot_tasks.*': {'queue': 'screenshot'},
     
+    # 任务流水线阶段（识别/物流查询/文档生成）
+    'app.tasks.pipeline_tasks.recognize_task': {'queue': 'recognition'},
+    'app.tasks.pipeline_tasks.track_task': {'queue': 'tracking'},
+    'app.tasks.pipeline_tasks.render_task': {'queue': 'render'},
+    
     # 低优先级任务
     'app.tasks.file_tasks.cleanup_old_files': {'queue': 'low_priority'},
     'app.tasks.file_tasks.backup_database': {'queue': 'low_priority'},
@@ -14,7 +14,8 @@ celery_app = Celery(
         "app.tasks.screenshot_tasks",
         "app.tasks.file_tasks",
         "app.tasks.monitoring_tasks",
-        "app.tasks.health_check_tasks"
+        "app.tasks.health_check_tasks",
+        "app.tasks.pipeline_tasks"
     ]
 )
 
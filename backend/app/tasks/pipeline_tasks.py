@@ -0,0 +1,77 @@
+"""
+任务流水线阶段的Celery任务
+PIPELINE_BACKEND=celery 时，识别→物流查询→文档生成 的阶段交接通过这些任务完成，
+消息在 recognition/tracking/render 队列中持久保存，worker确认完成后才会被移除
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+from celery import current_app as celery_app
+
+from app.core.database import SessionLocal
+from app.models.task import Task, TaskStatusEnum
+from app.services.kuaidi100_client import aclose_loop_clients
+from app.services.pipeline_engine import PipelineStage, STAGE_HANDLERS
+
+logger = logging.getLogger(__name__)
+
+# 已结束的任务不再重复处理（重复投递或worker重启后重新消费时）
+FINISHED_STATUSES = (TaskStatusEnum.COMPLETED, TaskStatusEnum.RETURNED)
+
+STAGE_TASK_OPTIONS = {
+    "bind": True,
+    "acks_late": True,
+    "reject_on_worker_lost": True,
+    "autoretry_for": (ConnectionError,),
+    "retry_kwargs": {"max_retries": 3, "countdown": 30},
+}
+
+
+async def _run_handler(handler, task_id: str):
+    try:
+        await handler(task_id)
+    finally:
+        # asyncio.run 每次创建新的事件循环，结束前关闭本循环上创建的快递100异步连接池
+        await aclose_loop_clients()
+
+
+def run_stage(stage: PipelineStage, task_id: str) -> Dict[str, Any]:
+    """在worker中执行 TaskService 对应的阶段处理方法"""
+    from app.services.task import TaskService
+
+    db = SessionLocal()
+    try:
+        task = db.query(Task).filter(Task.task_id == task_id).first()
+        if not task:
+            logger.warning(f"流水线任务不存在 - 阶段: {stage.value}, 任务: {task_id}")
+            return {"success": False, "error": "任务不存在", "task_id": task_id}
+
+        if task.status in FINISHED_STATUSES:
+            logger.info(f"任务已结束，跳过 - 阶段: {stage.value}, 任务: {task_id}, 状态: {task.status.value}")
+            return {"success": True, "skipped": True, "task_id": task_id}
+
+        service = TaskService(db)
+        asyncio.run(_run_handler(getattr(service, STAGE_HANDLERS[stage]), task_id))
+        return {"success": True, "stage": stage.value, "task_id": task_id}
+    finally:
+        db.close()
+
+
+@celery_app.task(**STAGE_TASK_OPTIONS)
+def recognize_task(self, task_id: str) -> Dict[str, Any]:
+    """二维码识别阶段"""
+    return run_stage(PipelineStage.RECOGNITION, task_id)
+
+
+@celery_app.task(**STAGE_TASK_OPTIONS)
+def track_task(self, task_id: str) -> Dict[str, Any]:
+    """物流查询阶段"""
+    return run_stage(PipelineStage.TRACKING, task_id)
+
+
+@celery_app.task(**STAGE_TASK_OPTIONS)
+def render_task(self, task_id: str) -> Dict[str, Any]:
+    """截图、标签和回证生成阶段"""
+    return run_stage(PipelineStage.RENDER, task_id)
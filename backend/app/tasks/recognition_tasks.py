@@ -33,33 +33,31 @@ def process_batch_recognition(task_id: int, file_infos: List[Dict[str, Any]], sa
         success_count = 0
         error_count = 0
         
-        # 逐个处理文件
-        for i, file_info in enumerate(file_infos):
-            try:
-                file_path = file_info.get("file_path")
-                if not file_path or not os.path.exists(file_path):
-                    error_count += 1
-                    continue
-                
-                # 进行识别
-                result = recognition_service.recognize_single_image(file_path, task_id)
-                
-                if result["is_success"] == "true":
-                    success_count += 1
-                else:
-                    error_count += 1
-                
-                # 如果是临时文件且不需要保存，删除它
-                if file_info.get("is_temp", False) and not save_files:
-                    try:
-                        os.unlink(file_path)
-                    except:
-                        pass
-                
-            except Exception as e:
+        # 过滤不存在的文件，其余整批交给解码进程池并行识别
+        valid_infos = []
+        for file_info in file_infos:
+            file_path = file_info.get("file_path")
+            if not file_path or not os.path.exists(file_path):
                 error_count += 1
-                print(f"处理文件 {file_info.get('filename', 'unknown')} 时发生错误: {e}")
                 continue
+            valid_infos.append(file_info)
+        
+        results = recognition_service.recognize_images(
+            [file_info["file_path"] for file_info in valid_infos], task_id
+        )
+        
+        for file_info, result in zip(valid_infos, results):
+            if result["is_success"] == "true":
+                success_count += 1
+            else:
+                error_count += 1
+            
+            # 如果是临时文件且不需要保存，删除它
+            if file_info.get("is_temp", False) and not save_files:
+                try:
+                    os.unlink(file_info["file_path"])
+                except:
+                    pass
         
         # 更新任务状态为完成
         recognition_service.update_task_status(task_id, RecognitionStatusEnum.COMPLETED)
@@ -1,9 +1,9 @@
 import os
+import time
 import logging
 from datetime import datetime
 from celery import current_app as celery_app
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from celery.signals import worker_process_shutdown
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -14,6 +14,7 @@ from sqlalchemy.exc import SQLAlchemyError
 
 from app.core.database import SessionLocal
 from app.core.config import settings
+from app.services.browser_pool import browser_pool
 from app.services.delivery_receipt import DeliveryReceiptService
 from app.services.tracking import TrackingService
 from app.tasks.retry_config import (
@@ -26,6 +27,17 @@ from app.tasks.retry_config import (
 logger = logging.getLogger(__name__)
 
 
+@worker_process_shutdown.connect
+def _close_browser_pool(**kwargs):
+    """worker进程退出时关闭池中的浏览器"""
+    browser_pool.shutdown()
+
+
+def _check_chrome() -> dict:
+    """浏览器池首次使用时获取ChromeDriver"""
+    return {"available": True, "driver_path": ChromeDriverManager().install(), "error": None}
+
+
 @celery_app.task
 def capture_tracking_screenshot_task(tracking_number: str):
     """
@@ -66,23 +78,12 @@ def capture_tracking_screenshot_task(tracking_number: str):
 
 def capture_tracking_screenshot(tracking_number: str, courier_company: str) -> str:
     """
-    使用Selenium截取物流跟踪页面
+    使用Selenium截取物流跟踪页面（浏览器从截图浏览器池借出）
     """
     try:
-        # 设置Chrome选项
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--window-size=1920,1080")
-        
-        # 初始化WebDriver
-        driver = webdriver.Chrome(
-            service=webdriver.chrome.service.Service(ChromeDriverManager().install()),
-            options=chrome_options
-        )
-        
-        try:
+        with browser_pool.browser(_check_chrome) as driver:
+            driver.set_window_size(1920, 1080)
+            
             # 根据快递公司构造查询URL
             url = build_tracking_url(tracking_number, courier_company)
             
@@ -105,9 +106,6 @@ def capture_tracking_screenshot(tracking_number: str, courier_company: str) -> s
             
             return screenshot_path
             
-        finally:
-            driver.quit()
-            
     except Exception as e:
         print(f"截图失败: {e}")
         return None
@@ -130,6 +128,95 @@ def build_tracking_url(tracking_number: str, courier_company: str) -> str:
     return courier_urls.get(courier_company, f"https://www.kuaidi100.com/query?number={tracking_number}")
 
 
+@celery_app.task
+def batch_render_screenshots(tracking_numbers: list, company_code: str = None,
+                             screenshot_method: str = None, chunk_size: int = None):
+    """
+    批量生成物流轨迹截图（月度补生成、批量重新生成）
+    
+    单号去重后按 chunk_size（默认 SCREENSHOT_BATCH_CHUNK_SIZE）分组，每组作为一个子任务
+    由截图队列的worker处理；company_code 为空时按单号分别识别快递公司
+    """
+    numbers = list(dict.fromkeys(number.strip() for number in tracking_numbers if number and number.strip()))
+    size = max(1, chunk_size or settings.SCREENSHOT_BATCH_CHUNK_SIZE)
+    chunks = [numbers[offset:offset + size] for offset in range(0, len(numbers), size)]
+    
+    tasks = []
+    for chunk in chunks:
+        result = render_screenshot_chunk.delay(chunk, company_code, screenshot_method)
+        tasks.append({"task_id": result.id, "size": len(chunk)})
+    
+    return {
+        "message": f"批量生成 {len(numbers)} 个物流轨迹截图，分为 {len(chunks)} 组",
+        "total": len(numbers),
+        "tasks": tasks
+    }
+
+
+@celery_app.task
+def render_screenshot_chunk(tracking_numbers: list, company_code: str = None, screenshot_method: str = None):
+    """
+    生成一组物流轨迹截图（批量查询物流信息，截图在浏览器池中并行渲染）
+    
+    Returns:
+        成功/失败/复用数量、总耗时和每个单号的结果与渲染耗时
+    """
+    from app.services.tracking_screenshot import TrackingScreenshotService
+    
+    db: Session = SessionLocal()
+    try:
+        start = time.perf_counter()
+        results = TrackingScreenshotService(db).batch_generate_screenshots(
+            tracking_numbers, company_code, screenshot_method
+        )
+        elapsed = time.perf_counter() - start
+        succeeded = sum(1 for result in results if result.get("success"))
+        logger.info(f"批量截图完成: {succeeded}/{len(results)} 成功, 耗时 {elapsed:.2f}秒")
+        
+        return {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "cached": sum(1 for result in results if result.get("screenshot_method") == "cache"),
+            "elapsed_seconds": round(elapsed, 3),
+            "results": [
+                {
+                    "tracking_number": result.get("tracking_number"),
+                    "success": result.get("success", False),
+                    "screenshot_path": result.get("screenshot_path") or result.get("html_fallback_path"),
+                    "method": result.get("screenshot_method"),
+                    "render_seconds": round(result.get("render_seconds", 0), 3),
+                    "error": result.get("error")
+                }
+                for result in results
+            ]
+        }
+    except Exception as e:
+        logger.error(f"批量截图失败: {e}")
+        return {"total": len(tracking_numbers), "succeeded": 0, "failed": len(tracking_numbers), "error": str(e)}
+    finally:
+        db.close()
+
+
+@celery_app.task
+def cleanup_screenshot_cache():
+    """
+    按最近使用时间清理物流轨迹截图缓存（被引用的截图保留）
+    """
+    from app.services.tracking_screenshot import TrackingScreenshotService
+    
+    db: Session = SessionLocal()
+    try:
+        result = TrackingScreenshotService(db).cleanup_render_cache()
+        logger.info(f"截图缓存清理完成: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"截图缓存清理失败: {e}")
+        return {"success": False, "error": str(e)}
+    finally:
+        db.close()
+
+
 @celery_app.task
 def batch_capture_screenshots(tracking_numbers: list):
     """
@@ -1,10 +1,12 @@
 import requests
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 from celery import current_app as celery_app
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, update
 
 from app.core.database import SessionLocal
 from app.core.config import settings
@@ -12,6 +14,11 @@ from app.services.tracking import TrackingService
 from app.models.task import Task, TaskStatusEnum
 from app.models.delivery_receipt import DeliveryReceipt
 from app.services.express_tracking import ExpressTrackingService
+from app.services.tracking_scheduler import next_check_for
+from app.services.tracking_subscription import needs_polling
+from app.services.tracking_events import TrackingEventService
+from app.services.carrier_resolver import carrier_resolver
+from app.services.pipeline_engine import PipelineStage, pipeline_engine
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -66,7 +73,8 @@ def fetch_tracking_data(tracking_number: str, courier_code: str) -> dict:
             express_service = ExpressTrackingService(db)
             
             # 调用快递100 API查询
-            result = express_service.query_express(tracking_number, courier_code or "ems")
+            company_code = express_service.get_company_code_by_number(tracking_number, courier_code)
+            result = express_service.query_express(tracking_number, company_code)
             
             if result["success"]:
                 # 转换为tracking_tasks期望的格式
@@ -109,8 +117,12 @@ def batch_update_tracking(tracking_numbers: list):
 @celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 60})
 def update_all_pending_tracking(self) -> Dict[str, Any]:
     """
-    定时任务：更新所有未完成的物流跟踪信息
-    每小时执行一次，批量查询并更新物流状态
+    定时任务：更新已到查询时间的物流跟踪信息
+    每5分钟执行一次，只处理 next_check_at 已到期的任务，查询后按物流阶段重新安排下次查询时间
+    
+    流水线处理：按ID分段扫描到期任务（只读取需要的列，不加载ORM对象），
+    当前分段批量写入数据库时并发查询下一分段的物流信息，每段写入后单独提交，
+    某一分段失败只回滚该分段
     """
     start_time = datetime.now()
     logger.info(f"开始执行定时物流更新任务 - {start_time}")
@@ -123,17 +135,48 @@ def update_all_pending_tracking(self) -> Dict[str, Any]:
             "total_checked": 0,
             "updated": 0,
             "completed": 0,
+            "deferred": 0,
             "failed": 0,
-            "errors": []
+            "errors": [],
+            "chunks": []
         }
         
-        # 查询所有需要更新的任务
-        pending_tasks = get_pending_tracking_tasks(db)
-        stats["total_checked"] = len(pending_tasks)
+        now = datetime.now()
+        backfill_next_check(db, now)
+        db.commit()
         
-        logger.info(f"找到 {len(pending_tasks)} 个待更新的物流任务")
+        express_service = ExpressTrackingService(db)
+        chunk_size = settings.TRACKING_SWEEP_CHUNK_SIZE
+        
+        def fetch(entries):
+            fetch_start = time.perf_counter()
+            codes, results = express_service.query_tasks(entries) if entries else ([], [])
+            return codes, results, time.perf_counter() - fetch_start
+        
+        # 单独的线程查询下一分段，与当前分段的数据库写入重叠
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracking-sweep") as prefetcher:
+            pending = None
+            chunk_index = 0
+            for rows in scan_due_tracking_rows(db, chunk_size, settings.TRACKING_DUE_BATCH_LIMIT, now):
+                chunk_index += 1
+                stats["total_checked"] += len(rows)
+                
+                # 已订阅推送且近期收到过推送的任务由回调更新，只推迟检查时间，不查询
+                polled, deferred = [], []
+                for row in rows:
+                    (polled if needs_polling(row, now) else deferred).append(row)
+                # 快递公司在查询线程中确定，需要智能单号识别时与物流查询共用限速
+                entries = [(row.tracking_number, row.courier_company, row.qr_code) for row in polled]
+                future = prefetcher.submit(fetch, entries)
+                
+                if pending:
+                    _finish_chunk(db, *pending, stats)
+                pending = (chunk_index, polled, deferred, future)
+            
+            if pending:
+                _finish_chunk(db, *pending, stats)
         
-        if not pending_tasks:
+        if not stats["total_checked"]:
             logger.info("没有需要更新的物流任务")
             return {
                 "success": True,
@@ -142,25 +185,11 @@ def update_all_pending_tracking(self) -> Dict[str, Any]:
                 "execution_time": (datetime.now() - start_time).total_seconds()
             }
         
-        # 分批处理任务，每批最多50个
-        batch_size = 50
-        for i in range(0, len(pending_tasks), batch_size):
-            batch = pending_tasks[i:i + batch_size]
-            batch_stats = process_tracking_batch(db, batch)
-            
-            # 累加统计信息
-            stats["updated"] += batch_stats["updated"]
-            stats["completed"] += batch_stats["completed"]
-            stats["failed"] += batch_stats["failed"]
-            stats["errors"].extend(batch_stats["errors"])
-            
-            logger.info(f"批次 {i//batch_size + 1} 处理完成: 更新 {batch_stats['updated']}, 完成 {batch_stats['completed']}, 失败 {batch_stats['failed']}")
-        
-        # 提交所有更改
-        db.commit()
-        
         execution_time = (datetime.now() - start_time).total_seconds()
-        logger.info(f"定时物流更新任务完成 - 耗时: {execution_time:.2f}秒, 统计: {stats}")
+        logger.info(
+            f"定时物流更新任务完成 - 耗时: {execution_time:.2f}秒, 检查 {stats['total_checked']}, "
+            f"更新 {stats['updated']}, 完成 {stats['completed']}, 推迟 {stats['deferred']}, 失败 {stats['failed']}"
+        )
         
         return {
             "success": True,
@@ -180,166 +209,294 @@ def update_all_pending_tracking(self) -> Dict[str, Any]:
         db.close()
 
 
+def _finish_chunk(db: Session, chunk_index: int, polled: list, deferred: list, future, stats: Dict[str, Any]):
+    """等待分段查询结果，批量写入并累加统计"""
+    wait_start = time.perf_counter()
+    company_codes, tracking_results, fetch_seconds = future.result()
+    wait_seconds = time.perf_counter() - wait_start
+    
+    chunk_stats = apply_tracking_chunk(db, polled, tracking_results, deferred, company_codes)
+    chunk_stats.update({
+        "chunk": chunk_index,
+        "size": len(polled) + len(deferred),
+        "fetch_seconds": round(fetch_seconds, 3),
+        "fetch_wait_seconds": round(wait_seconds, 3)
+    })
+    
+    for key in ("updated", "completed", "deferred", "failed"):
+        stats[key] += chunk_stats[key]
+    stats["errors"].extend(chunk_stats.pop("errors"))
+    stats["chunks"].append(chunk_stats)
+    
+    logger.info(
+        f"分段 {chunk_index} 处理完成: {chunk_stats['size']} 个任务, 更新 {chunk_stats['updated']}, "
+        f"完成 {chunk_stats['completed']}, 推迟 {chunk_stats['deferred']}, 失败 {chunk_stats['failed']}, "
+        f"查询 {fetch_seconds:.2f}秒(等待 {wait_seconds:.2f}秒), 写入 {chunk_stats['write_seconds']:.2f}秒"
+    )
+
+
+def _due_conditions(now: datetime) -> list:
+    """
+    到期任务的查询条件：
+    1. 状态为 TRACKING（正在跟踪）且 next_check_at 已到期（走 idx_tasks_status_next_check 索引）
+    2. 有快递单号的任务
+    3. 最近7天内的任务（避免更新过老的任务）
+    """
+    seven_days_ago = now - timedelta(days=7)
+    return [
+        Task.status == TaskStatusEnum.TRACKING,
+        Task.next_check_at <= now,
+        Task.tracking_number.isnot(None),
+        Task.tracking_number != "",
+        Task.created_at >= seven_days_ago
+    ]
+
+
+def backfill_next_check(db: Session, now: datetime):
+    """尚未安排查询时间的任务（历史数据或刚进入跟踪）立即到期"""
+    db.query(Task).filter(
+        Task.status == TaskStatusEnum.TRACKING,
+        Task.next_check_at.is_(None)
+    ).update({Task.next_check_at: now}, synchronize_session=False)
+
+
+# 定时更新扫描读取的列（只读取计算更新所需的字段，避免加载完整ORM对象）
+SWEEP_COLUMNS = (
+    Task.id, Task.task_id, Task.tracking_number, Task.courier_company, Task.qr_code, Task.status,
+    Task.delivery_status, Task.tracking_data, Task.extra_metadata, Task.created_at
+)
+
+
+def scan_due_tracking_rows(db: Session, chunk_size: int, limit: int, now: datetime) -> Iterator[list]:
+    """
+    按ID分段扫描到期的跟踪任务（keyset分页：id > 上一段最后一个id）
+    
+    Args:
+        chunk_size: 每段行数
+        limit: 本次最多扫描的行数
+        
+    Yields:
+        每段的查询行列表（按id升序）
+    """
+    last_id = 0
+    scanned = 0
+    while scanned < limit:
+        rows = db.query(*SWEEP_COLUMNS).filter(
+            *_due_conditions(now),
+            Task.id > last_id
+        ).order_by(Task.id).limit(min(chunk_size, limit - scanned)).all()
+        if not rows:
+            return
+        yield rows
+        scanned += len(rows)
+        last_id = rows[-1].id
+        if len(rows) < chunk_size:
+            return
+
+
 def get_pending_tracking_tasks(db: Session) -> List[Task]:
     """
-    获取所有需要更新物流的任务
+    获取已到查询时间的物流任务
     """
     try:
-        # 查询条件：
-        # 1. 状态为 TRACKING（正在跟踪）
-        # 2. 或状态为 DELIVERED 但最近24小时内更新过的（确保签收状态稳定）
-        # 3. 有快递单号的任务
-        # 4. 最近7天内的任务（避免更新过老的任务）
-        
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        twenty_four_hours_ago = datetime.now() - timedelta(hours=24)
+        now = datetime.now()
+        backfill_next_check(db, now)
         
         pending_tasks = db.query(Task).filter(
-            and_(
-                Task.tracking_number.isnot(None),
-                Task.tracking_number != "",
-                Task.created_at >= seven_days_ago,
-                # 排除已退签、已完成和失败的任务
-                Task.status.notin_([TaskStatusEnum.RETURNED, TaskStatusEnum.COMPLETED, TaskStatusEnum.FAILED]),
-                or_(
-                    Task.status == TaskStatusEnum.TRACKING,
-                    and_(
-                        Task.status == TaskStatusEnum.DELIVERED,
-                        Task.updated_at >= twenty_four_hours_ago
-                    )
-                )
-            )
-        ).all()
+            and_(*_due_conditions(now))
+        ).order_by(Task.next_check_at).limit(settings.TRACKING_DUE_BATCH_LIMIT).all()
+        
+        # 已订阅快递100推送且近期收到过推送的任务由回调更新，推迟到兜底时间再检查
+        polled_tasks = []
+        for task in pending_tasks:
+            if needs_polling(task, now):
+                polled_tasks.append(task)
+            else:
+                task.next_check_at = now + timedelta(hours=settings.KUAIDI100_PUSH_FALLBACK_HOURS)
+        if len(polled_tasks) != len(pending_tasks):
+            logger.info(f"{len(pending_tasks) - len(polled_tasks)} 个任务已订阅推送，跳过轮询")
+        db.commit()
         
-        logger.info(f"查询到 {len(pending_tasks)} 个待更新的物流任务")
-        return pending_tasks
+        logger.info(f"查询到 {len(polled_tasks)} 个待更新的物流任务")
+        return polled_tasks
         
     except Exception as e:
         logger.error(f"查询待更新任务失败: {str(e)}")
         return []
 
 
-def process_tracking_batch(db: Session, tasks: List[Task]) -> Dict[str, Any]:
+def apply_tracking_chunk(db: Session, rows: list, tracking_results: List[Dict[str, Any]],
+                         deferred_rows: list = None, company_codes: List[str] = None) -> Dict[str, Any]:
     """
-    批量处理一组物流任务
+    把一个分段的查询结果批量写入数据库并提交
+    
+    每行的变更合并为按主键的批量 UPDATE（executemany），新物流轨迹追加到 tracking_events，
+    失败时只回滚本分段
+    
+    Args:
+        rows: 扫描得到的任务行（或 Task 对象），与 tracking_results 顺序一致
+        tracking_results: 物流查询结果
+        deferred_rows: 已订阅推送、本次只推迟检查时间的任务行
+        company_codes: 查询时确定的快递公司编码，与 rows 顺序一致（为空时按任务重新确定）
     """
-    batch_stats = {
+    chunk_stats = {
         "updated": 0,
         "completed": 0,
+        "deferred": 0,
         "failed": 0,
         "errors": []
     }
     
-    express_service = ExpressTrackingService(db)
+    now = datetime.now()
+    event_service = TrackingEventService(db)
+    params = []
+    
+    for row in deferred_rows or []:
+        params.append({"id": row.id, "next_check_at": now + timedelta(hours=settings.KUAIDI100_PUSH_FALLBACK_HOURS)})
+        chunk_stats["deferred"] += 1
     
-    for task in tasks:
+    for index, (row, tracking_result) in enumerate(zip(rows, tracking_results)):
         try:
-            # 更新单个任务的物流信息
-            result = update_single_task_tracking(db, express_service, task)
-            
-            if result["success"]:
-                batch_stats["updated"] += 1
-                
-                # 检查是否已完成
-                if result.get("completed"):
-                    batch_stats["completed"] += 1
-                    
-            else:
-                batch_stats["failed"] += 1
-                batch_stats["errors"].append({
-                    "task_id": task.task_id,
-                    "tracking_number": task.tracking_number,
-                    "error": result.get("error", "未知错误")
-                })
-                
+            company_code = company_codes[index] if company_codes else resolve_company_code(row)
+            result = build_tracking_update(db, row, tracking_result, company_code, event_service)
         except Exception as e:
-            batch_stats["failed"] += 1
-            error_msg = f"处理任务 {task.task_id} 失败: {str(e)}"
-            batch_stats["errors"].append({
-                "task_id": task.task_id,
-                "tracking_number": task.tracking_number,
-                "error": error_msg
+            result = {"success": False, "error": f"处理任务 {row.task_id} 失败: {str(e)}", "values": {}}
+            logger.error(result["error"])
+        
+        if result["values"]:
+            params.append({"id": row.id, **result["values"]})
+        
+        if result["success"]:
+            chunk_stats["updated"] += 1
+            if result.get("completed"):
+                chunk_stats["completed"] += 1
+        else:
+            chunk_stats["failed"] += 1
+            chunk_stats["errors"].append({
+                "task_id": row.task_id,
+                "tracking_number": row.tracking_number,
+                "error": result.get("error", "未知错误")
             })
-            logger.error(error_msg)
     
-    return batch_stats
+    write_start = time.perf_counter()
+    try:
+        if params:
+            # ORM按主键批量更新：相同列集合的行合并为一条 executemany 语句
+            db.execute(update(Task), params)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"分段写入失败，已回滚本分段: {str(e)}")
+        chunk_stats["failed"] = len(rows) + len(deferred_rows or [])
+        chunk_stats["updated"] = chunk_stats["completed"] = chunk_stats["deferred"] = 0
+        chunk_stats["errors"].append({"error": f"分段写入失败: {str(e)}"})
+    chunk_stats["write_seconds"] = round(time.perf_counter() - write_start, 3)
+    
+    return chunk_stats
 
 
-def update_single_task_tracking(db: Session, express_service: ExpressTrackingService, task: Task) -> Dict[str, Any]:
+def resolve_company_code(task: Task) -> str:
+    """
+    确定任务的快递公司代码（二维码域名、识别到的快递公司名称、单号规则，必要时调用智能单号识别）
+    """
+    return carrier_resolver.resolve(task.tracking_number, task.courier_company, task.qr_code)
+
+
+def _parse_sign_time(sign_time_str: str) -> datetime:
+    """解析签收时间，失败时使用当前时间"""
+    if not sign_time_str:
+        return datetime.now()
+    try:
+        if "T" in sign_time_str:
+            return datetime.fromisoformat(sign_time_str.replace('Z', '+00:00'))
+        return datetime.strptime(sign_time_str, "%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        logger.warning(f"解析签收时间失败: {e}")
+        return datetime.now()
+
+
+def build_tracking_update(db: Session, task: Task, tracking_result: Dict[str, Any], company_code: str,
+                          event_service: TrackingEventService = None) -> Dict[str, Any]:
+    """
+    根据物流查询结果计算任务需要更新的字段（不修改 task，新物流轨迹追加到 tracking_events）
+    
+    Args:
+        task: Task 对象或 scan_due_tracking_rows 得到的查询行
+        
+    Returns:
+        {"success": bool, "error": str, "values": {列名: 新值}, "completed": bool, "changed": bool,
+         "status_changed": bool, "old_status": str, "new_status": str}
+    """
+    # 按物流阶段安排下一次查询（失败时短间隔重试，签收后不再安排）
+    values = {"next_check_at": next_check_for(db, task, tracking_result, company_code)}
+    
+    if not tracking_result.get("success"):
+        return {
+            "success": False,
+            "error": tracking_result.get("error", "物流查询失败"),
+            "values": values
+        }
+    
+    # 检查数据是否有更新
+    old_status = task.delivery_status
+    new_status = tracking_result.get("current_status", "")
+    is_signed = tracking_result.get("is_signed", False)
+    
+    # 轨迹或状态有变化时才写入摘要，新轨迹追加到 tracking_events；未变化时跳过写入
+    event_service = event_service or TrackingEventService(db)
+    summary = event_service.record(tracking_result, task.tracking_data, task.tracking_number, company_code)
+    changed = summary is not None
+    if changed:
+        values["tracking_data"] = summary
+        values["delivery_status"] = new_status
+    
+    # 检查是否已签收
+    completed = False
+    if is_signed and task.status != TaskStatusEnum.DELIVERED:
+        values["status"] = TaskStatusEnum.DELIVERED
+        values["delivery_time"] = _parse_sign_time(tracking_result.get("sign_time", ""))
+        completed = True
+        logger.info(f"任务 {task.task_id} 已签收，签收时间: {values['delivery_time']}")
+    
+    # 更新时间戳
+    if changed or completed:
+        values["updated_at"] = datetime.now()
+    
+    # 记录状态变化
+    if old_status != new_status:
+        logger.info(f"任务 {task.task_id} 物流状态更新: {old_status} -> {new_status}")
+    
+    return {
+        "success": True,
+        "values": values,
+        "completed": completed,
+        "changed": changed,
+        "status_changed": old_status != new_status,
+        "old_status": old_status,
+        "new_status": new_status
+    }
+
+
+def update_single_task_tracking(db: Session, express_service: ExpressTrackingService, task: Task,
+                                tracking_result: Dict[str, Any] = None) -> Dict[str, Any]:
     """
     更新单个任务的物流跟踪信息
+    
+    Args:
+        tracking_result: 已查询到的物流结果（推送回调时传入），为空时单独查询
     """
     try:
         logger.debug(f"更新任务 {task.task_id} 的物流信息，快递单号: {task.tracking_number}")
         
-        # 确定快递公司代码
-        company_code = task.courier_company or "ems"
-        if company_code and len(company_code) > 10:
-            # 如果是中文公司名，尝试转换为代码
-            company_mapping = {
-                "中国邮政": "ems",
-                "顺丰": "sf",
-                "圆通": "yt",
-                "申通": "sto",
-                "韵达": "yd",
-                "中通": "zt"
-            }
-            company_code = company_mapping.get(company_code, "ems")
-        
         # 查询物流信息
-        tracking_result = express_service.query_express(task.tracking_number, company_code)
-        
-        if not tracking_result.get("success"):
-            return {
-                "success": False,
-                "error": tracking_result.get("error", "物流查询失败")
-            }
-        
-        # 检查数据是否有更新
-        old_status = task.delivery_status
-        new_status = tracking_result.get("current_status", "")
-        is_signed = tracking_result.get("is_signed", False)
-        
-        # 更新任务数据
-        task.tracking_data = tracking_result
-        task.delivery_status = new_status
+        company_code = resolve_company_code(task)
+        if tracking_result is None:
+            tracking_result = express_service.query_express(task.tracking_number, company_code)
         
-        # 检查是否已签收
-        completed = False
-        if is_signed and task.status != TaskStatusEnum.DELIVERED:
-            task.status = TaskStatusEnum.DELIVERED
-            
-            # 解析签收时间
-            sign_time_str = tracking_result.get("sign_time", "")
-            if sign_time_str:
-                try:
-                    if "T" in sign_time_str:
-                        task.delivery_time = datetime.fromisoformat(sign_time_str.replace('Z', '+00:00'))
-                    else:
-                        task.delivery_time = datetime.strptime(sign_time_str, "%Y-%m-%d %H:%M:%S")
-                except Exception as e:
-                    logger.warning(f"解析签收时间失败: {e}")
-                    task.delivery_time = datetime.now()
-            else:
-                task.delivery_time = datetime.now()
-            
-            completed = True
-            logger.info(f"任务 {task.task_id} 已签收，签收时间: {task.delivery_time}")
-        
-        # 更新时间戳
-        task.updated_at = datetime.now()
-        
-        # 记录状态变化
-        if old_status != new_status:
-            logger.info(f"任务 {task.task_id} 物流状态更新: {old_status} -> {new_status}")
-        
-        return {
-            "success": True,
-            "completed": completed,
-            "status_changed": old_status != new_status,
-            "old_status": old_status,
-            "new_status": new_status
-        }
+        result = build_tracking_update(db, task, tracking_result, company_code)
+        for column, value in result.pop("values").items():
+            setattr(task, column, value)
+        return result
         
     except Exception as e:
         logger.error(f"更新任务 {task.task_id} 物流信息失败: {str(e)}")
@@ -385,6 +542,7 @@ def check_pending_tasks(self) -> Dict[str, Any]:
         
         stats["checked"] = len(stuck_tasks)
         logger.info(f"发现 {len(stuck_tasks)} 个可能卡住的任务")
+        restarts = []
         
         for task in stuck_tasks:
             try:
@@ -392,8 +550,10 @@ def check_pending_tasks(self) -> Dict[str, Any]:
                 action = determine_task_action(task)
                 
                 if action == "restart":
-                    # 重启任务
-                    restart_stuck_task(db, task)
+                    # 重启任务（状态提交后再重新投递）
+                    stage = restart_stuck_task(db, task)
+                    if stage is not None:
+                        restarts.append((stage, task.task_id))
                     stats["restarted"] += 1
                     logger.info(f"重启任务: {task.task_id}")
                     
@@ -411,6 +571,10 @@ def check_pending_tasks(self) -> Dict[str, Any]:
         
         db.commit()
         
+        # Celery模式投递阶段任务；本地模式交给API进程中的流水线引擎
+        for stage, task_id in restarts:
+            pipeline_engine.request_restart(stage, task_id)
+        
         execution_time = (datetime.now() - start_time).total_seconds()
         logger.info(f"任务检查完成 - 耗时: {execution_time:.2f}秒, 统计: {stats}")
         
@@ -446,9 +610,12 @@ def determine_task_action(task: Task) -> str:
     return "restart"
 
 
-def restart_stuck_task(db: Session, task: Task):
+def restart_stuck_task(db: Session, task: Task) -> Optional[PipelineStage]:
     """
     重启卡住的任务
+    
+    Returns:
+        需要重新执行的流水线阶段（调用方提交状态后通过 pipeline_engine.request_restart 投递），无需重新执行时返回 None
     """
     # 增加重试计数
     task.retry_count += 1
@@ -456,17 +623,10 @@ def restart_stuck_task(db: Session, task: Task):
     task.error_message = None
     
     # 根据任务当前状态决定重启策略
-    if task.status == TaskStatusEnum.PENDING:
-        # 如果还是待处理，触发二维码识别
-        from app.services.task import TaskService
-        task_service = TaskService(db)
-        # 异步触发处理
-        import asyncio
-        asyncio.create_task(task_service._trigger_qr_recognition(task.task_id))
-        
-    elif task.status == TaskStatusEnum.RECOGNIZING:
-        # 如果在识别中，重置为待处理
+    if task.status in (TaskStatusEnum.PENDING, TaskStatusEnum.RECOGNIZING):
+        # 待处理或识别卡住，重新触发二维码识别
         task.status = TaskStatusEnum.PENDING
+        return PipelineStage.RECOGNITION
         
     elif task.status == TaskStatusEnum.TRACKING:
         # 如果在跟踪中但卡住了，可能需要重新触发跟踪
@@ -478,8 +638,11 @@ def restart_stuck_task(db: Session, task: Task):
             task.status = TaskStatusEnum.RECOGNIZING
     
     elif task.status == TaskStatusEnum.GENERATING:
-        # 如果在生成中，重置为已投递状态
+        # 如果在生成中，重置为已投递状态并重新触发文档生成
         task.status = TaskStatusEnum.DELIVERED
+        return PipelineStage.RENDER
+    
+    return None
 
 
 @celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 2, 'countdown': 300})
@@ -7,15 +7,39 @@ robust_qr_reader.py — 高鲁棒性二维码解码器（无窗口，只输出
     python robust_qr_reader.py /path/to/photo.jpg
 
 作为库调用:
-    from robust_qr_reader import decode_qr
+    from robust_qr_reader import decode_qr, decode_qr_bytes
     texts = decode_qr("/path/to/photo.jpg")
+    texts = decode_qr_bytes(upload_bytes)    # 直接解码内存中的图片数据
 """
+import logging
 import sys
+import threading
+import time
 from pathlib import Path
 
 import cv2
 import numpy as np
-from pyzbar import pyzbar
+
+try:
+    from pyzbar import pyzbar
+except ImportError as e:
+    # 未安装 libzbar 时只使用 OpenCV 后端（ZBar 各级返回空结果）
+    pyzbar = None
+    logging.getLogger(__name__).warning(f"ZBar不可用，二维码解码仅使用OpenCV: {e}")
+
+
+# ----------------------------------------------------------------------
+# 0. 检测器复用：每个线程/进程只创建一次 QRCodeDetector
+# ----------------------------------------------------------------------
+_local = threading.local()
+
+
+def _get_detector() -> cv2.QRCodeDetector:
+    det = getattr(_local, "detector", None)
+    if det is None:
+        det = cv2.QRCodeDetector()
+        _local.detector = det
+    return det
 
 
 # ----------------------------------------------------------------------
@@ -23,7 +47,7 @@ from pyzbar import pyzbar
 # ----------------------------------------------------------------------
 def _decode_opencv(img: np.ndarray):
     """OpenCV QRCodeDetector 解码（兼容不同 OpenCV 版本）"""
-    det = cv2.QRCodeDetector()
+    det = _get_detector()
     try:
         # OpenCV ≥4.5.2: retval, decoded_info, points, straight_qrcode
         retval, decoded, points, _ = det.detectAndDecodeMulti(img)
@@ -53,6 +77,8 @@ def _decode_opencv(img: np.ndarray):
 # 2. ZBar 后端
 # ----------------------------------------------------------------------
 def _decode_pyzbar(img: np.ndarray):
+    if pyzbar is None:
+        return []
     res = []
     for z in pyzbar.decode(img):
         if z.type == "QRCODE":
@@ -97,64 +123,249 @@ def _preprocess(gray: np.ndarray):
 
 
 # ----------------------------------------------------------------------
-# 5. 综合解码流程
+# 5. 区域定位：粗略缩小图上找出候选二维码区域，在原始分辨率下裁剪解码
+# ----------------------------------------------------------------------
+def _locate_regions(img: np.ndarray, coarse_side: int = 800, max_regions: int = 4):
+    """
+    返回原图坐标下的候选区域 [(x0, y0, x1, y1), ...]，按可信度排序：
+    1) 缩小图上 OpenCV 定位图案检测到的角点
+    2) 梯度密集区域的轮廓（二维码黑白模块边缘密集，呈近似方形）
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    h, w = gray.shape[:2]
+    scale = min(1.0, coarse_side / max(h, w))
+    small = cv2.resize(gray, (int(w*scale), int(h*scale)), interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    sh, sw = small.shape[:2]
+
+    boxes = []
+
+    def add(x, y, bw, bh, margin=0.15):
+        m = int(margin * max(bw, bh))
+        x0, y0 = max(0, x - m), max(0, y - m)
+        x1, y1 = min(sw, x + bw + m), min(sh, y + bh + m)
+        boxes.append(tuple(int(v / scale) for v in (x0, y0, x1, y1)))
+
+    # 定位图案
+    ok, corners = _get_detector().detect(small)
+    if ok and corners is not None:
+        x, y, bw, bh = cv2.boundingRect(corners.reshape(-1, 2).astype(np.float32))
+        add(x, y, bw, bh, margin=0.25)
+
+    # 梯度密集区域
+    gx = cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=3)
+    mag = cv2.blur(cv2.convertScaleAbs(cv2.magnitude(gx, gy)), (9, 9))
+    _, th = cv2.threshold(mag, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    th = cv2.morphologyEx(th, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15)))
+    th = cv2.dilate(cv2.erode(th, None, iterations=2), None, iterations=2)
+    contours, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for c in sorted(contours, key=cv2.contourArea, reverse=True):
+        if len(boxes) >= max_regions:
+            break
+        x, y, bw, bh = cv2.boundingRect(c)
+        area = bw * bh
+        if area < 0.002 * sh * sw or area > 0.6 * sh * sw:
+            continue
+        if not 0.4 < bw / bh < 2.5:
+            continue
+        add(x, y, bw, bh)
+
+    return boxes[:max_regions]
+
+
+def _stage_locate(img: np.ndarray, max_crop_side: int = 2000):
+    """对候选区域按原始分辨率解码（区域过大时才缩小），命中即返回"""
+    for x0, y0, x1, y1 in _locate_regions(img):
+        crop = img[y0:y1, x0:x1]
+        ch, cw = crop.shape[:2]
+        if min(ch, cw) < 20:
+            continue
+        if max(ch, cw) > max_crop_side:
+            scale = max_crop_side / max(ch, cw)
+            crop = cv2.resize(crop, (int(cw*scale), int(ch*scale)), interpolation=cv2.INTER_AREA)
+        results = _decode_pyzbar(crop) + _decode_opencv(crop)
+        if results:
+            return results
+    return []
+
+
+# ----------------------------------------------------------------------
+# 6. 分级解码流程：按开销从低到高逐级尝试，命中即停止
 # ----------------------------------------------------------------------
-def _try_decode(img: np.ndarray):
-    # 1) 原图直接解码
-    results = _decode_opencv(img) + _decode_pyzbar(img)
+def _stage_pyzbar_gray(img: np.ndarray, max_side: int = 800):
+    """灰度缩小图 + ZBar（最快，干净的手机照片通常在此命中）"""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    h, w = gray.shape[:2]
+    if max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        gray = cv2.resize(gray, (int(w*scale), int(h*scale)), interpolation=cv2.INTER_AREA)
+    return _decode_pyzbar(gray)
+
+
+def _stage_opencv(img: np.ndarray):
+    return _decode_opencv(img)
+
+
+def _stage_pyzbar(img: np.ndarray):
+    return _decode_pyzbar(img)
 
-    # 2) OpenCV 仅检测角点时做透视矫正重试
-    det = cv2.QRCodeDetector()
-    _, corners = det.detect(img)
+
+def _stage_warp(img: np.ndarray):
+    """OpenCV 仅检测到角点时做透视矫正重试"""
+    results = []
+    _, corners = _get_detector().detect(img)
     if corners is not None:
         for c in corners:
             results += _warp_and_retry(img, c.squeeze())
+    return results
 
-    # 3) 预处理后再试
-    if not results:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        enhanced = _preprocess(gray)
-        results = _decode_opencv(enhanced) + _decode_pyzbar(enhanced)
-
-    # 4) 旋转尝试
-    if not results:
-        for flag in (
-            cv2.ROTATE_90_CLOCKWISE,
-            cv2.ROTATE_180,
-            cv2.ROTATE_90_COUNTERCLOCKWISE,
-        ):
-            rot = cv2.rotate(img, flag)
-            results = _decode_opencv(rot) + _decode_pyzbar(rot)
-            if results:
-                break
 
-    # 去重并保持顺序
-    seen, uniq = set(), []
-    for r in results:
-        t = r["text"]
-        if t not in seen:
-            seen.add(t)
-            uniq.append(r)
-    return uniq
+def _stage_clahe(img: np.ndarray):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    enhanced = _preprocess(gray)
+    return _decode_opencv(enhanced) + _decode_pyzbar(enhanced)
+
+
+def _stage_rotate(img: np.ndarray):
+    for flag in (
+        cv2.ROTATE_90_CLOCKWISE,
+        cv2.ROTATE_180,
+        cv2.ROTATE_90_COUNTERCLOCKWISE,
+    ):
+        rot = cv2.rotate(img, flag)
+        results = _decode_opencv(rot) + _decode_pyzbar(rot)
+        if results:
+            return results
+    return []
+
+
+DECODE_STAGES = {
+    "pyzbar_gray": _stage_pyzbar_gray,
+    "opencv": _stage_opencv,
+    "pyzbar": _stage_pyzbar,
+    "warp": _stage_warp,
+    "clahe": _stage_clahe,
+    "rotate": _stage_rotate,
+}
+
+DEFAULT_STAGE_ORDER = ("pyzbar_gray", "opencv", "pyzbar", "warp", "clahe", "rotate")
 
 
-def decode_qr(image_path: str | Path, max_side: int = 1600) -> list[str]:
+def _run_cascade(img: np.ndarray, stages=None, accept=None, full_img=None) -> dict:
     """
-    返回图片中所有二维码文本，按出现顺序去重。
-    会在必要时自动缩放（最长边 ≤ max_side）。
+    依次执行各级解码，满足条件即停止：
+    - 提供 accept(text) 时，任一结果被接受（如匹配快递单号规则）才停止
+    - 未提供时，任一级得到结果即停止
+    提供 full_img（未缩放原图）时，先在原图上做区域定位解码（"locate"级）
+    返回 {"results": 去重结果, "stage": 命中的级别, "stage_times": 各级耗时}
     """
-    img = cv2.imread(str(image_path))
-    if img is None:
-        raise FileNotFoundError(f"无法读取图片：{image_path}")
+    seen, uniq = set(), []
+    stage_times = {}
+    hit_stage = None
+    first_stage = None
+
+    order = list(stages or DEFAULT_STAGE_ORDER)
+    if full_img is not None:
+        order.insert(0, "locate")
+
+    for name in order:
+        if name == "locate":
+            func, source = _stage_locate, full_img
+        else:
+            func, source = DECODE_STAGES.get(name), img
+        if func is None:
+            raise ValueError(f"未知的解码级别：{name}")
+
+        t0 = time.perf_counter()
+        found = func(source)
+        stage_times[name] = time.perf_counter() - t0
+
+        for r in found:
+            if r["text"] not in seen:
+                seen.add(r["text"])
+                uniq.append(r)
+        if found and first_stage is None:
+            first_stage = name
+
+        if accept is None:
+            if uniq:
+                hit_stage = name
+                break
+        elif any(accept(r["text"]) for r in found):
+            hit_stage = name
+            break
+
+    return {
+        "results": uniq,
+        "stage": hit_stage or first_stage,
+        "stage_times": stage_times,
+    }
+
+
+def _try_decode(img: np.ndarray, stages=None, accept=None):
+    return _run_cascade(img, stages, accept)["results"]
+
+
+def _fit(img: np.ndarray, max_side: int) -> np.ndarray:
     h, w = img.shape[:2]
     if max(h, w) > max_side:
         scale = max_side / max(h, w)
         img = cv2.resize(img, (int(w*scale), int(h*scale)))
-    return [r["text"] for r in _try_decode(img)]
+    return img
+
+
+def _detail(img: np.ndarray, max_side: int, stages=None, accept=None, locate=False) -> dict:
+    cascade = _run_cascade(_fit(img, max_side), stages, accept, full_img=img if locate else None)
+    return {
+        "texts": [r["text"] for r in cascade["results"]],
+        "stage": cascade["stage"],
+        "stage_times": cascade["stage_times"],
+    }
+
+
+def decode_qr_detailed(image_path: str | Path, max_side: int = 1600,
+                       stages=None, accept=None, locate: bool = False) -> dict:
+    """
+    解码并返回明细：{"texts": 文本列表, "stage": 命中的级别, "stage_times": 各级耗时}
+    stages 为解码级别顺序（默认 DEFAULT_STAGE_ORDER），accept 为提前结束的判定函数，
+    locate=True 时先定位候选区域并按原始分辨率解码（适合大尺寸手机照片）。
+    """
+    img = cv2.imread(str(image_path))
+    if img is None:
+        raise FileNotFoundError(f"无法读取图片：{image_path}")
+    return _detail(img, max_side, stages, accept, locate)
+
+
+def decode_qr_bytes_detailed(buffer, max_side: int = 1600,
+                             stages=None, accept=None, locate: bool = False) -> dict:
+    """
+    直接解码内存中的图片数据（bytes/bytearray/memoryview），不经过磁盘。
+    返回值同 decode_qr_detailed。
+    """
+    data = np.frombuffer(memoryview(buffer), dtype=np.uint8)
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    if img is None:
+        raise ValueError("无法解码图片数据")
+    return _detail(img, max_side, stages, accept, locate)
+
+
+def decode_qr_bytes(buffer, max_side: int = 1600,
+                    stages=None, accept=None, locate: bool = False) -> list[str]:
+    """返回内存图片数据中所有二维码文本，按出现顺序去重。"""
+    return decode_qr_bytes_detailed(buffer, max_side, stages, accept, locate)["texts"]
+
+
+def decode_qr(image_path: str | Path, max_side: int = 1600,
+              stages=None, accept=None, locate: bool = False) -> list[str]:
+    """
+    返回图片中所有二维码文本，按出现顺序去重。
+    会在必要时自动缩放（最长边 ≤ max_side）。
+    """
+    return decode_qr_detailed(image_path, max_side, stages, accept, locate)["texts"]
 
 
 # ----------------------------------------------------------------------
-# 6. 命令行接口
+# 7. 命令行接口
 # ----------------------------------------------------------------------
 if __name__ == "__main__":
     if len(sys.argv) != 2:
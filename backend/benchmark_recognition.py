@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+二维码识别基准测试
+对 tests/ 下的示例照片及其合成变体（旋转、模糊、JPEG压缩、缩放）测量：
+- 每张图片、每个解码级别的耗时 p50/p95
+- 识别命中率（解码结果中包含期望的快递单号）
+- 识别服务 QRRecognitionService 的端到端耗时（解码 + 单号规则匹配 + 识别缓存查找），缓存未命中/命中分别统计
+- 解码进程池在 1..N 个进程下的吞吐量
+
+用法:
+    python benchmark_recognition.py                          # 运行并打印报告
+    python benchmark_recognition.py --write-baseline         # 写入基线 benchmark_baseline.json
+    python benchmark_recognition.py --baseline benchmark_baseline.json   # 与基线比较，退化时退出码为1
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.courier_patterns import DEFAULT_COURIER_PATTERNS
+from app.services.qr_decode_pool import QRDecodePool, build_accept
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLES_DIR = Path(__file__).parent / "tests"
+
+# 示例照片中二维码对应的快递单号
+EXPECTED_NUMBERS = {
+    "photo.png": "1151240728560",
+    "photo2.jpg": "1151240728560",
+    "photo3.jpg": "1151240728560",
+    "photo4.jpg": "1151240728560",
+    "photo5.jpg": "1151238972360",
+    "photo6.jpg": "1151238971060",
+    "photo7.jpg": "1151242359760",
+    "photo8.jpg": "1151242358360",
+}
+
+
+# ----------------------------------------------------------------------
+# 合成变体
+# ----------------------------------------------------------------------
+def _rotate(img: np.ndarray, angle: float) -> np.ndarray:
+    h, w = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (w, h), borderValue=(255, 255, 255))
+
+
+def _jpeg(img: np.ndarray, quality: int) -> np.ndarray:
+    _, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def _scale(img: np.ndarray, factor: float) -> np.ndarray:
+    h, w = img.shape[:2]
+    return cv2.resize(img, (int(w * factor), int(h * factor)), interpolation=cv2.INTER_AREA)
+
+
+VARIANTS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "original": lambda img: img,
+    "rotate_15": lambda img: _rotate(img, 15),
+    "rotate_90": lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE),
+    "blur_5": lambda img: cv2.GaussianBlur(img, (5, 5), 0),
+    "jpeg_30": lambda img: _jpeg(img, 30),
+    "scale_0.5": lambda img: _scale(img, 0.5),
+}
+
+
+def build_samples(samples_dir: Path, variants: List[str]) -> List[Dict[str, Any]]:
+    """读取示例照片并生成变体，返回 [{name, variant, expected, data(PNG字节)}]"""
+    samples = []
+    for path in sorted(list(samples_dir.glob("photo*.png")) + list(samples_dir.glob("photo*.jpg"))):
+        img = cv2.imread(str(path))
+        if img is None:
+            logger.warning(f"无法读取示例图片: {path}")
+            continue
+        for variant in variants:
+            ok, buf = cv2.imencode(".png", VARIANTS[variant](img))
+            if not ok:
+                continue
+            samples.append({
+                "name": f"{path.name}:{variant}",
+                "image": path.name,
+                "variant": variant,
+                "expected": EXPECTED_NUMBERS.get(path.name),
+                "data": buf.tobytes()
+            })
+    return samples
+
+
+# ----------------------------------------------------------------------
+# 统计
+# ----------------------------------------------------------------------
+def percentile(values: List[float], pct: float) -> float:
+    """百分位数（线性插值，与 loadtest_tracking.py 的统计方法一致）"""
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "mean": round(statistics.mean(values), 4) if values else 0.0
+    }
+
+
+def is_hit(texts: List[str], expected: Optional[str]) -> bool:
+    if expected is None:
+        return bool(texts)
+    return any(expected in text for text in texts)
+
+
+# ----------------------------------------------------------------------
+# 基准测试
+# ----------------------------------------------------------------------
+def run_latency(samples: List[Dict[str, Any]], repeat: int, locate: bool,
+                stages: Optional[List[str]]) -> Dict[str, Any]:
+    """在当前进程中逐张解码，统计单张和分级耗时"""
+    from app.utils.legacy.robust_qr_reader import decode_qr_bytes_detailed
+
+    accept = build_accept(tuple(p["pattern_regex"] for p in DEFAULT_COURIER_PATTERNS))
+    per_image: Dict[str, List[float]] = {}
+    per_stage: Dict[str, List[float]] = {}
+    per_variant: Dict[str, Dict[str, int]] = {}
+    winning_stages: Dict[str, int] = {}
+    hits = 0
+
+    for sample in samples:
+        for round_index in range(repeat):
+            start = time.perf_counter()
+            try:
+                detail = decode_qr_bytes_detailed(sample["data"], stages=stages, accept=accept, locate=locate)
+            except Exception as e:
+                logger.error(f"解码失败 {sample['name']}: {e}")
+                detail = {"texts": [], "stage": None, "stage_times": {}}
+            elapsed = time.perf_counter() - start
+
+            per_image.setdefault(sample["name"], []).append(elapsed)
+            for stage, stage_time in detail["stage_times"].items():
+                per_stage.setdefault(stage, []).append(stage_time)
+
+            if round_index == 0:
+                hit = is_hit(detail["texts"], sample["expected"])
+                hits += hit
+                variant_stats = per_variant.setdefault(sample["variant"], {"total": 0, "hits": 0})
+                variant_stats["total"] += 1
+                variant_stats["hits"] += hit
+                winning = detail["stage"] or "miss"
+                winning_stages[winning] = winning_stages.get(winning, 0) + 1
+
+    all_times = [t for times in per_image.values() for t in times]
+    return {
+        "overall": summarize(all_times),
+        "hit_rate": round(hits / len(samples), 4) if samples else 0.0,
+        "per_image": {name: summarize(times) for name, times in per_image.items()},
+        "per_stage": {stage: summarize(times) for stage, times in per_stage.items()},
+        "per_variant_hit_rate": {
+            variant: round(stats["hits"] / stats["total"], 4) for variant, stats in per_variant.items()
+        },
+        "winning_stages": winning_stages
+    }
+
+
+def run_service(samples: List[Dict[str, Any]], workers: int, locate: bool,
+                stages: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    经 QRRecognitionService 识别：recognize_bytes 逐张识别两遍（第一遍缓存未命中，第二遍命中），
+    再用 recognize_images 批量识别一次（缓存命中时不再解码）
+
+    使用SQLite内存数据库中的默认识别模式、独立的进程内识别缓存和解码进程池，不读写共享的Redis缓存
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from app.models.base import Base
+    from app.services import qr_recognition
+    from app.services.courier_patterns import courier_pattern_registry, seed_courier_patterns
+    from app.services.recognition_cache import RecognitionCache
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed_courier_patterns(db)
+    pool = QRDecodePool(max_workers=workers, stages=stages, locate=locate)
+    original = qr_recognition.qr_decode_pool, qr_recognition.recognition_cache
+    qr_recognition.qr_decode_pool = pool
+    qr_recognition.recognition_cache = RecognitionCache(max_items=max(1, len(samples)))
+    try:
+        service = qr_recognition.QRRecognitionService(db)
+        passes: Dict[str, List[float]] = {"cold": [], "warm": []}
+        hits = 0
+        for name, times in passes.items():
+            for sample in samples:
+                start = time.perf_counter()
+                result = service.recognize_bytes(sample["data"], sample["name"])
+                times.append(time.perf_counter() - start)
+                if name == "cold":
+                    numbers = [item["number"] for item in result["tracking_numbers"]]
+                    hits += sample["expected"] in numbers if sample["expected"] else bool(numbers)
+
+        qr_recognition.recognition_cache.clear()
+        with tempfile.TemporaryDirectory(prefix="qr_benchmark_") as temp_dir:
+            paths = []
+            for index, sample in enumerate(samples):
+                path = os.path.join(temp_dir, f"{index}.png")
+                with open(path, "wb") as f:
+                    f.write(sample["data"])
+                paths.append(path)
+            start = time.perf_counter()
+            service.recognize_images(paths)
+            batch_seconds = time.perf_counter() - start
+    finally:
+        qr_recognition.qr_decode_pool, qr_recognition.recognition_cache = original
+        pool.shutdown(wait=True)
+        db.close()
+        courier_pattern_registry.invalidate()
+
+    return {
+        "cold": summarize(passes["cold"]),
+        "warm": summarize(passes["warm"]),
+        "tracking_number_hit_rate": round(hits / len(samples), 4) if samples else 0.0,
+        "batch_seconds": round(batch_seconds, 3),
+        "batch_images_per_second": round(len(samples) / batch_seconds, 2) if batch_seconds else 0.0
+    }
+
+
+def run_throughput(samples: List[Dict[str, Any]], max_workers: int, locate: bool,
+                   stages: Optional[List[str]]) -> Dict[str, Any]:
+    """通过解码进程池批量解码，测量 1..N 个进程下的吞吐量（图片/秒）"""
+    patterns = [p["pattern_regex"] for p in DEFAULT_COURIER_PATTERNS]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="qr_benchmark_") as temp_dir:
+        paths = []
+        for index, sample in enumerate(samples):
+            path = os.path.join(temp_dir, f"{index}.png")
+            with open(path, "wb") as f:
+                f.write(sample["data"])
+            paths.append(path)
+
+        for workers in range(1, max_workers + 1):
+            pool = QRDecodePool(max_workers=workers, stages=stages, locate=locate)
+            try:
+                pool.decode_many(paths[:workers], patterns)   # 预热子进程
+                start = time.perf_counter()
+                pool.decode_many(paths, patterns)
+                elapsed = time.perf_counter() - start
+            finally:
+                pool.shutdown(wait=True)
+            results[str(workers)] = {
+                "seconds": round(elapsed, 3),
+                "images_per_second": round(len(paths) / elapsed, 2) if elapsed else 0.0
+            }
+            logger.info(f"{workers} 个进程: {results[str(workers)]['images_per_second']} 张/秒")
+    return results
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                        max_latency_regression: float, max_accuracy_drop: float) -> List[str]:
+    """与基线比较，返回退化说明列表（为空表示通过）"""
+    problems = []
+    base_latency = baseline["latency"]
+    latency = report["latency"]
+
+    for key in ("p50", "p95"):
+        base_value = base_latency["overall"][key]
+        value = latency["overall"][key]
+        if base_value and value > base_value * (1 + max_latency_regression):
+            problems.append(f"整体耗时 {key} 从 {base_value:.4f}s 退化到 {value:.4f}s")
+
+    base_service, service = baseline.get("service"), report.get("service")
+    if base_service and service:
+        base_value, value = base_service["cold"]["p95"], service["cold"]["p95"]
+        if base_value and value > base_value * (1 + max_latency_regression):
+            problems.append(f"识别服务耗时 p95 从 {base_value:.4f}s 退化到 {value:.4f}s")
+        if service["tracking_number_hit_rate"] < base_service["tracking_number_hit_rate"] - max_accuracy_drop:
+            problems.append(f"识别服务单号命中率从 {base_service['tracking_number_hit_rate']:.2%} "
+                            f"下降到 {service['tracking_number_hit_rate']:.2%}")
+
+    if latency["hit_rate"] < base_latency["hit_rate"] - max_accuracy_drop:
+        problems.append(f"命中率从 {base_latency['hit_rate']:.2%} 下降到 {latency['hit_rate']:.2%}")
+
+    for variant, base_rate in base_latency.get("per_variant_hit_rate", {}).items():
+        rate = latency["per_variant_hit_rate"].get(variant)
+        if rate is not None and rate < base_rate - max_accuracy_drop:
+            problems.append(f"变体 {variant} 命中率从 {base_rate:.2%} 下降到 {rate:.2%}")
+
+    return problems
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency"]
+    print("=" * 60)
+    print(f"样本数: {report['sample_count']}  命中率: {latency['hit_rate']:.2%}")
+    print(f"整体耗时: p50={latency['overall']['p50']:.4f}s  p95={latency['overall']['p95']:.4f}s")
+    print("-" * 60)
+    print("各解码级别耗时:")
+    for stage, stats in latency["per_stage"].items():
+        print(f"  {stage:<12} p50={stats['p50']:.4f}s  p95={stats['p95']:.4f}s  次数={stats['count']}")
+    print("命中级别分布:", latency["winning_stages"])
+    print("各变体命中率:", latency["per_variant_hit_rate"])
+    service = report.get("service")
+    if service:
+        print("-" * 60)
+        print(f"识别服务: 单号命中率 {service['tracking_number_hit_rate']:.2%}")
+        for name, label in (("cold", "缓存未命中"), ("warm", "缓存命中")):
+            print(f"  {label}: p50={service[name]['p50']:.4f}s  p95={service[name]['p95']:.4f}s")
+        print(f"  批量识别: {service['batch_images_per_second']} 张/秒 ({service['batch_seconds']}s)")
+    if report.get("throughput"):
+        print("-" * 60)
+        print("吞吐量:")
+        for workers, stats in report["throughput"].items():
+            print(f"  {workers} 个进程: {stats['images_per_second']} 张/秒 ({stats['seconds']}s)")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="二维码识别基准测试")
+    parser.add_argument("--samples-dir", default=str(SAMPLES_DIR), help="示例照片目录")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="要生成的变体，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每张图片重复解码次数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="吞吐量测试的最大进程数")
+    parser.add_argument("--skip-throughput", action="store_true", help="跳过进程池吞吐量测试")
+    parser.add_argument("--skip-service", action="store_true", help="跳过识别服务测试")
+    parser.add_argument("--locate", action="store_true", help="启用区域定位")
+    parser.add_argument("--stages", default=None, help="解码级别顺序，逗号分隔（默认使用内置顺序）")
+    parser.add_argument("--output", default=None, help="报告输出路径（JSON）")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="基线文件路径")
+    parser.add_argument("--write-baseline", action="store_true", help="将本次结果写为基线")
+    parser.add_argument("--max-latency-regression", type=float, default=0.25, help="允许的耗时增长比例")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.02, help="允许的命中率下降")
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown:
+        parser.error(f"未知的变体: {unknown}")
+    stages = [s.strip() for s in args.stages.split(",")] if args.stages else None
+
+    samples = build_samples(Path(args.samples_dir), variants)
+    if not samples:
+        logger.error(f"{args.samples_dir} 下没有示例照片")
+        return 1
+    logger.info(f"共 {len(samples)} 个样本（{len(variants)} 种变体）")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "sample_count": len(samples),
+        "variants": variants,
+        "locate": args.locate,
+        "stages": stages,
+        "latency": run_latency(samples, args.repeat, args.locate, stages),
+        "service": None if args.skip_service else run_service(samples, args.workers, args.locate, stages),
+        "throughput": None if args.skip_throughput else run_throughput(samples, args.workers, args.locate, stages)
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.write_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"基线已写入 {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare_to_baseline(
+            report, baseline, args.max_latency_regression, args.max_accuracy_drop
+        )
+        if problems:
+            for problem in problems:
+                logger.error(f"性能退化: {problem}")
+            return 1
+        logger.info("与基线相比无退化")
+    else:
+        logger.info(f"未找到基线文件 {args.baseline}，跳过比较（可使用 --write-baseline 生成）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
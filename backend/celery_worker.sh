@@ -76,6 +76,30 @@ start_worker() {
     celery -A app.tasks.celery_app worker --loglevel=info --concurrency=4 --events
 }
 
+# 启动流水线Worker (消费识别/物流查询/文档生成队列，需设置 PIPELINE_BACKEND=celery)
+start_pipeline_worker() {
+    log_step "启动流水线Worker..."
+    
+    cd "$(dirname "$0")"
+    
+    if [ -d "venv" ]; then
+        source venv/bin/activate
+    else
+        log_error "虚拟环境不存在"
+        exit 1
+    fi
+    
+    export PYTHONPATH=$PWD:$PYTHONPATH
+    
+    if ! check_redis; then
+        exit 1
+    fi
+    
+    log_info "启动流水线Worker进程 (队列: recognition,tracking,render)..."
+    celery -A app.tasks.celery_app worker -Q recognition,tracking,render \
+        --loglevel=info --concurrency=4 --prefetch-multiplier=1 -n pipeline@%h --events
+}
+
 # 启动Celery Beat (定时任务调度器)
 start_beat() {
     log_step "启动Celery Beat..."
@@ -183,6 +207,9 @@ main() {
         "worker")
             start_worker
             ;;
+        "pipeline")
+            start_pipeline_worker
+            ;;
         "beat")
             start_beat
             ;;
@@ -206,8 +233,9 @@ main() {
             start_worker
             ;;
         *)
-            echo "用法: $0 {worker|beat|flower|status|purge|dev}"
+            echo "用法: $0 {worker|pipeline|beat|flower|status|purge|dev}"
             echo "  worker  - 启动Celery Worker"
+            echo "  pipeline - 启动流水线Worker(识别/物流/生成队列)"
             echo "  beat    - 启动Celery Beat调度器"
             echo "  flower  - 启动Flower监控界面"
             echo "  status  - 查看Celery状态"
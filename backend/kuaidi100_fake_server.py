@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+快递100 离线替身服务器（压测和联调用，不消耗真实查询额度）
+- POST /poll/query.do   实时查询：校验签名 MD5(param + key + customer)，按时间推进包裹状态
+                        （揽收 -> 在途 -> 派件 -> 签收），返回与快递100相同格式的结果
+- GET  /autonumber/auto 智能单号识别
+- POST /poll            订阅推送（只记录，不回调）
+- GET  /stats           调用统计（各接口次数、每个单号的查询次数、限流/错误次数）
+- POST /reset           清空统计和包裹状态
+可配置响应延迟、随机错误率、限流（超过 QPS 返回 429）和周期性 429 突发
+
+用法:
+    python kuaidi100_fake_server.py --port 8100 --latency-ms 80 --error-rate 0.01 --upstream-qps 20
+    # 后端使用替身：KUAIDI100_QUERY_URL=http://127.0.0.1:8100/poll/query.do
+    #              KUAIDI100_AUTONUMBER_URL=http://127.0.0.1:8100/autonumber/auto
+    #              KUAIDI100_SUBSCRIBE_URL=http://127.0.0.1:8100/poll
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 与 ExpressTrackingService 使用的授权信息一致，后端无需修改即可通过签名校验
+DEFAULT_KEY = "GUpgAlsJ4403"
+DEFAULT_CUSTOMER = "5813A47FED91DD26A0EF340F2A194938"
+
+TRANSIT_CONTEXTS = [
+    "快件已到达【{city}邮区中心局】",
+    "快件离开【{city}邮区中心局】，正在发往下一站",
+    "快件已到达【{city}转运中心】",
+    "快件已从【{city}转运中心】发出",
+]
+CITIES = ["北京", "上海", "广州", "深圳", "杭州", "南京", "武汉", "成都"]
+
+
+@dataclass
+class FakeKuaidi100Config:
+    """替身服务器配置"""
+    key: str = DEFAULT_KEY
+    customer: str = DEFAULT_CUSTOMER
+    latency_ms: float = 50.0          # 平均响应延迟
+    jitter_ms: float = 20.0           # 延迟抖动（均匀分布 ±jitter）
+    error_rate: float = 0.0           # 随机返回 HTTP 500 的比例
+    not_found_rate: float = 0.0       # 单号查无结果的比例（按单号固定）
+    qps: float = 0.0                  # 超过该速率返回 429（0 表示不限）
+    burst_every: float = 0.0          # 每隔多少秒进入一次 429 突发（0 表示关闭）
+    burst_length: float = 0.0         # 每次 429 突发持续秒数
+    step_seconds: float = 60.0        # 包裹状态推进一步所需秒数
+    seed: int = 0
+
+
+@dataclass
+class _Parcel:
+    first_seen: datetime
+    transit_steps: int
+    city_offset: int
+
+
+@dataclass
+class _Stats:
+    started_at: float = field(default_factory=time.monotonic)
+    calls: Counter = field(default_factory=Counter)
+    responses: Counter = field(default_factory=Counter)
+    numbers: Counter = field(default_factory=Counter)
+
+
+class FakeKuaidi100:
+    """替身服务的状态与业务逻辑（与HTTP层分离，便于在进程内直接使用）"""
+
+    def __init__(self, config: Optional[FakeKuaidi100Config] = None):
+        self.config = config or FakeKuaidi100Config()
+        self._random = random.Random(self.config.seed)
+        self._parcels: Dict[str, _Parcel] = {}
+        self._stats = _Stats()
+        self._lock = threading.Lock()
+        # 令牌桶（qps 限流）
+        self._tokens = max(self.config.qps, 1.0)
+        self._refilled_at = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # 限流与故障注入
+    # ------------------------------------------------------------------
+    def _in_burst(self, now: float) -> bool:
+        if self.config.burst_every <= 0 or self.config.burst_length <= 0:
+            return False
+        return (now - self._stats.started_at) % self.config.burst_every < self.config.burst_length
+
+    def admit(self) -> Optional[int]:
+        """决定本次请求是否注入故障，返回需要返回的HTTP状态码（None 表示正常处理）"""
+        now = time.monotonic()
+        with self._lock:
+            if self._in_burst(now):
+                return 429
+            if self.config.qps > 0:
+                self._tokens = min(self.config.qps, self._tokens + (now - self._refilled_at) * self.config.qps)
+                self._refilled_at = now
+                if self._tokens < 1:
+                    return 429
+                self._tokens -= 1
+            if self.config.error_rate > 0 and self._random.random() < self.config.error_rate:
+                return 500
+        return None
+
+    def delay(self):
+        jitter = self._random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        time.sleep(max(0.0, self.config.latency_ms + jitter) / 1000)
+
+    def record(self, endpoint: str, status: Any, number: Optional[str] = None):
+        with self._lock:
+            self._stats.calls[endpoint] += 1
+            self._stats.responses[f"{endpoint}:{status}"] += 1
+            if number:
+                self._stats.numbers[number] += 1
+
+    # ------------------------------------------------------------------
+    # 接口
+    # ------------------------------------------------------------------
+    def sign(self, param: str) -> str:
+        return hashlib.md5((param + self.config.key + self.config.customer).encode()).hexdigest().upper()
+
+    def query(self, form: Dict[str, str]) -> Tuple[int, Dict[str, Any], Optional[str]]:
+        """实时查询，返回 (HTTP状态码, 响应体, 单号)"""
+        param = form.get("param", "")
+        if form.get("customer") != self.config.customer or form.get("sign", "").upper() != self.sign(param):
+            return 200, {"result": False, "returnCode": "408", "message": "验证签名失败"}, None
+        try:
+            request = json.loads(param)
+        except ValueError:
+            return 200, {"result": False, "returnCode": "400", "message": "参数格式错误"}, None
+
+        number = str(request.get("num", "")).strip()
+        company = str(request.get("com", "")).strip() or "ems"
+        if not number:
+            return 200, {"result": False, "returnCode": "400", "message": "单号不能为空"}, None
+        if self._digest(number) % 10000 < self.config.not_found_rate * 10000:
+            return 200, {"result": False, "returnCode": "500", "message": "查询无结果，请隔段时间再查"}, number
+        return 200, self.tracking_result(number, company), number
+
+    def autonumber(self, number: str) -> List[Dict[str, Any]]:
+        code = "shunfeng" if number.upper().startswith("SF") else "ems"
+        return [{"comCode": code, "lengthPre": len(number), "noCount": 100}]
+
+    def subscribe(self, form: Dict[str, str]) -> Dict[str, Any]:
+        try:
+            json.loads(form.get("param", ""))
+        except ValueError:
+            return {"result": False, "returnCode": "400", "message": "参数格式错误"}
+        return {"result": True, "returnCode": "200", "message": "提交成功"}
+
+    # ------------------------------------------------------------------
+    # 包裹状态推进
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _digest(number: str) -> int:
+        return int(hashlib.md5(number.encode()).hexdigest()[:8], 16)
+
+    def _parcel(self, number: str) -> _Parcel:
+        with self._lock:
+            parcel = self._parcels.get(number)
+            if parcel is None:
+                digest = self._digest(number)
+                parcel = _Parcel(first_seen=datetime.now(), transit_steps=2 + digest % 3, city_offset=digest % len(CITIES))
+                self._parcels[number] = parcel
+            return parcel
+
+    def tracking_result(self, number: str, company: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """按首次查询以来经过的时间生成物流轨迹：揽收 -> 在途 x N -> 派件 -> 签收"""
+        parcel = self._parcel(number)
+        now = now or datetime.now()
+        steps = int((now - parcel.first_seen).total_seconds() // max(self.config.step_seconds, 0.001))
+        final_step = parcel.transit_steps + 2
+
+        events = []
+        for step in range(min(steps, final_step) + 1):
+            at = parcel.first_seen + timedelta(seconds=step * self.config.step_seconds)
+            city = CITIES[(parcel.city_offset + step) % len(CITIES)]
+            if step == 0:
+                events.append((at, "揽收", f"【{city}】已收寄，揽投员：张三", "1"))
+            elif step <= parcel.transit_steps:
+                context = TRANSIT_CONTEXTS[(step - 1) % len(TRANSIT_CONTEXTS)].format(city=city)
+                events.append((at, "在途", context, "0"))
+            elif step == parcel.transit_steps + 1:
+                events.append((at, "派件", f"【{city}】正在投递，投递员：李四", "5"))
+            else:
+                events.append((at, "签收", "已签收，签收人：本人", "3"))
+
+        state = events[-1][3]
+        data = [
+            {
+                "time": at.strftime("%Y-%m-%d %H:%M:%S"),
+                "ftime": at.strftime("%Y-%m-%d %H:%M:%S"),
+                "context": context,
+                "status": status,
+                "areaName": CITIES[parcel.city_offset]
+            }
+            for at, status, context, _ in reversed(events)
+        ]
+        return {
+            "message": "ok",
+            "nu": number,
+            "ischeck": "1" if state == "3" else "0",
+            "com": company,
+            "status": "200",
+            "state": state,
+            "condition": "F00",
+            "data": data
+        }
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            numbers = self._stats.numbers
+            query_calls = sum(numbers.values())
+            return {
+                "uptime_seconds": round(time.monotonic() - self._stats.started_at, 3),
+                "calls": dict(self._stats.calls),
+                "responses": dict(self._stats.responses),
+                "query_calls": query_calls,
+                "unique_numbers": len(numbers),
+                "duplicate_queries": query_calls - len(numbers),
+                "max_queries_per_number": max(numbers.values()) if numbers else 0,
+                "rate_limited": sum(v for k, v in self._stats.responses.items() if k.endswith(":429")),
+                "server_errors": sum(v for k, v in self._stats.responses.items() if k.endswith(":500"))
+            }
+
+    def reset(self):
+        with self._lock:
+            self._parcels.clear()
+            self._stats = _Stats()
+
+
+def _make_handler(fake: FakeKuaidi100):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: Any):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _form(self) -> Dict[str, str]:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8") if length else ""
+            return {k: v[0] for k, v in parse_qs(body).items()}
+
+        def _faulted(self, endpoint: str) -> bool:
+            status = fake.admit()
+            if status is None:
+                return False
+            fake.record(endpoint, status)
+            self._send(status, {"result": False, "returnCode": str(status), "message": "替身服务注入的故障"})
+            return True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stats":
+                self._send(200, fake.get_stats())
+            elif url.path == "/autonumber/auto":
+                if self._faulted("autonumber"):
+                    return
+                number = (parse_qs(url.query).get("num") or [""])[0]
+                fake.delay()
+                fake.record("autonumber", 200)
+                self._send(200, fake.autonumber(number))
+            else:
+                self._send(404, {"message": "not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            form = self._form()
+            if url.path == "/reset":
+                fake.reset()
+                self._send(200, {"result": True})
+            elif url.path == "/poll/query.do":
+                if self._faulted("query"):
+                    return
+                fake.delay()
+                status, body, number = fake.query(form)
+                fake.record("query", body.get("returnCode", body.get("status", status)), number)
+                self._send(status, body)
+            elif url.path == "/poll":
+                if self._faulted("subscribe"):
+                    return
+                fake.delay()
+                body = fake.subscribe(form)
+                fake.record("subscribe", body["returnCode"])
+                self._send(200, body)
+            else:
+                self._send(404, {"message": "not found"})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class FakeKuaidi100Server:
+    """在后台线程中运行的替身HTTP服务器"""
+
+    def __init__(self, config: Optional[FakeKuaidi100Config] = None, host: str = "127.0.0.1", port: int = 0):
+        self.fake = FakeKuaidi100(config)
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self.fake))
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def urls(self) -> Dict[str, str]:
+        """后端需要配置的接口地址"""
+        return {
+            "KUAIDI100_QUERY_URL": f"{self.base_url}/poll/query.do",
+            "KUAIDI100_AUTONUMBER_URL": f"{self.base_url}/autonumber/auto",
+            "KUAIDI100_SUBSCRIBE_URL": f"{self.base_url}/poll",
+        }
+
+    def start(self) -> "FakeKuaidi100Server":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-kuaidi100", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeKuaidi100Server":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """替身服务器配置参数（压测脚本复用）"""
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="平均响应延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="延迟抖动（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 HTTP 500 的比例")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="查无结果的单号比例")
+    parser.add_argument("--upstream-qps", type=float, default=0.0, help="超过该速率返回 429（0 不限）")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="每隔多少秒进入一次 429 突发")
+    parser.add_argument("--burst-length", type=float, default=0.0, help="每次 429 突发持续秒数")
+    parser.add_argument("--step-seconds", type=float, default=60.0, help="包裹状态推进一步所需秒数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeKuaidi100Config:
+    return FakeKuaidi100Config(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        not_found_rate=args.not_found_rate,
+        qps=args.upstream_qps,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        step_seconds=args.step_seconds,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="快递100离线替身服务器")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8100, help="监听端口")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeKuaidi100Server(config_from_args(args), args.host, args.port)
+    logger.info(f"快递100替身服务器已启动: {server.base_url}")
+    for name, url in server.urls.items():
+        logger.info(f"  {name}={url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
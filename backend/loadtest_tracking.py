@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+物流查询压测
+启动快递100离线替身服务器（kuaidi100_fake_server.py），按目标 RPS 驱动物流查询链路，报告：
+- 吞吐量、延迟 p50/p90/p95/p99、错误数
+- 上游（替身服务器）调用次数、重复查询次数、429 次数
+- 查询缓存和合并请求的统计（进程内运行时）
+
+场景:
+    get          GET  /tracking/{tracking_number}
+    batch-query  POST /tracking/batch-query
+    sweep        定时任务 update_all_pending_tracking（SQLite临时库中的到期任务）
+
+默认在进程内挂载物流接口（SQLite临时库），也可以用 --base-url 压测已启动的服务
+（该服务需通过环境变量把快递100地址指向替身服务器，见 kuaidi100_fake_server.py）
+
+用法:
+    python loadtest_tracking.py --scenario get --rps 50 --duration 20 --numbers 200
+    python loadtest_tracking.py --scenario batch-query --rps 5 --batch-size 20 --upstream-qps 20
+    python loadtest_tracking.py --scenario sweep --tasks 2000 --numbers 500
+    python loadtest_tracking.py --scenario get --base-url http://127.0.0.1:8000/api/v1 --fake-url http://127.0.0.1:8100
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from kuaidi100_fake_server import FakeKuaidi100Server, add_config_arguments, config_from_args
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+# 每个请求一行的客户端日志会淹没报告
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SCENARIOS = ["get", "batch-query", "sweep"]
+
+
+def make_numbers(count: int, seed: int) -> List[str]:
+    """生成EMS国内数字单号（13位，1开头，本地规则即可识别为 ems，不触发智能单号识别）"""
+    rng = random.Random(seed)
+    return [f"11{rng.randrange(10 ** 10, 10 ** 11):011d}" for _ in range(count)]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def summarize_latency(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.mean(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p90_ms": round(percentile(values, 90) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2) if values else 0.0,
+    }
+
+
+# ----------------------------------------------------------------------
+# 环境
+# ----------------------------------------------------------------------
+class LoadTestEnv:
+    """压测环境：替身服务器、SQLite临时库和进程内应用"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.fake_server: Optional[FakeKuaidi100Server] = None
+        self.fake_url = args.fake_url
+        self.db_path: Optional[str] = None
+        self.Session = None
+
+    def start(self):
+        if not self.fake_url:
+            self.fake_server = FakeKuaidi100Server(config_from_args(self.args)).start()
+            self.fake_url = self.fake_server.base_url
+            logger.info(f"快递100替身服务器: {self.fake_url}")
+
+        # 快递100客户端在首次创建服务时读取地址，必须在创建任何服务之前设置
+        settings.KUAIDI100_QUERY_URL = f"{self.fake_url}/poll/query.do"
+        settings.KUAIDI100_AUTONUMBER_URL = f"{self.fake_url}/autonumber/auto"
+        settings.KUAIDI100_SUBSCRIBE_URL = f"{self.fake_url}/poll"
+        settings.KUAIDI100_QPS = self.args.client_qps
+        settings.KUAIDI100_BURST = max(1, int(self.args.client_qps))
+
+        if self.args.base_url and self.args.scenario != "sweep":
+            return
+
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.models.base import Base
+        import app.models  # noqa: F401  注册所有模型
+
+        fd, self.db_path = tempfile.mkstemp(prefix="loadtest_tracking_", suffix=".db")
+        os.close(fd)
+        engine = create_engine(f"sqlite:///{self.db_path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(bind=engine)
+
+        if self.args.fresh_cache:
+            from app.services.tracking_cache import tracking_cache
+            tracking_cache.clear()
+
+    def stop(self):
+        if self.fake_server:
+            self.fake_server.stop()
+        if self.db_path and os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def upstream_stats(self) -> Dict[str, Any]:
+        if self.fake_server:
+            return self.fake_server.fake.get_stats()
+        return httpx.get(f"{self.fake_url}/stats", timeout=10).json()
+
+    def reset_upstream(self):
+        if self.fake_server:
+            self.fake_server.fake.reset()
+        else:
+            httpx.post(f"{self.fake_url}/reset", timeout=10)
+
+    def build_app(self):
+        """进程内挂载物流接口，数据库依赖替换为SQLite临时库"""
+        from fastapi import FastAPI
+        from app.api.api_v1.endpoints import tracking
+        from app.core.database import get_db
+
+        app = FastAPI()
+        app.include_router(tracking.router, prefix="/api/v1/tracking")
+
+        def override_get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        return app
+
+    def http_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=self.args.max_in_flight, max_keepalive_connections=self.args.max_in_flight)
+        if self.args.base_url:
+            return httpx.AsyncClient(base_url=self.args.base_url, timeout=60, limits=limits)
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.build_app()), base_url="http://loadtest/api/v1", timeout=60
+        )
+
+
+# ----------------------------------------------------------------------
+# 按目标RPS发送请求（开环：按固定节奏发出，不等待前一个请求完成）
+# ----------------------------------------------------------------------
+async def drive(send: Callable[[int], Awaitable[int]], rps: float, duration: float,
+                max_in_flight: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    in_flight = 0
+    dropped = 0
+
+    async def one(index: int):
+        nonlocal in_flight
+        started = time.perf_counter()
+        try:
+            status = await send(index)
+            statuses[str(status)] += 1
+        except Exception as e:
+            statuses[e.__class__.__name__] += 1
+        finally:
+            latencies.append(time.perf_counter() - started)
+            in_flight -= 1
+
+    interval = 1.0 / rps
+    start = time.perf_counter()
+    pending = []
+    index = 0
+    while True:
+        scheduled = start + index * interval
+        if scheduled - start >= duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if in_flight >= max_in_flight:
+            # 达到并发上限说明服务跟不上目标速率，丢弃本次请求并计数
+            dropped += 1
+        else:
+            in_flight += 1
+            pending.append(asyncio.create_task(one(index)))
+        index += 1
+
+    await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - start
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "target_rps": rps,
+        "sent": len(pending),
+        "dropped": dropped,
+        "ok": ok,
+        "errors": len(pending) - ok,
+        "statuses": dict(statuses),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(pending) / elapsed, 2) if elapsed else 0.0,
+        "latency": summarize_latency(latencies),
+    }
+
+
+async def run_http(env: LoadTestEnv, numbers: List[str]) -> Dict[str, Any]:
+    args = env.args
+    rng = random.Random(args.seed)
+
+    async with env.http_client() as client:
+        if args.scenario == "get":
+            async def send(index: int) -> int:
+                response = await client.get(f"/tracking/{rng.choice(numbers)}")
+                return response.status_code
+        else:
+            async def send(index: int) -> int:
+                batch = rng.sample(numbers, min(args.batch_size, len(numbers)))
+                response = await client.post(
+                    "/tracking/batch-query", json={"tracking_numbers": batch, "company_code": "ems"}
+                )
+                return response.status_code
+
+        return await drive(send, args.rps, args.duration, args.max_in_flight)
+
+
+def run_sweep(env: LoadTestEnv, numbers: List[str]) -> Dict[str, Any]:
+    """在SQLite临时库中写入到期的跟踪任务，执行定时更新任务"""
+    from app.models.task import Task, TaskStatusEnum
+    from app.tasks import tracking_tasks
+
+    args = env.args
+    db = env.Session()
+    past = datetime.now() - timedelta(minutes=1)
+    db.bulk_save_objects([
+        Task(
+            task_id=f"LOADTEST-{i}",
+            tracking_number=numbers[i % len(numbers)],
+            courier_company="EMS数字单号",
+            status=TaskStatusEnum.TRACKING,
+            next_check_at=past,
+            created_at=past
+        )
+        for i in range(args.tasks)
+    ])
+    db.commit()
+    db.close()
+
+    tracking_tasks.SessionLocal = env.Session
+    settings.TRACKING_DUE_BATCH_LIMIT = max(settings.TRACKING_DUE_BATCH_LIMIT, args.tasks)
+
+    started = time.perf_counter()
+    result = tracking_tasks.update_all_pending_tracking()
+    elapsed = time.perf_counter() - started
+
+    stats = result.get("stats", {})
+    chunks = stats.get("chunks", [])
+    return {
+        "tasks": args.tasks,
+        "checked": stats.get("total_checked", 0),
+        "updated": stats.get("updated", 0),
+        "completed": stats.get("completed", 0),
+        "failed": stats.get("failed", 0),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_tasks_per_second": round(stats.get("total_checked", 0) / elapsed, 2) if elapsed else 0.0,
+        "chunk_count": len(chunks),
+        "chunk_fetch": summarize_latency([chunk["fetch_seconds"] for chunk in chunks]),
+        "chunk_write": summarize_latency([chunk["write_seconds"] for chunk in chunks]),
+    }
+
+
+def local_stats() -> Dict[str, Any]:
+    """进程内的缓存和合并请求统计"""
+    from app.services.tracking_cache import tracking_cache
+    from app.services.tracking_singleflight import tracking_singleflight
+    return {"cache": tracking_cache.get_stats(), "singleflight": tracking_singleflight.get_stats()}
+
+
+def print_report(report: Dict[str, Any]):
+    result = report["result"]
+    upstream = report["upstream"]
+    print("=" * 60)
+    print(f"场景: {report['scenario']}  单号数: {report['numbers']}")
+    if report["scenario"] == "sweep":
+        print(f"任务: {result['checked']}/{result['tasks']}  更新 {result['updated']}  完成 {result['completed']}  "
+              f"失败 {result['failed']}")
+        print(f"耗时: {result['elapsed_seconds']}s  吞吐量: {result['throughput_tasks_per_second']} 任务/秒  "
+              f"分段数: {result['chunk_count']}")
+        print(f"分段查询: p50={result['chunk_fetch']['p50_ms']}ms  p95={result['chunk_fetch']['p95_ms']}ms")
+        print(f"分段写入: p50={result['chunk_write']['p50_ms']}ms  p95={result['chunk_write']['p95_ms']}ms")
+    else:
+        latency = result["latency"]
+        print(f"目标 {result['target_rps']} RPS  实际 {result['throughput_rps']} RPS  "
+              f"发送 {result['sent']}  丢弃 {result['dropped']}  错误 {result['errors']}")
+        print(f"延迟: p50={latency['p50_ms']}ms  p90={latency['p90_ms']}ms  p95={latency['p95_ms']}ms  "
+              f"p99={latency['p99_ms']}ms  max={latency['max_ms']}ms")
+        print("状态码:", result["statuses"])
+    print("-" * 60)
+    print(f"上游查询: {upstream.get('query_calls', 0)} 次  单号 {upstream.get('unique_numbers', 0)} 个  "
+          f"重复 {upstream.get('duplicate_queries', 0)} 次  429 {upstream.get('rate_limited', 0)} 次  "
+          f"500 {upstream.get('server_errors', 0)} 次")
+    if report.get("local"):
+        cache = report["local"]["cache"]
+        flight = report["local"]["singleflight"]
+        print("缓存:", {k: v for k, v in cache.items() if not isinstance(v, dict)})
+        print("合并请求:", flight)
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="物流查询压测")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="get", help="压测场景")
+    parser.add_argument("--rps", type=float, default=20.0, help="目标每秒请求数（get/batch-query）")
+    parser.add_argument("--duration", type=float, default=10.0, help="压测时长（秒）")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="最大并发请求数，超过时丢弃请求")
+    parser.add_argument("--numbers", type=int, default=100, help="参与压测的不同单号数量（越少缓存命中越多）")
+    parser.add_argument("--batch-size", type=int, default=20, help="batch-query 每次请求的单号数（最多20）")
+    parser.add_argument("--tasks", type=int, default=500, help="sweep 场景写入的到期任务数")
+    parser.add_argument("--client-qps", type=float, default=settings.KUAIDI100_QPS, help="后端令牌桶速率")
+    parser.add_argument("--fresh-cache", action="store_true", help="开始前清空物流查询缓存")
+    parser.add_argument("--base-url", default=None, help="压测已启动的服务（如 http://127.0.0.1:8000/api/v1）")
+    parser.add_argument("--fake-url", default=None, help="使用已启动的替身服务器（默认在进程内启动）")
+    parser.add_argument("--output", default=None, help="报告输出路径（JSON）")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.batch_size > 20:
+        parser.error("--batch-size 不能超过20（接口限制）")
+
+    env = LoadTestEnv(args)
+    env.start()
+    try:
+        numbers = make_numbers(args.numbers, args.seed)
+        env.reset_upstream()
+        if args.scenario == "sweep":
+            result = run_sweep(env, numbers)
+        else:
+            result = asyncio.run(run_http(env, numbers))
+
+        report = {
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "scenario": args.scenario,
+            "numbers": args.numbers,
+            "result": result,
+            "upstream": env.upstream_stats(),
+            "local": None if args.base_url and args.scenario != "sweep" else local_stats(),
+        }
+        print_report(report)
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        env.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
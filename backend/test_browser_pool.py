@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+截图浏览器池单元测试
+验证浏览器复用、按渲染次数和内存占用回收、出错与健康检查失败时替换、Chrome检测结果缓存（浏览器使用替身）
+"""
+
+import logging
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.browser_pool import BrowserPool, BrowserUnavailableError, _PooledBrowser
+
+
+class FakeDriver:
+    """记录调用的WebDriver替身"""
+
+    def __init__(self):
+        self.alive = True
+        self.quit_called = False
+        self.cdp_commands = []
+        self.window_handles = ["main"]
+        self.switch_to = self
+        self.service = None
+
+    def window(self, handle):
+        pass
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise RuntimeError("chrome not reachable")
+        return 1
+
+    def execute_cdp_cmd(self, command, params):
+        self.cdp_commands.append(command)
+
+    def set_window_size(self, width, height):
+        pass
+
+    def get(self, url):
+        self.url = url
+
+    def quit(self):
+        self.quit_called = True
+
+
+def _available():
+    return {"available": True, "driver_path": "/usr/bin/chromedriver"}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = BrowserPool(max_size=2, max_renders=3, max_memory_mb=0, acquire_timeout=1)
+    pool.started = []
+
+    def start(driver_path):
+        entry = _PooledBrowser(FakeDriver())
+        pool.started.append(entry.driver)
+        pool._count("started")
+        return entry
+
+    monkeypatch.setattr(pool, "_start", start)
+    return pool
+
+
+class TestBrowserPool:
+    """截图浏览器池测试类"""
+
+    def test_browser_is_reused_and_reset(self, pool):
+        """连续截图复用同一个浏览器，归还时清除Cookie并回到空白页"""
+        drivers = []
+        for _ in range(2):
+            with pool.browser(_available) as driver:
+                driver.get("file:///tmp/a.html")
+                drivers.append(driver)
+
+        assert drivers[0] is drivers[1]
+        assert len(pool.started) == 1
+        assert drivers[0].url == "about:blank"
+        assert "Network.clearBrowserCookies" in drivers[0].cdp_commands
+        assert pool.get_stats()["reused"] == 1
+
+    def test_recycled_after_max_renders(self, pool):
+        """渲染次数达到上限后关闭并启动新浏览器"""
+        for _ in range(4):
+            with pool.browser(_available):
+                pass
+
+        assert len(pool.started) == 2
+        assert pool.started[0].quit_called
+        assert pool.get_stats()["recycled_renders"] == 1
+
+    def test_recycled_when_memory_exceeds_limit(self, pool):
+        """浏览器进程树内存超过上限时关闭并启动新浏览器"""
+        pytest.importorskip("psutil")
+        pool.max_memory_mb = 1
+        process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        try:
+            with pool.browser(_available) as driver:
+                driver.service = SimpleNamespace(process=process)
+            with pool.browser(_available) as replacement:
+                pass
+        finally:
+            process.kill()
+            process.wait()
+
+        assert replacement is not driver
+        assert driver.quit_called
+        assert pool.get_stats()["recycled_memory"] == 1
+
+    def test_missing_psutil_warns_once(self, pool, monkeypatch, caplog):
+        """未安装psutil时只记录一次警告，浏览器仍按渲染次数复用"""
+        monkeypatch.setitem(sys.modules, "psutil", None)
+        pool.max_memory_mb = 1
+        with caplog.at_level(logging.WARNING, logger="app.services.browser_pool"):
+            for _ in range(2):
+                with pool.browser(_available):
+                    pass
+
+        assert len(pool.started) == 1
+        assert pool.get_stats()["recycled_memory"] == 0
+        assert len([r for r in caplog.records if "psutil" in r.getMessage()]) == 1
+
+    def test_failed_render_and_unhealthy_browser_are_replaced(self, pool):
+        """渲染出错的浏览器直接关闭，健康检查失败的空闲浏览器在借出前替换"""
+        with pytest.raises(ValueError):
+            with pool.browser(_available):
+                raise ValueError("render failed")
+        assert pool.started[0].quit_called
+
+        with pool.browser(_available) as driver:
+            pass
+        driver.alive = False
+        with pool.browser(_available) as replacement:
+            pass
+
+        assert replacement is not driver
+        stats = pool.get_stats()
+        assert stats["recycled_error"] == 1
+        assert stats["unhealthy"] == 1
+
+    def test_chrome_check_is_cached(self, pool):
+        """Chrome检测失败时在重试间隔内不重复检测"""
+        calls = []
+
+        def unavailable():
+            calls.append(1)
+            return {"available": False, "error": "未找到Chrome浏览器"}
+
+        for _ in range(3):
+            with pytest.raises(BrowserUnavailableError):
+                with pool.browser(unavailable):
+                    pass
+
+        assert len(calls) == 1
+        assert pool.started == []
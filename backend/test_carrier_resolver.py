@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+快递公司识别单元测试
+验证二维码域名、快递公司名称、单号前缀/长度规则和快递100智能单号识别（httpx.MockTransport，不访问网络）
+"""
+
+import os
+import sys
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.carrier_resolver import CarrierResolver
+from app.services.kuaidi100_client import Kuaidi100Client
+
+
+def make_client(handler) -> Kuaidi100Client:
+    client = Kuaidi100Client("key", "customer", autonumber_url="https://kuaidi100.test/autonumber/auto")
+    client._client = httpx.Client(transport=httpx.MockTransport(handler))
+    return client
+
+
+class TestCarrierResolver:
+    """快递公司识别测试类"""
+
+    def test_number_rules(self):
+        """前缀/长度规则：各规则均可命中，长度不符时不误判"""
+        resolver = CarrierResolver()
+        assert resolver.match_number("EA123456789CN") == "ems"
+        assert resolver.match_number("1151242358360") == "ems"
+        assert resolver.match_number("SF1234567890123") == "shunfeng"
+        assert resolver.match_number("123456789012") == "zhongtong"
+        assert resolver.match_number("1234567890") == "yuantong"
+        assert resolver.match_number("YT7654321") == "yuantong"
+        assert resolver.match_number("268123456789012") == "shentong"
+        assert resolver.match_number("SF12345") is None
+        assert resolver.match_number("4312345678901") is None
+
+    def test_url_host_and_name_take_precedence(self):
+        """二维码域名优先，其次是识别到的快递公司名称"""
+        resolver = CarrierResolver()
+        assert resolver.resolve("123456789012", qr_content="https://mini.ems.com.cn/youzheng/mini/123456789012") == "ems"
+        assert resolver.resolve("123456789012", courier="EMS数字单号") == "ems"
+        assert resolver.resolve("4312345678901", courier="韵达速递") == "yunda"
+        assert resolver.resolve("123456789012", courier="通用数字单号") == "zhongtong"
+
+    def test_autonumber_is_cached(self):
+        """本地无法确定时调用智能单号识别，结果按单号缓存"""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json=[{"comCode": "yunda", "lengthPre": 13, "noCount": 100}])
+
+        resolver = CarrierResolver()
+        client = make_client(handler)
+        assert resolver.resolve("4312345678901", courier="通用数字单号", client=client) == "yunda"
+        assert resolver.resolve("4312345678901", client=client) == "yunda"
+        assert len(requests) == 1
+        assert requests[0].url.params["num"] == "4312345678901"
+
+    def test_autonumber_failure_falls_back(self):
+        """智能识别失败时使用默认编码"""
+        resolver = CarrierResolver()
+        client = make_client(lambda request: httpx.Response(200, json={"returnCode": "500", "message": "key无效"}))
+        assert resolver.resolve("4312345678901", client=client) == "ems"
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+快递单号识别模式注册表单元测试
+验证组合正则按优先级匹配，与逐条 re.match 的结果一致
+"""
+
+import os
+import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.courier_patterns import (
+    CompiledCourierPatterns, CourierPatternEntry, DEFAULT_COURIER_PATTERNS
+)
+
+
+def default_entries():
+    return [
+        CourierPatternEntry(p["courier_name"], p["courier_code"], p["pattern_regex"])
+        for p in DEFAULT_COURIER_PATTERNS
+    ]
+
+
+class TestCourierPatterns:
+    """识别模式测试类"""
+
+    def test_combined_regex_matches_first_pattern_in_priority_order(self):
+        """组合正则命中的模式与按优先级逐条匹配的第一个模式相同"""
+        entries = default_entries()
+        patterns = CompiledCourierPatterns(entries)
+
+        for text in ["EA123456789CN", "SF123456789012", "123456789012",
+                     "1151242358360", "12345678901234", "hello", "SF12"]:
+            expected = next((e for e in entries if re.match(e.pattern_regex, text)), None)
+            assert patterns.match(text) == expected
+
+        assert patterns.match("1151242358360").courier_code == "ems_number"
+
+    def test_uncombinable_patterns_fall_back(self):
+        """含编号反向引用的模式无法合并时退化为逐条匹配"""
+        patterns = CompiledCourierPatterns([
+            CourierPatternEntry("重复", "repeat", r"^(\d)\1{9}$"),
+            CourierPatternEntry("数字", "digits", r"^\d{10}$"),
+        ])
+        assert patterns.match("1111111111").courier_code == "repeat"
+        assert patterns.match("1234567890").courier_code == "digits"
+        assert patterns.match("abc") is None
+
+    def test_backreference_pattern_after_others(self):
+        """反向引用模式不在第一位时仍能匹配，且保持优先级顺序"""
+        patterns = CompiledCourierPatterns([
+            CourierPatternEntry("顺丰", "shunfeng", r"^SF\d{3}$"),
+            CourierPatternEntry("重复", "repeat", r"^(\d)\1{9}$"),
+            CourierPatternEntry("数字", "digits", r"^\d{10}$"),
+        ])
+        assert patterns.match("SF123").courier_code == "shunfeng"
+        assert patterns.match("1111111111").courier_code == "repeat"
+        assert patterns.match("1234567890").courier_code == "digits"
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+快递100客户端单元测试
+使用 httpx.MockTransport 模拟接口，验证签名、连接复用和错误转换（不访问网络）
+"""
+
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.kuaidi100_client import Kuaidi100Client, Kuaidi100Error
+
+
+def _make_client(handler) -> Kuaidi100Client:
+    client = Kuaidi100Client("key", "customer", url="https://kuaidi100.test/poll/query.do")
+    client._client = httpx.Client(transport=httpx.MockTransport(handler))
+    return client
+
+
+class TestKuaidi100Client:
+    """快递100客户端测试类"""
+
+    def test_query_signs_payload(self):
+        """请求参数带正确签名，结果原样返回"""
+        received = []
+
+        def handler(request):
+            form = {k: v[0] for k, v in parse_qs(request.content.decode()).items()}
+            received.append(form)
+            return httpx.Response(200, json={"status": "200", "state": "0", "data": []})
+
+        client = _make_client(handler)
+        result = client.query("1151242358360", "ems")
+        client.query("1151242358361", "ems")
+
+        assert result["status"] == "200"
+        assert len(received) == 2
+        form = received[0]
+        assert json.loads(form["param"])["num"] == "1151242358360"
+        assert form["sign"] == client.sign(form["param"])
+
+    def test_errors_become_kuaidi100_error(self):
+        """非2xx响应和网络错误统一转换为 Kuaidi100Error"""
+        client = _make_client(lambda request: httpx.Response(429, text="too many"))
+        with pytest.raises(Kuaidi100Error):
+            client.query("1151242358360", "ems")
+
+        def broken(request):
+            raise httpx.ConnectError("refused", request=request)
+
+        client = _make_client(broken)
+        with pytest.raises(Kuaidi100Error):
+            client.query("1151242358360", "ems")
+
+    def test_async_query(self):
+        """异步接口与同步接口返回相同结果"""
+        client = Kuaidi100Client("key", "customer", url="https://kuaidi100.test/poll/query.do")
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            client._async_clients[loop] = httpx.AsyncClient(
+                transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"status": "200"}))
+            )
+            try:
+                return await client.aquery("1151242358360", "ems")
+            finally:
+                await client.aclose()
+
+        assert asyncio.run(run()) == {"status": "200"}
+
+    def test_run_sync_reuses_async_pool(self):
+        """同步代码多次批量查询使用同一个事件循环和异步连接池，不会每次新建"""
+        from app.services.tracking_batch import run_sync
+
+        client = Kuaidi100Client("key", "customer", url="https://kuaidi100.test/poll/query.do")
+        pools = []
+
+        async def query():
+            pool = client._get_async_client()
+            if not pools:
+                pool._transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"status": "200"}))
+            pools.append(pool)
+            return await client.aquery("1151242358360", "ems")
+
+        assert run_sync(query()) == run_sync(query()) == {"status": "200"}
+        assert pools[0] is pools[1] and not pools[0].is_closed
+        assert len(client._async_clients) == 1
+        run_sync(client.aclose())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+任务流水线引擎单元测试
+验证阶段并发限制、有界队列背压和阶段间衔接，不依赖数据库
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.pipeline_engine import PipelineEngine, PipelineStage
+
+
+def make_engine(recognition=2, tracking=2, render=1, queue_size=10):
+    return PipelineEngine(
+        stage_limits={
+            PipelineStage.RECOGNITION: recognition,
+            PipelineStage.TRACKING: tracking,
+            PipelineStage.RENDER: render,
+        },
+        queue_size=queue_size
+    )
+
+
+class TestPipelineEngine:
+    """流水线引擎测试类"""
+
+    def test_stage_concurrency_limit(self):
+        """同一阶段同时运行的任务数不超过配置的并发数"""
+        engine = make_engine(recognition=3)
+        state = {"running": 0, "peak": 0}
+
+        async def handler(task_id):
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.01)
+            state["running"] -= 1
+
+        async def scenario():
+            engine.register_handler(PipelineStage.RECOGNITION, handler)
+            for i in range(12):
+                await engine.submit(PipelineStage.RECOGNITION, f"task_{i}")
+            await engine.join(PipelineStage.RECOGNITION)
+            await engine.shutdown()
+
+        asyncio.run(scenario())
+        assert state["peak"] == 3
+        assert engine.get_stats()["recognition"]["completed"] == 12
+
+    def test_submit_backpressure(self):
+        """队列已满时 submit 等待，submit_nowait 返回 False"""
+        engine = make_engine(recognition=1, queue_size=1)
+
+        async def scenario():
+            gate = asyncio.Event()
+
+            async def handler(task_id):
+                await gate.wait()
+
+            engine.register_handler(PipelineStage.RECOGNITION, handler)
+            await engine.submit(PipelineStage.RECOGNITION, "task_0")  # 被worker取走后阻塞
+            await asyncio.sleep(0)
+            await engine.submit(PipelineStage.RECOGNITION, "task_1")  # 占满队列
+
+            blocked = asyncio.create_task(engine.submit(PipelineStage.RECOGNITION, "task_2"))
+            await asyncio.sleep(0.05)
+            assert not blocked.done()
+            assert engine.submit_nowait(PipelineStage.RECOGNITION, "task_3") is False
+
+            gate.set()
+            await asyncio.wait_for(blocked, timeout=1)
+            await engine.join()
+            await engine.shutdown()
+
+        asyncio.run(scenario())
+        stats = engine.get_stats()["recognition"]
+        assert stats["completed"] == 3
+        assert stats["rejected"] == 1
+
+    def test_run_blocking_keeps_event_loop_free(self):
+        """阻塞调用在阶段线程池中执行，事件循环仍可调度其他协程"""
+        engine = make_engine(tracking=2)
+        ticks = []
+
+        def blocking_call(value):
+            time.sleep(0.1)
+            return value, threading.current_thread().name
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            result, _ = await asyncio.gather(
+                engine.run_blocking(PipelineStage.TRACKING, blocking_call, 42),
+                ticker()
+            )
+            await engine.shutdown()
+            return result
+
+        value, thread_name = asyncio.run(scenario())
+        assert value == 42
+        assert thread_name.startswith("pipeline-tracking")
+        assert len(ticks) == 5
+
+    def test_stage_handoff(self):
+        """识别→物流→生成 按阶段依次衔接"""
+        engine = make_engine()
+        visited = []
+
+        async def scenario():
+            async def recognize(task_id):
+                visited.append(("recognition", task_id))
+                await engine.submit(PipelineStage.TRACKING, task_id)
+
+            async def track(task_id):
+                visited.append(("tracking", task_id))
+                await engine.submit(PipelineStage.RENDER, task_id)
+
+            async def render(task_id):
+                visited.append(("render", task_id))
+
+            engine.register_handler(PipelineStage.RECOGNITION, recognize)
+            engine.register_handler(PipelineStage.TRACKING, track)
+            engine.register_handler(PipelineStage.RENDER, render)
+
+            await engine.submit(PipelineStage.RECOGNITION, "task_a")
+            for stage in PipelineStage:
+                await engine.join(stage)
+            await engine.shutdown()
+
+        asyncio.run(scenario())
+        assert visited == [
+            ("recognition", "task_a"),
+            ("tracking", "task_a"),
+            ("render", "task_a"),
+        ]
+
+    def test_handler_failure_is_isolated(self):
+        """单个任务失败不影响worker继续处理"""
+        engine = make_engine(render=1)
+        done = []
+
+        async def handler(task_id):
+            if task_id == "bad":
+                raise RuntimeError("render failed")
+            done.append(task_id)
+
+        async def scenario():
+            engine.register_handler(PipelineStage.RENDER, handler)
+            for task_id in ("bad", "good"):
+                await engine.submit(PipelineStage.RENDER, task_id)
+            await engine.join(PipelineStage.RENDER)
+            await engine.shutdown()
+
+        asyncio.run(scenario())
+        stats = engine.get_stats()["render"]
+        assert done == ["good"]
+        assert stats["failed"] == 1
+        assert stats["completed"] == 1
+
+    def test_celery_backend_dispatch(self, monkeypatch):
+        """Celery模式下阶段交接投递到对应的阶段任务，不使用本地队列"""
+        from app.tasks.celery_app import celery_app
+
+        sent = []
+        monkeypatch.setattr(
+            celery_app, "send_task",
+            lambda name, args=None, **kwargs: sent.append((name, args))
+        )
+        engine = PipelineEngine(
+            stage_limits={stage: 1 for stage in PipelineStage},
+            backend="celery"
+        )
+
+        async def scenario():
+            await engine.start()
+            await engine.dispatch(PipelineStage.RECOGNITION, "task_a")
+            assert engine.dispatch_nowait(PipelineStage.RENDER, "task_b") is True
+
+        asyncio.run(scenario())
+        assert sent == [
+            ("app.tasks.pipeline_tasks.recognize_task", ["task_a"]),
+            ("app.tasks.pipeline_tasks.render_task", ["task_b"]),
+        ]
+        assert engine.get_stats()["recognition"]["queue_size"] == 0
+
+    def test_local_backend_restart_request(self, monkeypatch):
+        """本地模式下其他进程请求重新执行时，经Redis重启队列交给本进程引擎执行"""
+        import collections
+        from app.services import pipeline_engine
+
+        monkeypatch.setattr(pipeline_engine, "RESTART_POLL_TIMEOUT", 0.1)
+
+        class FakeRedis:
+            def __init__(self):
+                self.items = collections.deque()
+
+            def rpush(self, key, value):
+                self.items.append(value)
+
+            def blpop(self, key, timeout):
+                deadline = time.monotonic() + timeout
+                while not self.items and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                return (key, self.items.popleft()) if self.items else None
+
+        engine = make_engine()
+        engine._redis = FakeRedis()
+        handled = []
+
+        async def scenario():
+            done = asyncio.Event()
+
+            async def render(task_id):
+                handled.append(task_id)
+                done.set()
+
+            engine.register_handler(PipelineStage.RENDER, render)
+            await engine.start()
+            # 模拟Celery worker中的定时检查（另一个线程同步调用）
+            assert await asyncio.to_thread(engine.request_restart, PipelineStage.RENDER, "task_a")
+            await asyncio.wait_for(done.wait(), timeout=2)
+            await engine.shutdown()
+
+        asyncio.run(scenario())
+        assert handled == ["task_a"]
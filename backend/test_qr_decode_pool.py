@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+二维码解码进程池单元测试
+验证批量解码结果按输入顺序返回、进程池损坏或已关闭时退化为当前进程解码，以及 max_workers=0 时不创建子进程
+（解码函数使用模块级替身，可被子进程按名称加载）
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import qr_decode_pool
+from app.services.qr_decode_pool import QRDecodePool
+
+
+def stub_decode(source, stages=None, accept_patterns=(), locate=False):
+    """替身解码：内容即识别结果，越靠前的图片耗时越长，记录执行解码的进程"""
+    text = source.decode() if isinstance(source, bytes) else source
+    if text.isdigit():
+        time.sleep(0.02 * (5 - int(text) % 5))
+    return {
+        "path": None if isinstance(source, bytes) else source,
+        "texts": [text] if text else [],
+        "stage": "opencv" if text else None,
+        "stage_times": {},
+        "error": None,
+        "decode_time": 0.0,
+        "pid": os.getpid()
+    }
+
+
+class BrokenExecutor:
+    """提交任务即失败的进程池（模拟 BrokenProcessPool）"""
+
+    def __init__(self):
+        self.closed = False
+
+    def map(self, func, items, chunksize=1):
+        raise RuntimeError("A process in the process pool was terminated abruptly")
+
+    def shutdown(self, wait=False):
+        self.closed = True
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(qr_decode_pool, "_decode_path", stub_decode)
+    monkeypatch.setattr(qr_decode_pool, "_decode_buffer", stub_decode)
+
+
+class TestQRDecodePool:
+    """解码进程池测试类"""
+
+    def test_decode_many_keeps_input_order(self, stub):
+        """多个子进程并发解码，耗时不同，结果仍按输入顺序返回"""
+        pool = QRDecodePool(max_workers=2)
+        try:
+            paths = [str(i) for i in range(10)]
+            results = pool.decode_many(paths)
+        finally:
+            pool.shutdown(wait=True)
+
+        assert [r["texts"] for r in results] == [[path] for path in paths]
+        assert os.getpid() not in {r["pid"] for r in results}
+        assert pool.get_stats()["stage_hits"] == {"opencv": 10}
+
+    def test_decode_bytes_in_worker(self, stub):
+        """内存中的图片数据在子进程中解码，空结果计为 miss"""
+        pool = QRDecodePool(max_workers=1)
+        try:
+            hit = pool.decode_bytes(b"1151242358360")
+            miss = pool.decode_bytes(b"")
+        finally:
+            pool.shutdown(wait=True)
+
+        assert hit["texts"] == ["1151242358360"] and hit["pid"] != os.getpid()
+        assert miss["texts"] == []
+        assert pool.get_stats()["stage_hits"] == {"opencv": 1, "miss": 1}
+
+    def test_broken_pool_falls_back_to_current_process(self, stub):
+        """进程池异常时丢弃进程池，本批及之后的请求都在当前进程解码"""
+        pool = QRDecodePool(max_workers=2)
+        broken = BrokenExecutor()
+        pool._executor = broken
+
+        results = pool.decode_many(["1", "2", "3"])
+
+        assert [r["texts"] for r in results] == [["1"], ["2"], ["3"]]
+        assert {r["pid"] for r in results} == {os.getpid()}
+        assert broken.closed and pool._executor is None and pool._disabled
+        assert pool.decode_bytes(b"4")["pid"] == os.getpid()
+
+    def test_shut_down_pool_falls_back_to_current_process(self, stub):
+        """进程池在外部被关闭后提交任务失败，退化为当前进程解码"""
+        pool = QRDecodePool(max_workers=1)
+        executor = ProcessPoolExecutor(max_workers=1)
+        executor.shutdown(wait=True)
+        pool._executor = executor
+
+        results = pool.decode_many(["2", "1"])
+
+        assert [r["texts"] for r in results] == [["2"], ["1"]]
+        assert {r["pid"] for r in results} == {os.getpid()}
+        assert pool._disabled
+
+    def test_zero_workers_decodes_in_process(self, stub):
+        """max_workers=0 时不创建子进程，直接在当前进程解码"""
+        pool = QRDecodePool(max_workers=0)
+
+        results = pool.decode_many(["3", "1", "2"])
+        detail = pool.decode_bytes(b"1151242358360")
+
+        assert [r["texts"] for r in results] == [["3"], ["1"], ["2"]]
+        assert {r["pid"] for r in results} == {os.getpid()}
+        assert detail["pid"] == os.getpid()
+        assert pool._executor is None
+        assert pool.get_stats()["workers"] == 0
+
+    def test_default_workers_follow_cpu_count(self):
+        """未指定进程数时按CPU核心数创建"""
+        assert QRDecodePool().max_workers == (os.cpu_count() or 1)
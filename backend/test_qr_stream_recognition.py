@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+流式批量识别接口单元测试
+验证多文件逐条输出结果、识别任务逐条保存，以及数据库读写不在事件循环线程中执行
+（SQLite内存数据库，解码使用替身）
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.api.api_v1.endpoints import qr_recognition as endpoint
+from app.core.database import get_db
+from app.models import RecognitionResult, RecognitionTask
+from app.models.base import Base
+from app.models.recognition import RecognitionStatusEnum
+from app.services import qr_recognition
+from app.services.courier_patterns import courier_pattern_registry
+from app.services.recognition_cache import RecognitionCache
+
+QR_URL = "https://mini.ems.com.cn/youzheng/mini/{}"
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@pytest.fixture
+def env(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    # 图片内容即单号，空内容视为未识别到二维码
+    def fake_decode(content, patterns):
+        text = content.decode()
+        return {"texts": [QR_URL.format(text)] if text else [], "stage": "opencv"}
+
+    monkeypatch.setattr(qr_recognition.qr_decode_pool, "decode_bytes", fake_decode)
+    monkeypatch.setattr(qr_recognition, "recognition_cache", RecognitionCache(max_items=16))
+    monkeypatch.setattr(endpoint, "SessionLocal", Session)
+
+    # 记录数据库读写是否发生在事件循环线程中
+    db_calls = []
+    service = qr_recognition.QRRecognitionService
+    for name in ("create_recognition_task", "update_task_status", "_save_recognition_result",
+                 "_get_accept_patterns"):
+        original = getattr(service, name)
+
+        def wrapper(self, *args, _original=original, _name=name, **kwargs):
+            db_calls.append((_name, _on_event_loop()))
+            return _original(self, *args, **kwargs)
+
+        monkeypatch.setattr(service, name, wrapper)
+
+    app = FastAPI()
+    app.include_router(endpoint.router, prefix="/api/v1/qr")
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    courier_pattern_registry.invalidate()
+    yield Session, TestClient(app), db_calls
+    courier_pattern_registry.invalidate()
+
+
+class TestQRStreamRecognition:
+    """流式批量识别接口测试类"""
+
+    def test_streams_result_per_file_and_saves_task(self, env):
+        """每个文件输出一行结果，识别任务逐条保存结果并标记完成，数据库操作均在线程中执行"""
+        Session, client, db_calls = env
+        numbers = ["1151242358360", "1151242358361", ""]
+        files = [
+            ("files", (f"photo_{i}.jpg", number.encode(), "image/jpeg"))
+            for i, number in enumerate(numbers)
+        ]
+
+        response = client.post(
+            "/api/v1/qr/recognize-batch/stream",
+            files=files,
+            data={"task_name": "回证批量识别"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["type"] for line in lines] == ["start", "result", "result", "result", "summary"]
+
+        results = {line["index"]: line for line in lines if line["type"] == "result"}
+        assert sorted(results) == [0, 1, 2]
+        assert results[0]["filename"] == "photo_0.jpg"
+        assert results[1]["raw_results"] == [QR_URL.format("1151242358361")]
+        assert results[2]["is_success"] is False
+        assert lines[-1]["success_count"] == 2
+        assert lines[-1]["error_count"] == 1
+
+        db = Session()
+        task = db.query(RecognitionTask).one()
+        assert lines[0]["task_id"] == task.id
+        assert task.status == RecognitionStatusEnum.COMPLETED
+        assert db.query(RecognitionResult).filter_by(task_id=task.id).count() == 3
+        db.close()
+
+        names = {name for name, _ in db_calls}
+        assert {"create_recognition_task", "update_task_status", "_save_recognition_result"} <= names
+        assert not [name for name, on_loop in db_calls if on_loop]
+
+    def test_sse_format(self, env):
+        """response_format=sse 时按 text/event-stream 输出事件"""
+        _, client, _ = env
+        files = [("files", (f"photo_{i}.jpg", b"1151242358360", "image/png")) for i in range(2)]
+
+        response = client.post(
+            "/api/v1/qr/recognize-batch/stream",
+            files=files,
+            data={"response_format": "sse"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line for line in response.text.splitlines() if line.startswith("event: ")]
+        assert events == ["event: start", "event: result", "event: result", "event: summary"]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+识别结果缓存单元测试
+验证内容哈希键、LRU淘汰、命中统计和按解码配置区分的缓存键（进程内缓存，不依赖Redis）
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.recognition_cache import RecognitionCache
+
+
+class TestRecognitionCache:
+    """识别缓存测试类"""
+
+    def test_same_content_same_key(self):
+        """相同图片内容得到相同的键，不同内容键不同"""
+        assert RecognitionCache.hash_bytes(b"photo") == RecognitionCache.hash_bytes(b"photo")
+        assert RecognitionCache.hash_bytes(b"photo") != RecognitionCache.hash_bytes(b"photo2")
+
+    def test_hit_miss_counters(self):
+        """命中和未命中分别计数"""
+        cache = RecognitionCache(max_items=4)
+        digest = cache.hash_bytes(b"photo")
+
+        assert cache.get(digest) is None
+        cache.set(digest, {"texts": ["https://mini.ems.com.cn/youzheng/mini/1151240728560"], "stage": "opencv"})
+        assert cache.get(digest)["stage"] == "opencv"
+        assert cache.contains(digest)
+
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_lru_eviction(self):
+        """超过容量时淘汰最久未使用的条目"""
+        cache = RecognitionCache(max_items=2)
+        cache.set("a", {"texts": []})
+        cache.set("b", {"texts": []})
+        cache.get("a")                      # a 变为最近使用
+        cache.set("c", {"texts": []})       # 淘汰 b
+
+        assert cache.contains("a")
+        assert not cache.contains("b")
+        assert cache.contains("c")
+        assert cache.get_stats()["local_items"] == 2
+
+    def test_service_skips_empty_results_and_versions_keys(self, monkeypatch):
+        """未识别到内容的结果不缓存；单号规则或解码配置变化后不再命中旧结果"""
+        from app.core.config import settings
+        from app.services import qr_recognition
+
+        cache = RecognitionCache(max_items=8)
+        monkeypatch.setattr(qr_recognition, "recognition_cache", cache)
+        decoded = {"texts": []}
+        decodes = []
+        monkeypatch.setattr(qr_recognition.qr_decode_pool, "decode_bytes",
+                            lambda content, patterns: decodes.append(patterns) or dict(decoded))
+        service = qr_recognition.QRRecognitionService(None)
+        patterns = [r"^\d{13}$"]
+        monkeypatch.setattr(service, "_get_accept_patterns", lambda: list(patterns))
+
+        service._decode_bytes_cached(b"photo")
+        decoded = {"texts": ["1151242358360"], "stage": "opencv"}
+        assert service._decode_bytes_cached(b"photo")["texts"] == ["1151242358360"]
+        assert service._decode_bytes_cached(b"photo")["cache_hit"] is True
+        assert len(decodes) == 2
+
+        patterns.append(r"^SF\d{12}$")
+        service._decode_bytes_cached(b"photo")
+        monkeypatch.setattr(settings, "QR_DECODE_LOCATE", not settings.QR_DECODE_LOCATE)
+        service._decode_bytes_cached(b"photo")
+        assert len(decodes) == 4
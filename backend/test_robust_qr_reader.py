@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+二维码解码器单元测试
+- 分级解码：用替身级别验证按开销排序执行、命中被接受的结果即停止、进程池的各级命中统计
+- 区域定位：大尺寸照片中定位候选区域、按原始分辨率裁剪解码，定位失败时回退到分级解码
+（合成图片；未安装 libzbar 时仅使用 OpenCV 后端）
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+cv2 = pytest.importorskip("cv2")
+qrcode = pytest.importorskip("qrcode")
+
+from app.services.qr_decode_pool import QRDecodePool
+from app.utils.legacy import robust_qr_reader
+
+QR_TEXT = "https://mini.ems.com.cn/youzheng/mini/1151242358360"
+
+
+def make_photo(width=3000, height=2400, qr_side=300, origin=(2300, 1700)):
+    """白底大图，右下角放一个较小的二维码，其余区域加少量噪声；返回 (图片, 二维码外框)"""
+    rng = np.random.default_rng(0)
+    img = np.full((height, width, 3), 235, dtype=np.uint8)
+    img += rng.integers(0, 15, size=img.shape, dtype=np.uint8)
+
+    matrix = qrcode.QRCode(border=4, box_size=1)
+    matrix.add_data(QR_TEXT)
+    matrix.make(fit=True)
+    modules = np.array(matrix.get_matrix(), dtype=np.uint8)
+    code = np.where(modules, 0, 255).astype(np.uint8)
+    code = cv2.resize(code, (qr_side, qr_side), interpolation=cv2.INTER_NEAREST)
+
+    x, y = origin
+    img[y:y + qr_side, x:x + qr_side] = cv2.cvtColor(code, cv2.COLOR_GRAY2BGR)
+    return img, (x, y, x + qr_side, y + qr_side)
+
+
+def encode(img) -> bytes:
+    ok, buffer = cv2.imencode(".png", img)
+    assert ok
+    return buffer.tobytes()
+
+
+def stub_stages(monkeypatch, outputs):
+    """用替身替换全部解码级别：outputs 为 {级别: 返回的文本列表}，返回按调用顺序记录的级别名"""
+    calls = []
+    stages = {}
+    for name in robust_qr_reader.DEFAULT_STAGE_ORDER:
+        def stage(img, _name=name):
+            calls.append(_name)
+            return [{"text": text, "points": None} for text in outputs.get(_name, [])]
+        stages[name] = stage
+    monkeypatch.setattr(robust_qr_reader, "DECODE_STAGES", stages)
+    return calls
+
+
+def accept_number(text):
+    return text.isdigit()
+
+
+class TestRobustQRReaderCascade:
+    """分级解码测试类（替身级别，不需要 ZBar）"""
+
+    def test_runs_every_stage_in_cost_order_when_nothing_found(self, monkeypatch):
+        """没有结果时按默认顺序执行全部级别"""
+        calls = stub_stages(monkeypatch, {})
+        cascade = robust_qr_reader._run_cascade(np.zeros((10, 10), dtype=np.uint8))
+
+        assert calls == list(robust_qr_reader.DEFAULT_STAGE_ORDER)
+        assert list(cascade["stage_times"]) == calls
+        assert cascade["results"] == [] and cascade["stage"] is None
+
+    def test_stops_at_first_hit_without_accept(self, monkeypatch):
+        """未提供 accept 时任一级得到结果即停止"""
+        calls = stub_stages(monkeypatch, {"opencv": ["hello"], "warp": ["1151242358360"]})
+        cascade = robust_qr_reader._run_cascade(np.zeros((10, 10), dtype=np.uint8))
+
+        assert calls == ["pyzbar_gray", "opencv"]
+        assert cascade["stage"] == "opencv"
+
+    def test_stops_at_first_accepted_hit(self, monkeypatch):
+        """提供 accept 时跳过不被接受的结果，直到某一级得到单号；所有结果去重保留"""
+        calls = stub_stages(monkeypatch, {
+            "opencv": ["hello"], "pyzbar": ["hello"], "warp": ["1151242358360"], "clahe": ["1151242358361"]
+        })
+        cascade = robust_qr_reader._run_cascade(np.zeros((10, 10), dtype=np.uint8), accept=accept_number)
+
+        assert calls == ["pyzbar_gray", "opencv", "pyzbar", "warp"]
+        assert cascade["stage"] == "warp"
+        assert [r["text"] for r in cascade["results"]] == ["hello", "1151242358360"]
+
+    def test_unaccepted_results_report_first_stage(self, monkeypatch):
+        """没有被接受的结果时执行全部级别，命中级别为第一个得到结果的级别"""
+        stub_stages(monkeypatch, {"pyzbar": ["hello"]})
+        cascade = robust_qr_reader._run_cascade(np.zeros((10, 10), dtype=np.uint8), accept=accept_number)
+
+        assert cascade["stage"] == "pyzbar"
+        assert list(cascade["stage_times"]) == list(robust_qr_reader.DEFAULT_STAGE_ORDER)
+
+    def test_custom_stage_order(self, monkeypatch, tmp_path):
+        """按指定的级别顺序执行；未知级别报错"""
+        calls = stub_stages(monkeypatch, {"clahe": ["1151242358360"]})
+        path = tmp_path / "blank.png"
+        cv2.imwrite(str(path), np.full((20, 20, 3), 255, dtype=np.uint8))
+
+        detail = robust_qr_reader.decode_qr_detailed(path, stages=["rotate", "clahe", "opencv"],
+                                                     accept=accept_number)
+        assert calls == ["rotate", "clahe"]
+        assert detail["texts"] == ["1151242358360"]
+        assert detail["stage"] == "clahe"
+        assert list(detail["stage_times"]) == calls
+
+        with pytest.raises(ValueError):
+            robust_qr_reader.decode_qr_detailed(path, stages=["opencv", "unknown"])
+
+    def test_pool_counts_stage_hits(self, monkeypatch):
+        """解码进程池按命中级别累计次数，未识别计为 miss"""
+        outputs = {}
+        stub_stages(monkeypatch, outputs)
+        pool = QRDecodePool(max_workers=1)
+        pool._disabled = True   # 当前进程解码，替身级别生效
+        image = encode(np.full((20, 20, 3), 255, dtype=np.uint8))
+
+        outputs["opencv"] = ["1151242358360"]
+        pool.decode_bytes(image, [r"^\d{13}$"])
+        pool.decode_bytes(image, [r"^\d{13}$"])
+        outputs["opencv"] = []
+        pool.decode_bytes(image, [r"^\d{13}$"])
+
+        assert pool.get_stats()["stage_hits"] == {"opencv": 2, "miss": 1}
+
+
+class TestRobustQRReaderLocate:
+    """区域定位测试类"""
+
+    def test_locate_regions_cover_code(self):
+        """缩小图上定位的候选区域换算回原图坐标后包含二维码，且第一个区域即命中"""
+        img, (qx0, qy0, qx1, qy1) = make_photo()
+        regions = robust_qr_reader._locate_regions(img)
+
+        assert 1 <= len(regions) <= 4
+        x0, y0, x1, y1 = regions[0]
+        assert x0 <= qx0 and y0 <= qy0 and x1 >= qx1 and y1 >= qy1
+        assert (x1 - x0) * (y1 - y0) < img.shape[0] * img.shape[1] * 0.1
+
+    def test_locate_stage_decodes_crop(self):
+        """启用定位时由 "locate" 级在裁剪区域中解码，不再执行后续级别"""
+        img, _ = make_photo()
+        detail = robust_qr_reader.decode_qr_bytes_detailed(encode(img), locate=True)
+
+        assert detail["texts"] == [QR_TEXT]
+        assert detail["stage"] == "locate"
+        assert list(detail["stage_times"]) == ["locate"]
+
+    def test_falls_back_to_cascade_in_order(self, monkeypatch):
+        """候选区域中没有二维码时依次回退到分级解码，命中的级别即停止"""
+        img, _ = make_photo()
+        monkeypatch.setattr(robust_qr_reader, "_locate_regions", lambda image: [(0, 0, 400, 400)])
+
+        detail = robust_qr_reader.decode_qr_bytes_detailed(encode(img), locate=True)
+
+        assert detail["texts"] == [QR_TEXT]
+        assert detail["stage"] != "locate"
+        stages = list(detail["stage_times"])
+        assert stages[0] == "locate"
+        assert stages[1:] == list(robust_qr_reader.DEFAULT_STAGE_ORDER[:len(stages) - 1])
+        assert stages[-1] == detail["stage"]
+
+    def test_rejected_locate_result_continues_cascade(self):
+        """定位得到的内容不满足 accept 时继续执行全部级别，结果仍保留"""
+        img, _ = make_photo()
+        detail = robust_qr_reader.decode_qr_bytes_detailed(
+            encode(img), locate=True, accept=lambda text: text.startswith("SF")
+        )
+
+        assert detail["texts"] == [QR_TEXT]
+        assert detail["stage"] == "locate"
+        assert list(detail["stage_times"]) == ["locate", *robust_qr_reader.DEFAULT_STAGE_ORDER]
+
+    def test_no_code_runs_every_stage(self):
+        """图片中没有二维码时各级都执行一次，返回空结果"""
+        img = np.full((1200, 1600, 3), 235, dtype=np.uint8)
+        detail = robust_qr_reader.decode_qr_bytes_detailed(encode(img), locate=True)
+
+        assert detail["texts"] == []
+        assert detail["stage"] is None
+        assert list(detail["stage_times"]) == ["locate", *robust_qr_reader.DEFAULT_STAGE_ORDER]
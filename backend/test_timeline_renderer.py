@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+物流轨迹图片绘制单元测试
+按像素核对Pillow绘制结果与HTML模板CSS版式一致（边框、圆点、竖线、换行），
+Chrome可用时再与浏览器截图比较版式几何（两者字体不同，不比较文字像素）
+"""
+
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image, ImageStat
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.services import timeline_renderer as renderer_module
+from app.services.timeline_renderer import TimelineRenderer, wrap_text
+
+TRACES = [
+    {"time": "2024-01-03 10:00:00", "context": "已签收，签收人：本人"},
+    {"time": "2024-01-02 08:00:00", "context": "【北京市】快件已到达北京转运中心，下一站上海分拨中心，" * 3},
+    {"time": "2024-01-01 18:00:00", "context": "已揽收"},
+]
+ROW_HEIGHT = 16 * 2 + 18 + 1
+TIMELINE_TOP = ROW_HEIGHT * 2 + 16
+DOT_X = 24 + 16 + 4
+
+
+def _rgb(color: str):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+def _dot_centers(image: Image.Image, x: int = DOT_X):
+    """圆点所在列中各个圆点的中心行号（颜色接近即可，兼容浏览器抗锯齿）"""
+    dot = _rgb(renderer_module.DOT_COLOR)
+    rows = [y for y in range(image.height)
+            if sum(abs(a - b) for a, b in zip(image.getpixel((x, y)), dot)) < 60]
+    runs = []
+    for y in rows:
+        if runs and y == runs[-1][-1] + 1:
+            runs[-1].append(y)
+        else:
+            runs.append([y])
+    return [(run[0] + run[-1]) / 2 for run in runs]
+
+
+def _border_rows(image: Image.Image, x: int = 1000 - 10):
+    """分隔线所在的行号（取卡片右侧空白列）"""
+    border = _rgb(renderer_module.BORDER_COLOR)
+    return [y for y in range(image.height)
+            if sum(abs(a - b) for a, b in zip(image.getpixel((x, y)), border)) < 12]
+
+
+@pytest.fixture
+def renderer():
+    return TimelineRenderer()
+
+
+class TestTimelineRenderer:
+    """物流轨迹图片绘制测试类"""
+
+    def test_layout_matches_template(self, renderer):
+        """卡片宽度、圆角、分隔线、圆点与竖线位置与模板CSS一致"""
+        image = renderer.render("1151242358360", "已签收", "2024-01-03 10:00:00", TRACES)
+
+        assert image.width == 1000
+        assert image.getpixel((0, 0)) == _rgb(renderer_module.PAGE_BACKGROUND)
+        assert image.getpixel((500, ROW_HEIGHT - 1)) == _rgb(renderer_module.BORDER_COLOR)
+        assert image.getpixel((500, ROW_HEIGHT * 2 - 1)) == _rgb(renderer_module.BORDER_COLOR)
+
+        first_dot = TIMELINE_TOP + 4
+        assert image.getpixel((DOT_X, first_dot)) == _rgb(renderer_module.DOT_COLOR)
+        assert image.getpixel((24 + 19, first_dot + 10)) == _rgb(renderer_module.LINE_COLOR)
+        # 最后一条轨迹下方没有竖线
+        assert image.getpixel((24 + 19, image.height - 10)) == _rgb(renderer_module.CARD_BACKGROUND)
+
+    def test_long_description_wraps(self, renderer):
+        """描述超出宽度时换行，图片变高且文字不超出右边距"""
+        lines = wrap_text(TRACES[1]["context"], renderer_module._font(15), 1000 - 48 - 40)
+        assert len(lines) > 1
+
+        short = renderer.render("1151242358360", "运输中", "", [TRACES[0]] * 3)
+        wrapped = renderer.render("1151242358360", "运输中", "", TRACES)
+        assert wrapped.height - short.height == (len(lines) - 1) * 21
+
+        # 第二、三个圆点间距 = 时间行 + 间距 + 第二条描述行数 × 行高 + 轨迹间距
+        dots = _dot_centers(wrapped)
+        assert len(dots) == 3
+        assert dots[2] - dots[1] == 16 + 4 + len(lines) * 21 + 24
+        right_margin = wrapped.crop((1000 - 24 + 2, TIMELINE_TOP, 1000, wrapped.height - 8)).convert("L")
+        assert ImageStat.Stat(right_margin).extrema[0][0] == 255
+
+    def test_pillow_method_does_not_start_browser(self, tmp_path, monkeypatch):
+        """pillow 截图方式直接绘制PNG，不检测也不启动浏览器"""
+        from app.services.browser_pool import browser_pool
+        from app.services.tracking_screenshot import TrackingScreenshotService
+
+        def no_browser(*args, **kwargs):
+            raise AssertionError("pillow 方式不应使用浏览器")
+
+        monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+        monkeypatch.setattr(browser_pool, "browser", no_browser)
+        monkeypatch.setattr(browser_pool, "check_chrome", no_browser)
+        output = tmp_path / "trace.png"
+
+        result = TrackingScreenshotService(None)._render_screenshot(
+            "1151242358360", "已签收", "2024-01-03 10:00:00", TRACES * 10, str(output), "pillow"
+        )
+
+        assert result["success"] and result["method"] == "pillow"
+        assert Image.open(output).format == "PNG"
+
+    def test_wrap_measures_each_token_once(self):
+        """断行时每个不同的断行单位只测量一次宽度"""
+        font = renderer_module._font(15)
+        calls = []
+
+        class CountingFont:
+            def getlength(self, text):
+                calls.append(text)
+                return font.getlength(text)
+
+        text = TRACES[1]["context"]
+        lines = wrap_text(text, CountingFont(), 1000 - 48 - 40)
+
+        assert lines == wrap_text(text, font, 1000 - 48 - 40)
+        assert len(calls) == len(set(calls)) == len(set(renderer_module._TOKEN_PATTERN.findall(text)))
+
+    def test_matches_chrome_geometry(self, renderer, tmp_path, monkeypatch):
+        """
+        与Chrome渲染HTML模板的截图比较版式几何（仅在Chrome可用时运行）
+
+        模板使用无衬线字体，绘制使用仿宋_GB2312，字形、字宽和换行位置不同，
+        只比较宽度、分隔线、前两个圆点（短描述之前）和竖线的位置，不比较文字像素
+        """
+        from app.services.browser_pool import browser_pool
+        from app.services.tracking_screenshot import TrackingScreenshotService
+
+        monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+        service = TrackingScreenshotService(None)
+        if not browser_pool.check_chrome(service._check_chrome_available)["available"]:
+            pytest.skip("Chrome不可用")
+
+        args = ("1151242358360", "已签收", "2024-01-03 10:00:00", TRACES)
+        chrome = Image.open(io.BytesIO(service._render_png(service._render_html(*args)))).convert("RGB")
+        pillow = renderer.render(*args)
+
+        assert chrome.width == pillow.width
+        # 分隔线（取右侧空白处，避开文字；字体行高差异允许少量偏移）
+        chrome_borders, pillow_borders = _border_rows(chrome), _border_rows(pillow)
+        assert len(chrome_borders) == len(pillow_borders) == 2
+        for chrome_row, pillow_row in zip(chrome_borders, pillow_borders):
+            assert abs(chrome_row - pillow_row) <= 3
+        # 圆点数量一致；第三个圆点的位置取决于长描述的换行行数，不比较
+        chrome_dots, pillow_dots = _dot_centers(chrome), _dot_centers(pillow)
+        assert len(chrome_dots) == len(pillow_dots) == len(TRACES)
+        for chrome_row, pillow_row in zip(chrome_dots[:2], pillow_dots[:2]):
+            assert abs(chrome_row - pillow_row) <= 4
+        # 前两个圆点之间都有竖线
+        line = _rgb(renderer_module.LINE_COLOR)
+        for image, dots in ((chrome, chrome_dots), (pillow, pillow_dots)):
+            pixel = image.getpixel((24 + 19, int(sum(dots[:2]) / 2)))
+            assert sum(abs(a - b) for a, b in zip(pixel, line)) < 30
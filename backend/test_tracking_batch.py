@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+物流批量查询引擎单元测试
+使用模拟的异步查询函数，验证结果顺序、限流降并发、令牌桶限速及只在请求上游时消耗令牌（不访问网络）
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.tracking_batch import (
+    PAUSE_SCRIPT, RESERVE_SCRIPT, AdaptiveConcurrency, BatchQueryEngine, RedisTokenBucket, TokenBucket
+)
+
+
+def _engine(qps=1000, concurrency=4, maximum=8) -> BatchQueryEngine:
+    return BatchQueryEngine(
+        TokenBucket(qps, burst=int(qps)),
+        AdaptiveConcurrency(concurrency, minimum=1, maximum=maximum),
+        rate_limit_cooldown=0.01
+    )
+
+
+class TestBatchQueryEngine:
+    """批量查询引擎测试类"""
+
+    def test_results_keep_input_order(self):
+        """耗时不同的查询并发执行，结果仍按输入顺序返回"""
+        async def query(tracking_number, company_code):
+            await asyncio.sleep(0.001 * (10 - int(tracking_number)))
+            return {"success": True, "tracking_number": tracking_number}
+
+        numbers = [str(i) for i in range(10)]
+        results = _engine().run_sync(query, [(n, "ems") for n in numbers])
+        assert [r["tracking_number"] for r in results] == numbers
+
+    def test_rate_limit_halves_concurrency_and_retries(self):
+        """收到限流回复时并发减半，被限流的单号重试后成功"""
+        attempts = {}
+
+        async def query(tracking_number, company_code):
+            attempts[tracking_number] = attempts.get(tracking_number, 0) + 1
+            if tracking_number == "3" and attempts[tracking_number] == 1:
+                return {"success": False, "error": "网络请求失败: HTTP 429 Too Many Requests",
+                        "error_category": "api_rate_limit"}
+            return {"success": True, "tracking_number": tracking_number}
+
+        engine = _engine(concurrency=8)
+        results = engine.run_sync(query, [(str(i), "ems") for i in range(6)])
+
+        assert all(r["success"] for r in results)
+        assert attempts["3"] == 2
+        assert engine.get_stats()["rate_limited"] == 1
+        assert engine.concurrency.limit < 8
+
+    def test_token_bucket_limits_rate(self):
+        """令牌耗尽后按配置速率发放"""
+        async def run():
+            bucket = TokenBucket(20, burst=2)
+            start = time.monotonic()
+            for _ in range(6):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        # 前2个立即发放，其余4个按每秒20个发放，约0.2秒
+        assert asyncio.run(run()) >= 0.18
+
+    def test_shared_bucket_uses_redis_and_falls_back(self):
+        """令牌从Redis预留（所有进程共用），Redis出错时改用按进程数均分速率的本地令牌桶"""
+        calls = []
+
+        class FakeRedis:
+            fail = False
+
+            def eval(self, script, numkeys, key, *args):
+                if self.fail:
+                    raise ConnectionError("redis down")
+                calls.append((script, key, args))
+                return "0.25" if script == RESERVE_SCRIPT else 1
+
+        bucket = RedisTokenBucket(20, burst=4, redis_url="redis://unused", processes=4)
+        bucket._redis = FakeRedis()
+
+        assert bucket._reserve() == 0.25
+        bucket.pause(1.5)
+        assert [(script, key) for script, key, _ in calls] == [
+            (RESERVE_SCRIPT, "rate_limit:kuaidi100"), (PAUSE_SCRIPT, "rate_limit:kuaidi100")
+        ]
+
+        # Redis不可用期间：每个进程每秒5个、桶容量1，限流暂停同样生效
+        bucket._redis.fail = True
+        assert bucket._local.rate == 5 and bucket._local.capacity == 1
+        assert 1.4 < bucket._reserve() <= 1.5
+        assert len(calls) == 2
+
+    def test_tokens_spent_only_on_upstream_fetch(self, monkeypatch):
+        """缓存命中和合并的请求不消耗令牌，只有实际请求快递100时取令牌"""
+        from app.services import express_tracking
+        from app.services.tracking_cache import TrackingCache
+        from app.services.tracking_singleflight import SingleFlight
+
+        acquired, upstream = [], []
+
+        async def acquire():
+            acquired.append(1)
+
+        async def aquery(tracking_number, company_code):
+            upstream.append(tracking_number)
+            await asyncio.sleep(0.01)
+            return {"status": "200", "state": "0", "data": []}
+
+        monkeypatch.setattr(express_tracking.batch_query_engine.bucket, "acquire", acquire)
+        service = express_tracking.ExpressTrackingService(None)
+        service.cache = TrackingCache()
+        service.singleflight = SingleFlight(service.cache, lease=2)
+        monkeypatch.setattr(service.client, "aquery", aquery)
+        service.cache.set("1151242358360", "ems", {"status": "200", "state": "3", "data": []})
+
+        results = asyncio.run(service.aquery_many([
+            ("1151242358360", "ems"), ("1151242358361", "ems"), ("1151242358361", "ems")
+        ]))
+
+        assert all(r["success"] for r in results)
+        assert results[0]["from_cache"] is True
+        assert upstream == ["1151242358361"]
+        assert len(acquired) == 1
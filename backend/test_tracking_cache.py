@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+物流查询缓存单元测试
+验证按状态区分有效期、批量读写、磁盘级回填和命中统计（Redis使用内存替身）
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.tracking_cache import TrackingCache
+
+SIGNED = {"status": "200", "state": "3", "data": [{"time": "2024-01-01 10:00:00", "context": "已签收"}]}
+IN_TRANSIT = {"status": "200", "state": "0", "data": []}
+
+
+class FakeRedis:
+    """只支持缓存读写所用命令的内存Redis（值为 (内容, 有效期)）"""
+
+    def __init__(self):
+        self.values = {}
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def mget(self, keys):
+        self.commands.append(lambda: [self.redis.values.get(key, (None, None))[0] for key in keys])
+
+    def ttl(self, key):
+        self.commands.append(lambda: self.redis.values.get(key, (None, -2))[1])
+
+    def set(self, key, value, ex=None):
+        self.commands.append(lambda: self.redis.values.__setitem__(key, (value, ex)))
+
+    def execute(self):
+        return [command() for command in self.commands]
+
+
+class TestTrackingCache:
+    """物流缓存测试类"""
+
+    def test_ttl_depends_on_state(self):
+        """终态长期缓存，在途短期缓存"""
+        cache = TrackingCache(final_ttl=3600, transit_ttl=60)
+        assert cache.ttl_for(SIGNED) == 3600
+        assert cache.ttl_for({"state": "4"}) == 3600
+        assert cache.ttl_for(IN_TRANSIT) == 60
+
+    def test_transit_entry_expires(self):
+        """在途状态过期后不再命中"""
+        cache = TrackingCache(final_ttl=3600, transit_ttl=0.05)
+        cache.set("1151242358360", "ems", IN_TRANSIT)
+        cache.set("1151242358361", "ems", SIGNED)
+        time.sleep(0.1)
+
+        assert cache.get("1151242358360", "ems") is None
+        assert cache.get("1151242358361", "ems")["state"] == "3"
+
+    def test_bulk_get_and_stats(self):
+        """批量读取只返回命中项，命中率按查询条数统计"""
+        cache = TrackingCache()
+        cache.set_many({("A1", "ems"): SIGNED, ("A2", "ems"): IN_TRANSIT})
+
+        found = cache.get_many([("A1", "ems"), ("A2", "ems"), ("A3", "ems")])
+        assert set(found) == {("A1", "ems"), ("A2", "ems")}
+
+        stats = cache.get_stats()
+        assert stats["memory_hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == round(2 / 3, 4)
+
+    def test_disk_tier_backfills_memory(self, tmp_path):
+        """磁盘级命中后回填进程内缓存"""
+        TrackingCache(disk_dir=str(tmp_path)).set("B1", "ems", SIGNED)
+
+        cache = TrackingCache(disk_dir=str(tmp_path))
+        assert cache.get("B1", "ems")["state"] == "3"
+        assert cache.get("B1", "ems")["state"] == "3"
+
+        stats = cache.get_stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 1
+
+    def test_disk_hit_backfills_redis_with_remaining_ttl(self, tmp_path):
+        """磁盘级命中后按剩余有效期回填Redis，其他进程可直接从Redis命中"""
+        TrackingCache(disk_dir=str(tmp_path), final_ttl=3600).set("B2", "ems", SIGNED)
+        time.sleep(1.1)
+
+        redis = FakeRedis()
+        cache = TrackingCache(backend="redis", disk_dir=str(tmp_path))
+        cache._redis = redis
+        assert cache.get("B2", "ems")["state"] == "3"
+
+        value, ttl = redis.values["tracking_cache:ems:B2"]
+        assert json.loads(value)["state"] == "3"
+        assert 3590 < ttl < 3600
+
+        other = TrackingCache(backend="redis")
+        other._redis = redis
+        assert other.get("B2", "ems")["state"] == "3"
+        assert other.get_stats()["redis_hits"] == 1
+
+    def test_delete_all_companies(self, tmp_path):
+        """未指定快递公司时删除该单号所有缓存"""
+        cache = TrackingCache(disk_dir=str(tmp_path))
+        cache.set_many({("C1", "ems"): SIGNED, ("C1", "sf"): SIGNED, ("C2", "ems"): SIGNED})
+
+        assert cache.delete("C1") == 2
+        assert cache.get("C1", "sf") is None
+        assert cache.get("C2", "ems") is not None
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+物流轨迹增量存储单元测试
+验证轨迹未变化时跳过写入、只追加新轨迹、读取时还原完整轨迹（SQLite内存数据库）
+"""
+
+import os
+import sys
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import Task, TrackingEvent
+from app.models.base import Base
+from app.models.task import TaskStatusEnum
+from app.services.tracking_events import TrackingEventService
+from app.tasks.tracking_tasks import update_single_task_tracking
+
+TRACKING_NUMBER = "1151242358360"
+
+COLLECTED = {"time": "2024-01-01 10:00:00", "context": "已揽收", "status": "揽收"}
+IN_TRANSIT = {"time": "2024-01-01 20:00:00", "context": "离开处理中心", "status": "在途"}
+DELIVERING = {"time": "2024-01-02 08:00:00", "context": "正在派件", "status": "派件"}
+
+
+def _result(traces, state="0"):
+    return {
+        "success": True,
+        "tracking_number": TRACKING_NUMBER,
+        "company_code": "ems",
+        "current_status": {"0": "在途", "5": "派件"}[state],
+        "is_signed": False,
+        "sign_time": "",
+        "last_update": "2024-01-02T09:00:00",
+        "traces": traces,
+        "raw_data": {"state": state, "data": traces}
+    }
+
+
+def _session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+class TestTrackingEvents:
+    """物流轨迹增量存储测试类"""
+
+    def test_unchanged_traces_skip_write(self):
+        """轨迹和状态都未变化时不写入，有新轨迹时只追加新事件"""
+        db = _session()
+        task = Task(task_id="T1", tracking_number=TRACKING_NUMBER, status=TaskStatusEnum.TRACKING)
+        db.add(task)
+        db.commit()
+
+        result = update_single_task_tracking(db, None, task, _result([IN_TRANSIT, COLLECTED]))
+        db.commit()
+        assert result["changed"]
+        assert "raw_data" not in task.tracking_data and "traces" not in task.tracking_data
+        assert task.tracking_data["traces_count"] == 2
+        assert db.query(TrackingEvent).count() == 2
+
+        updated_at = task.updated_at
+        result = update_single_task_tracking(db, None, task, _result([IN_TRANSIT, COLLECTED]))
+        assert not result["changed"]
+        assert not inspect(task).attrs.tracking_data.history.has_changes()
+        assert task.updated_at == updated_at
+        db.commit()
+
+        result = update_single_task_tracking(db, None, task, _result([DELIVERING, IN_TRANSIT, COLLECTED], state="5"))
+        db.commit()
+        assert result["changed"]
+        assert task.delivery_status == "派件"
+        assert db.query(TrackingEvent).count() == 3
+        db.close()
+
+    def test_expand_restores_traces(self):
+        """读取摘要时按时间倒序还原轨迹，旧版完整数据原样返回"""
+        db = _session()
+        service = TrackingEventService(db)
+        summary = service.record(_result([DELIVERING, IN_TRANSIT, COLLECTED], state="5"))
+        db.commit()
+
+        expanded = service.expand(summary)
+        assert expanded["traces"] == [DELIVERING, IN_TRANSIT, COLLECTED]
+        assert "traces" not in summary
+
+        legacy = _result([COLLECTED])
+        assert service.expand(legacy) is legacy
+        db.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+物流刷新调度单元测试
+验证按物流阶段计算查询间隔、停滞退避，以及定时任务只取到期任务（SQLite内存数据库）
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import Task
+from app.models.base import Base
+from app.models.task import TaskStatusEnum
+from app.services.tracking_scheduler import compute_next_check
+from app.tasks.tracking_tasks import get_pending_tracking_tasks
+
+NOW = datetime(2024, 1, 10, 12, 0, 0)
+
+
+def _result(state: str, last_event: datetime = None, signed: bool = False) -> dict:
+    traces = [{"time": last_event.strftime("%Y-%m-%d %H:%M:%S"), "context": "..."}] if last_event else []
+    return {"success": True, "is_signed": signed, "traces": traces, "raw_data": {"state": state}}
+
+
+def _hours_until(task: Task, result: dict, latency: float = 72) -> float:
+    return (compute_next_check(task, result, latency, NOW) - NOW).total_seconds() / 3600
+
+
+class TestTrackingScheduler:
+    """物流刷新调度测试类"""
+
+    def test_interval_by_phase(self):
+        """派件中短间隔，刚揽收和远未到期的在途包裹长间隔"""
+        task = Task(task_id="T1", created_at=NOW - timedelta(hours=2))
+        recent = NOW - timedelta(hours=1)
+
+        delivering = _hours_until(task, _result("5", recent))
+        collected = _hours_until(task, _result("1", recent))
+        in_transit = _hours_until(task, _result("0", recent))
+
+        assert delivering < 1
+        assert collected > delivering
+        assert in_transit > collected
+
+    def test_due_soon_checks_more_often(self):
+        """在途时长接近典型签收耗时后加密查询"""
+        young = Task(task_id="T1", created_at=NOW - timedelta(hours=5))
+        old = Task(task_id="T1", created_at=NOW - timedelta(hours=60))
+        recent = NOW - timedelta(hours=1)
+
+        assert _hours_until(old, _result("0", recent)) < _hours_until(young, _result("0", recent))
+
+    def test_stale_parcel_backs_off(self):
+        """长时间没有新物流记录的包裹降低查询频率，签收后不再安排"""
+        task = Task(task_id="T1", created_at=NOW - timedelta(hours=10))
+
+        fresh = _hours_until(task, _result("1", NOW - timedelta(hours=1)))
+        stale = _hours_until(task, _result("1", NOW - timedelta(days=3)))
+        assert stale > fresh
+        assert compute_next_check(task, _result("3", NOW, signed=True), 72, NOW) is None
+
+    def test_only_due_rows_are_picked(self):
+        """定时任务只取已到期的跟踪任务，未安排时间的任务立即到期"""
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+
+        now = datetime.now()
+        db.add_all([
+            Task(task_id="due", tracking_number="A1", status=TaskStatusEnum.TRACKING,
+                 next_check_at=now - timedelta(minutes=1)),
+            Task(task_id="later", tracking_number="A2", status=TaskStatusEnum.TRACKING,
+                 next_check_at=now + timedelta(hours=3)),
+            Task(task_id="new", tracking_number="A3", status=TaskStatusEnum.TRACKING),
+            Task(task_id="signed", tracking_number="A4", status=TaskStatusEnum.DELIVERED),
+        ])
+        db.commit()
+
+        picked = {task.task_id for task in get_pending_tracking_tasks(db)}
+        assert picked == {"due", "new"}
+        db.close()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+物流轨迹截图单元测试
+验证HTML直接写入浏览器池页面、按容器区域截图，只写入最终文件，轨迹未变化时复用截图，
+以及批量截图按浏览器池大小分组渲染（浏览器使用替身）
+"""
+
+import base64
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.services import tracking_screenshot
+from app.services.screenshot_cache import ScreenshotCache
+from app.services.tracking_screenshot import TrackingScreenshotService
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\nfake"
+
+
+class FakeDriver:
+    """记录CDP命令的WebDriver替身"""
+
+    def __init__(self):
+        self.commands = []
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append((command, params))
+        if command == "Page.getFrameTree":
+            return {"frameTree": {"frame": {"id": "main-frame"}}}
+        if command == "Page.captureScreenshot":
+            return {"data": base64.b64encode(PNG_BYTES).decode()}
+        return {}
+
+    def execute_script(self, script):
+        return {"x": 140, "y": 40, "width": 1000, "height": 320}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    return TrackingScreenshotService(None)
+
+
+def _use_browser(monkeypatch, driver=None, available=True):
+    """替换浏览器池，返回每次借出时声明的渲染次数"""
+    checkouts = []
+    monkeypatch.setattr(tracking_screenshot.browser_pool, "check_chrome",
+                        lambda check: {"available": available, "error": "未找到Chrome浏览器"})
+
+    @contextmanager
+    def browser(check, renders=1):
+        checkouts.append(renders)
+        yield driver or FakeDriver()
+
+    monkeypatch.setattr(tracking_screenshot.browser_pool, "browser", browser)
+    return checkouts
+
+
+def _tracking(number, status="运输中"):
+    return {"tracking_number": number, "current_status": status, "sign_time": "",
+            "traces": [{"time": "2024-01-02 10:00:00", "context": status}]}
+
+
+class TestTrackingScreenshot:
+    """物流轨迹截图测试类"""
+
+    def test_renders_in_memory_and_clips_container(self, service, tmp_path, monkeypatch):
+        """HTML通过CDP写入页面，截图裁剪到容器区域，只写入最终PNG"""
+        driver = FakeDriver()
+        _use_browser(monkeypatch, driver)
+        html = service._render_html("1151242358360", "已签收", "2024-01-02 10:00:00",
+                                    [{"time": "2024-01-02 10:00:00", "context": "已签收"}])
+        output_path = tmp_path / "tracking_screenshots" / "out.png"
+
+        result = service._html_to_png(html, str(output_path), "1151242358360")
+
+        assert result["success"] and result["method"] == "chrome_screenshot"
+        assert output_path.read_bytes() == PNG_BYTES
+        commands = dict(driver.commands)
+        assert commands["Page.setDocumentContent"] == {"frameId": "main-frame", "html": html}
+        assert commands["Page.captureScreenshot"]["clip"] == {"x": 140, "y": 40, "width": 1000, "height": 320, "scale": 1}
+        assert list(tmp_path.glob("tracking_html/*")) == []
+
+    def test_fallback_writes_final_html_only(self, service, tmp_path, monkeypatch):
+        """Chrome不可用时直接把HTML写入 tracking_html 目录"""
+        _use_browser(monkeypatch, available=False)
+        html = service._render_html("1151242358360", "运输中", "", [])
+
+        result = service._html_to_png(html, str(tmp_path / "out.png"), "1151242358360")
+
+        assert result["success"] and result["method"] == "html_fallback"
+        files = list(tmp_path.glob("tracking_html/*.html"))
+        assert len(files) == 1
+        assert files[0].read_text(encoding="utf-8") == html
+        assert not (tmp_path / "out.png").exists()
+
+    def test_pillow_method_skips_browser(self, service, tmp_path, monkeypatch):
+        """screenshot_method=pillow 或Chrome不可用时直接绘制PNG，不生成HTML"""
+        _use_browser(monkeypatch, available=False)
+        output_path = tmp_path / "out.png"
+
+        result = service._render_screenshot("1151242358360", "运输中", "", [], str(output_path))
+
+        assert result["success"] and result["method"] == "pillow"
+        assert output_path.read_bytes().startswith(b"\x89PNG")
+        assert list(tmp_path.glob("tracking_html/*")) == []
+
+    def test_unchanged_traces_reuse_render(self, service, monkeypatch):
+        """单号、状态和轨迹都未变化时复用已有截图，轨迹变化后重新生成"""
+        _use_browser(monkeypatch, available=False)
+        renders = []
+        render_png = tracking_screenshot.timeline_renderer.render_png
+        monkeypatch.setattr(tracking_screenshot.timeline_renderer, "render_png",
+                            lambda *args: renders.append(args) or render_png(*args))
+        traces = [{"time": "2024-01-02 10:00:00", "context": "运输中"}]
+
+        first = service._render_cached("1151242358360", "运输中", "", traces)
+        second = service._render_cached("1151242358360", "运输中", "", traces)
+        changed = service._render_cached("1151242358360", "已签收", "2024-01-03 10:00:00",
+                                         [{"time": "2024-01-03 10:00:00", "context": "已签收"}] + traces)
+
+        assert len(renders) == 2
+        assert second["method"] == "cache"
+        assert second["screenshot_path"] == first["screenshot_path"]
+        assert changed["screenshot_path"] != first["screenshot_path"]
+        assert not list(service.screenshot_dir.glob(".*.tmp"))
+
+    def test_cleanup_keeps_recent_and_referenced(self, tmp_path):
+        """按最近使用时间清理，超出数量的截图中被引用的保留"""
+        cache = ScreenshotCache(tmp_path, max_items=1)
+        for index, name in enumerate(["tracking_A_old.png", "tracking_B_ref.png", "tracking_C_new.png"]):
+            path = tmp_path / name
+            path.write_bytes(PNG_BYTES)
+            os.utime(path, (1000 + index, 1000 + index))
+        cache.lookup("tracking_A_old.png")  # 命中后变为最近使用
+
+        stats = cache.cleanup(referenced=["uploads/tracking_screenshots/tracking_B_ref.png"])
+
+        assert sorted(path.name for path in tmp_path.glob("*.png")) == ["tracking_A_old.png", "tracking_B_ref.png"]
+        assert stats["removed"] == 1 and stats["kept_referenced"] == 1
+
+    def test_batch_render_groups_by_pool_size(self, service, monkeypatch):
+        """批量截图按浏览器池大小分组，每组只借出一次浏览器，结果顺序与输入一致"""
+        checkouts = _use_browser(monkeypatch)
+        monkeypatch.setattr(tracking_screenshot.browser_pool, "max_size", 2)
+        items = [_tracking(f"11512423583{index:02d}") for index in range(5)]
+
+        results = service.batch_render(items, "chrome")
+
+        assert sorted(checkouts) == [2, 3]
+        assert [result["method"] for result in results] == ["chrome_screenshot"] * 5
+        assert [os.path.basename(result["screenshot_path"]).split("_")[1] for result in results] == \
+            [item["tracking_number"] for item in items]
+        assert all(result["render_seconds"] >= 0 for result in results)
+
+        # 再次批量生成时全部复用，不再借出浏览器
+        again = service.batch_render(items, "chrome")
+        assert len(checkouts) == 2
+        assert [result["method"] for result in again] == ["cache"] * 5
+
+    def test_batch_render_falls_back_after_session_failure(self, service, monkeypatch):
+        """浏览器会话中途出错时，剩余单号改走单张截图流程"""
+        _use_browser(monkeypatch)
+        monkeypatch.setattr(tracking_screenshot.browser_pool, "max_size", 1)
+        calls = []
+        capture = TrackingScreenshotService._capture_png
+
+        def flaky_capture(driver, html_content):
+            calls.append(html_content)
+            if len(calls) == 2:
+                raise RuntimeError("chrome not reachable")
+            return capture(driver, html_content)
+
+        monkeypatch.setattr(service, "_capture_png", flaky_capture)
+        monkeypatch.setattr(service, "_render_png", lambda html_content: PNG_BYTES)
+        items = [_tracking(f"11512423583{index:02d}") for index in range(3)]
+
+        results = service.batch_render(items, "chrome")
+
+        assert all(result["success"] for result in results)
+        assert [result["method"] for result in results] == ["chrome_screenshot"] * 3
+        assert len(calls) == 2
+
+    def test_batch_task_splits_into_chunks(self, monkeypatch):
+        """批量截图任务对单号去重后按组派发子任务"""
+        from app.tasks import screenshot_tasks
+
+        dispatched = []
+
+        class FakeResult:
+            id = "task-id"
+
+        def delay(chunk, company_code, screenshot_method):
+            dispatched.append(chunk)
+            return FakeResult()
+
+        monkeypatch.setattr(screenshot_tasks.render_screenshot_chunk, "delay", delay)
+        numbers = [f"1151242358{index:03d}" for index in range(120)] + ["1151242358000", " "]
+
+        result = screenshot_tasks.batch_render_screenshots(numbers, chunk_size=50)
+
+        assert result["total"] == 120
+        assert [len(chunk) for chunk in dispatched] == [50, 50, 20]
+        assert [task["size"] for task in result["tasks"]] == [50, 50, 20]
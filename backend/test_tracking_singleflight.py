@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+物流查询请求合并单元测试
+验证同一单号的并发查询只发出一次上游请求（进程内线程/协程，及模拟的跨worker锁）
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.tracking_cache import TrackingCache
+from app.services.tracking_singleflight import SingleFlight
+
+KEY = ("1151242358360", "ems")
+
+
+class TestSingleFlight:
+    """请求合并测试类"""
+
+    def test_threads_share_one_upstream_call(self):
+        """多个线程同时查询同一单号，只请求一次上游"""
+        flight = SingleFlight(TrackingCache(), lease=2)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"success": True}
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: flight.do(KEY, fetch, lambda: None), range(8)))
+
+        assert len(calls) == 1
+        assert all(r == {"success": True} for r in results)
+        assert flight.get_stats()["coalesced_local"] == 7
+
+    def test_coroutines_share_one_upstream_call(self):
+        """同一事件循环中的并发协程只请求一次上游"""
+        flight = SingleFlight(TrackingCache(), lease=2)
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"success": True}
+
+        async def run():
+            return await asyncio.gather(*(flight.ado(KEY, fetch, lambda: None) for _ in range(5)))
+
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert len(results) == 5
+
+    def test_leader_rechecks_cache_without_redis(self):
+        """Redis不可用时，领头请求之后到达的调用方先读缓存，不重复请求上游"""
+        cache = TrackingCache()
+        flight = SingleFlight(cache, lease=2)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            cache.set(KEY[0], KEY[1], {"status": "200", "state": "0", "data": []})
+            return {"success": True}
+
+        async def afetch():
+            return fetch()
+
+        def load():
+            return cache.get(KEY[0], KEY[1], record_stats=False)
+
+        assert flight._acquire(KEY) == ""
+        assert flight.do(KEY, fetch, lambda: None) == {"success": True}
+        # 第一次读缓存未命中（如批量查询在令牌桶中等待）后才成为领头请求
+        assert flight.do(KEY, fetch, load)["state"] == "0"
+        assert asyncio.run(flight.ado(KEY, afetch, load))["state"] == "0"
+
+        assert len(calls) == 1
+        stats = flight.get_stats()
+        assert stats["upstream"] == 1
+        assert stats["coalesced_local"] == 2
+
+    def test_waits_for_other_worker(self):
+        """锁被其他worker持有时等待其写入缓存，不请求上游"""
+        cache = TrackingCache()
+        flight = SingleFlight(cache, lease=2, poll_interval=0.01)
+        other_worker_done = threading.Event()
+        flight._acquire = lambda key: None if not other_worker_done.is_set() else ""
+        flight._locked = lambda key: not other_worker_done.is_set()
+
+        def other_worker():
+            time.sleep(0.05)
+            cache.set(KEY[0], KEY[1], {"status": "200", "state": "0", "data": []})
+            other_worker_done.set()
+
+        threading.Thread(target=other_worker).start()
+        calls = []
+        result = flight.do(KEY, lambda: calls.append(1) or {"success": True},
+                           lambda: cache.get(KEY[0], KEY[1], record_stats=False))
+
+        assert calls == []
+        assert result["state"] == "0"
+        assert flight.get_stats()["coalesced_remote"] == 1
+
+    def test_async_path_does_not_block_event_loop(self):
+        """异步接口中的锁和缓存访问在线程中执行，慢速Redis不阻塞其他协程；租期不短于上游超时"""
+        flight = SingleFlight(TrackingCache(), lease=2)
+        flight._acquire = lambda key: time.sleep(0.1) or ""
+        ticks = []
+
+        async def fetch():
+            return {"success": True}
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def lookup():
+            await asyncio.sleep(0.015)
+            return await flight.ado(KEY, fetch, lambda: None)
+
+        async def run():
+            await asyncio.gather(ticker(), lookup())
+
+        asyncio.run(run())
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.08
+
+        from app.core.config import settings
+        assert SingleFlight.from_settings().lease > settings.KUAIDI100_CONNECT_TIMEOUT + settings.KUAIDI100_TIMEOUT
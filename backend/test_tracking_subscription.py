@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+快递100推送订阅单元测试
+本地启动一个替身推送服务器：接收订阅请求，并按快递100格式对回调接口发送签名推送
+（使用SQLite内存数据库，不访问快递100）
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.models import Task, TrackingEvent
+from app.models.base import Base
+from app.models.task import TaskStatusEnum
+from app.services.kuaidi100_client import Kuaidi100Client
+from app.services.tracking_cache import tracking_cache
+from app.services.tracking_subscription import TrackingSubscriptionService, needs_polling, sign_callback
+from app.api.api_v1.endpoints import tracking
+
+SALT = "test-salt"
+TRACKING_NUMBER = "1151242358360"
+
+
+class PushServerStandIn:
+    """快递100推送服务替身：记录订阅，并向回调接口发送签名推送"""
+
+    def __init__(self):
+        self.subscriptions = []
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+                form = {k: v[0] for k, v in parse_qs(body).items()}
+                standin.subscriptions.append(json.loads(form["param"]))
+                reply = json.dumps({"result": True, "returnCode": "200", "message": "提交成功"}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/poll"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def push(self, client: TestClient, subscription: dict, state: str, status: str = "polling", salt: str = SALT):
+        """按订阅的回调地址推送一次物流更新"""
+        data = [{"time": "2024-01-02 09:30:00", "context": "已签收，签收人：本人" if state == "3" else "运输中"}]
+        param = json.dumps({
+            "status": status,
+            "message": "",
+            "lastResult": {"message": "ok", "state": state, "status": "200", "ischeck": "1" if state == "3" else "0",
+                           "com": subscription["company"], "nu": subscription["number"], "data": data}
+        }, ensure_ascii=False)
+        callback_path = subscription["parameters"]["callbackurl"].split("://", 1)[1].split("/", 1)[1]
+        return client.post("/" + callback_path, data={"param": param, "sign": sign_callback(param, salt)})
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def env(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    # 与 SessionLocal 一致关闭autoflush
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    monkeypatch.setattr(settings, "KUAIDI100_PUSH_ENABLED", True)
+    monkeypatch.setattr(settings, "KUAIDI100_CALLBACK_URL", "http://testserver/api/v1/tracking/kuaidi100/callback")
+    monkeypatch.setattr(settings, "KUAIDI100_PUSH_SALT", SALT)
+
+    dispatched = []
+
+    async def fake_dispatch(stage, task_id):
+        dispatched.append((stage.value, task_id))
+
+    monkeypatch.setattr(tracking.pipeline_engine, "dispatch", fake_dispatch)
+
+    app = FastAPI()
+    app.include_router(tracking.router, prefix="/api/v1/tracking")
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    standin = PushServerStandIn()
+    tracking_cache.clear()
+    yield Session, TestClient(app), standin, dispatched
+    standin.close()
+
+
+class TestTrackingSubscription:
+    """推送订阅测试类"""
+
+    def _subscribe(self, Session, standin):
+        db = Session()
+        task = Task(task_id="T1", tracking_number=TRACKING_NUMBER, status=TaskStatusEnum.TRACKING)
+        db.add(task)
+        db.commit()
+
+        service = TrackingSubscriptionService(db)
+        service.express_service.client = Kuaidi100Client("key", "customer", subscribe_url=standin.url)
+        result = service.subscribe_task(task)
+        return db, task, result
+
+    def test_subscribe_registers_callback(self, env):
+        """订阅请求带回调地址和盐值，订阅后跳过轮询"""
+        Session, client, standin, _ = env
+        db, task, result = self._subscribe(Session, standin)
+
+        assert result["success"]
+        subscription = standin.subscriptions[0]
+        assert subscription["number"] == TRACKING_NUMBER
+        assert subscription["parameters"]["salt"] == SALT
+        assert subscription["parameters"]["callbackurl"] == settings.KUAIDI100_CALLBACK_URL
+        assert not needs_polling(task)
+
+    def test_push_updates_task_state(self, env):
+        """在途推送更新物流状态，签收推送将任务转为已签收并进入文档生成"""
+        Session, client, standin, dispatched = env
+        db, task, _ = self._subscribe(Session, standin)
+        subscription = standin.subscriptions[0]
+
+        response = standin.push(client, subscription, state="0")
+        assert response.status_code == 200
+        assert response.json()["result"] is True
+        db.refresh(task)
+        assert task.status == TaskStatusEnum.TRACKING
+        assert task.delivery_status == "在途"
+
+        response = standin.push(client, subscription, state="3", status="shutdown")
+        assert response.status_code == 200
+        db.refresh(task)
+        assert task.status == TaskStatusEnum.DELIVERED
+        assert task.delivery_time is not None
+        assert dispatched == [("render", "T1")]
+        assert tracking_cache.get(TRACKING_NUMBER, "ems")["state"] == "3"
+
+    def test_push_updates_tasks_sharing_waybill(self, env):
+        """两个任务使用同一单号时，一次推送更新两个任务，轨迹事件只写入一份"""
+        Session, client, standin, _ = env
+        db, task, _ = self._subscribe(Session, standin)
+        other = Task(task_id="T2", tracking_number=TRACKING_NUMBER, status=TaskStatusEnum.TRACKING)
+        db.add(other)
+        db.commit()
+
+        response = standin.push(client, standin.subscriptions[0], state="0")
+        assert response.status_code == 200
+        assert response.json()["result"] is True
+        db.refresh(task)
+        db.refresh(other)
+        assert task.delivery_status == other.delivery_status == "在途"
+        assert db.query(TrackingEvent).filter(TrackingEvent.tracking_number == TRACKING_NUMBER).count() == 1
+
+    def test_callback_handled_off_event_loop(self, env, monkeypatch):
+        """推送回调的同步处理（签名校验、数据库写入）在线程中执行，不占用事件循环"""
+        Session, client, standin, _ = env
+        db, task, _ = self._subscribe(Session, standin)
+        on_loop = []
+        handle_callback = TrackingSubscriptionService.handle_callback
+
+        def record(self, *args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return handle_callback(self, *args, **kwargs)
+
+        monkeypatch.setattr(TrackingSubscriptionService, "handle_callback", record)
+        response = standin.push(client, standin.subscriptions[0], state="0")
+
+        assert response.status_code == 200
+        assert on_loop == [False]
+        db.refresh(task)
+        assert task.delivery_status == "在途"
+
+    def test_rejects_bad_signature(self, env):
+        """签名错误的推送被拒绝，任务不变"""
+        Session, client, standin, _ = env
+        db, task, _ = self._subscribe(Session, standin)
+
+        response = standin.push(client, standin.subscriptions[0], state="3", salt="wrong")
+        assert response.status_code == 403
+        db.refresh(task)
+        assert task.status == TaskStatusEnum.TRACKING
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+定时物流更新流水线单元测试
+验证按ID分段扫描、分段批量写入与提交、分段耗时统计、查询线程中限速识别快递公司（SQLite内存数据库，物流查询使用替身）
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.models import Task, TrackingEvent
+from app.models.base import Base
+from app.models.task import TaskStatusEnum
+from app.services.carrier_resolver import carrier_resolver
+from app.services.express_tracking import ExpressTrackingService
+from app.services.kuaidi100_client import Kuaidi100Client
+from app.services.tracking_batch import batch_query_engine
+from app.tasks import tracking_tasks
+
+
+def _result(tracking_number, company_code):
+    signed = tracking_number.endswith("0")
+    traces = [{"time": "2024-01-02 08:00:00", "context": "已签收" if signed else "运输中"}]
+    return {
+        "success": not tracking_number.endswith("9"),
+        "error": "快递100查询失败",
+        "tracking_number": tracking_number,
+        "company_code": company_code,
+        "current_status": "已签收" if signed else "在途",
+        "is_signed": signed,
+        "sign_time": traces[0]["time"] if signed else "",
+        "traces": traces,
+        "raw_data": {"state": "3" if signed else "0"}
+    }
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    queried = []
+    detected = []
+
+    async def fake_aquery_many(self, items):
+        queried.append(list(items))
+        return [_result(number, company) for number, company in items]
+
+    async def fake_aautonumber(self, number):
+        detected.append(number)
+        return ["shunfeng"]
+
+    def sync_autonumber(self, number):
+        raise AssertionError("定时更新不应在扫描线程中同步调用智能单号识别")
+
+    monkeypatch.setattr(tracking_tasks, "SessionLocal", Session)
+    monkeypatch.setattr(ExpressTrackingService, "aquery_many", fake_aquery_many)
+    monkeypatch.setattr(Kuaidi100Client, "aautonumber", fake_aautonumber)
+    monkeypatch.setattr(Kuaidi100Client, "autonumber", sync_autonumber)
+    monkeypatch.setattr(settings, "TRACKING_SWEEP_CHUNK_SIZE", 3)
+    carrier_resolver.clear()
+    yield Session, queried, detected
+    carrier_resolver.clear()
+
+
+class TestTrackingSweep:
+    """定时物流更新流水线测试类"""
+
+    def test_chunks_are_written_and_timed(self, sweep):
+        """到期任务按ID分段查询和写入，每段报告耗时，未到期任务不处理"""
+        Session, queried, _ = sweep
+        db = Session()
+        now = datetime.now()
+        db.add_all([
+            Task(task_id=f"T{i}", tracking_number=f"SF{i}", status=TaskStatusEnum.TRACKING,
+                 next_check_at=now - timedelta(minutes=1))
+            for i in range(1, 8)
+        ] + [Task(task_id="later", tracking_number="SF11", status=TaskStatusEnum.TRACKING,
+                  next_check_at=now + timedelta(hours=1))])
+        db.commit()
+
+        result = tracking_tasks.update_all_pending_tracking()
+        stats = result["stats"]
+
+        assert [len(items) for items in queried] == [3, 3, 1]
+        assert stats["total_checked"] == 7
+        assert stats["updated"] == 7
+        assert [chunk["size"] for chunk in stats["chunks"]] == [3, 3, 1]
+        assert all("fetch_seconds" in chunk and "write_seconds" in chunk for chunk in stats["chunks"])
+
+        db.expire_all()
+        tasks = {task.task_id: task for task in db.query(Task)}
+        assert tasks["T1"].delivery_status == "在途"
+        assert tasks["T1"].next_check_at > now
+        assert tasks["later"].delivery_status is None
+        assert db.query(TrackingEvent).count() == 7
+        db.close()
+
+    def test_failed_queries_are_rescheduled(self, sweep):
+        """查询失败的任务按重试间隔重新安排，签收任务转为已签收"""
+        Session, _, _ = sweep
+        db = Session()
+        now = datetime.now()
+        db.add_all([
+            Task(task_id="signed", tracking_number="SF10", status=TaskStatusEnum.TRACKING,
+                 next_check_at=now - timedelta(minutes=1)),
+            Task(task_id="failed", tracking_number="SF19", status=TaskStatusEnum.TRACKING,
+                 next_check_at=now - timedelta(minutes=1)),
+        ])
+        db.commit()
+
+        stats = tracking_tasks.update_all_pending_tracking()["stats"]
+        assert stats["completed"] == 1
+        assert stats["failed"] == 1
+
+        db.expire_all()
+        signed = db.query(Task).filter_by(task_id="signed").one()
+        failed = db.query(Task).filter_by(task_id="failed").one()
+        assert signed.status == TaskStatusEnum.DELIVERED
+        assert signed.delivery_time == datetime(2024, 1, 2, 8, 0, 0)
+        assert signed.next_check_at is None
+        assert failed.next_check_at > now
+        db.close()
+
+    def test_carrier_detected_in_prefetch_through_limiter(self, sweep, monkeypatch):
+        """本地无法确定快递公司的单号在查询线程中经令牌桶限速识别，同一单号只识别一次"""
+        Session, queried, detected = sweep
+        acquired = []
+
+        async def acquire():
+            acquired.append(1)
+
+        monkeypatch.setattr(batch_query_engine.bucket, "acquire", acquire)
+        db = Session()
+        now = datetime.now()
+        db.add_all([
+            Task(task_id=f"T{i}", tracking_number=number, status=TaskStatusEnum.TRACKING,
+                 next_check_at=now - timedelta(minutes=1))
+            for i, number in enumerate(["SF1", "SF2", "SF1", "1151242358360"])
+        ])
+        db.commit()
+
+        stats = tracking_tasks.update_all_pending_tracking()["stats"]
+
+        assert stats["updated"] == 4
+        assert sorted(detected) == ["SF1", "SF2"]
+        assert len(acquired) == 2
+        assert [company for _, company in queried[0]] == ["shunfeng", "shunfeng", "shunfeng"]
+        assert queried[1] == [("1151242358360", "ems")]
+        assert {event.company_code for event in db.query(TrackingEvent)} == {"shunfeng", "ems"}
+        db.close()